@@ -1,12 +1,18 @@
 from __future__ import annotations
 
 import asyncio
+import functools
 import hashlib
 import logging
 import time
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from typing import Optional
 
+try:
+    import uvloop
+except ImportError:  # pragma: no cover - uvloop 为可选依赖，缺失时使用标准事件循环
+    uvloop = None
 from telegram import Update
 from telegram.error import BadRequest
 from telegram.ext import (
@@ -21,73 +27,162 @@ from telegram.ext import (
 from ..commands import CommandType, parse_command
 from ..config import Config
 from ..codex_runner import CodexRunner
-from ..orchestrator import Orchestrator
+from ..orchestrator import Orchestrator, StreamSendFunc
 
 
 TELEGRAM_MESSAGE_LIMIT = 4096
 _DEDUP_TTL_SECONDS = 3600
 _DEDUP_MAX_ENTRIES = 256
+_DEDUP_DIGEST_SIZE = 16
+_EDIT_COALESCE_SECONDS = 1.0
+# 同一条指令（重试、重复发送）只解析一次；ParsedCommand 不可变，可安全共享
+_parse_command_cached = functools.lru_cache(maxsize=512)(parse_command)
+_HELP_TEXT = "\n".join(
+    [
+        "可用命令：",
+        "/new <内容> 提交新指令",
+        "/session 查看当前会话绑定（只读）",
+        "/stop 停止当前任务",
+        "/status 查看状态",
+        "/retry 重试上一次指令",
+        "/lastresult 查看最近一次结果",
+        "/whoami 查看用户 ID",
+        "/help 查看帮助",
+    ]
+)
+
+
+def new_event_loop() -> asyncio.AbstractEventLoop:
+    # 装了 uvloop 时用其 libuv 实现的事件循环，否则使用标准 asyncio
+    if uvloop is not None:
+        return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+def _new_dedupe_hasher(data: bytes = b"") -> hashlib._Hash:
+    # 去重摘要只存在内存中，无需密码学强度，使用更快的 BLAKE2b
+    return hashlib.blake2b(data, digest_size=_DEDUP_DIGEST_SIZE)
 
 
 @dataclass
 class _UserContext:
     last_prompt: Optional[str] = None
     chat_id: Optional[int] = None
-    stream_buffer: str = ""
-    dedupe_hashes: dict[str, float] = field(default_factory=dict)
-    pending_jsonl: list[str] = field(default_factory=list)
+    stream_hasher: hashlib._Hash = field(default_factory=_new_dedupe_hasher)
+    stream_has_data: bool = False
+    stream_blank_lines: int = 0
+    dedupe_hashes: OrderedDict[str, float] = field(default_factory=OrderedDict)
+    pending_jsonl: list[tuple[str, Optional[str]]] = field(default_factory=list)
+    sender: Optional[TelegramStreamSender] = None
+    # JSONL 进度单独一条消息，不与正在输出的回复共用锚点
+    progress_sender: Optional[TelegramStreamSender] = None
 
 
 class TelegramStreamSender:
-    def __init__(self, bot, chat_id: int, chunk_limit: int) -> None:
+    def __init__(
+        self,
+        bot,
+        chat_id: int,
+        chunk_limit: int,
+        edit_interval: float = _EDIT_COALESCE_SECONDS,
+    ) -> None:
         self._bot = bot
         self._chat_id = chat_id
         self._chunk_limit = max(1, min(chunk_limit, TELEGRAM_MESSAGE_LIMIT))
+        self._edit_interval = edit_interval
         self._message_id: Optional[int] = None
-        self._full_text = ""
+        self._parts: list[str] = []
+        self._length = 0
+        self._pending_since: Optional[float] = None
+        self._pending_length = 0
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._logger = logging.getLogger(__name__)
 
-    async def send(self, text: str, final: bool) -> None:
-        if not text:
-            return
-        if self._full_text:
-            next_text = f"{self._full_text}\n{text}"
-        else:
-            next_text = text
+    @property
+    def chat_id(self) -> int:
+        return self._chat_id
 
-        if len(next_text) > self._chunk_limit:
-            await self._send_new_message(text)
-            return
+    @property
+    def chunk_limit(self) -> int:
+        return self._chunk_limit
 
-        self._full_text = next_text
-        if self._message_id is None:
-            await self._send_new_message(self._full_text)
-            return
+    async def reset(self) -> None:
+        async with self._flush_lock:
+            await self._flush_pending_edit()
+            self._message_id = None
+            self._parts = []
+            self._length = 0
 
+    async def send(self, text: str, final: bool) -> None:
+        async with self._flush_lock:
+            if text:
+                next_length = self._length + len(text) + (1 if self._parts else 0)
+                if next_length > self._chunk_limit:
+                    await self._flush_pending_edit()
+                    await self._send_new_message(text)
+                    return
+
+                self._parts.append(text)
+                self._length = next_length
+                if self._message_id is None:
+                    await self._send_new_message("\n".join(self._parts))
+                    return
+                if self._pending_since is None:
+                    self._pending_since = time.monotonic()
+                self._pending_length += len(text)
+
+            if self._pending_since is None:
+                return
+            # 合并短时间内的多次追加，减少 edit_message_text 调用
+            if (
+                final
+                or self._pending_length > self._chunk_limit // 2
+                or time.monotonic() - self._pending_since >= self._edit_interval
+            ):
+                await self._flush_pending_edit()
+            elif self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        await asyncio.sleep(self._edit_interval)
+        async with self._flush_lock:
+            self._flush_task = None
+            try:
+                await self._flush_pending_edit()
+            except Exception as exc:
+                self._logger.warning("延迟编辑消息失败 chat_id=%s err=%s", self._chat_id, exc)
+
+    async def _flush_pending_edit(self) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._pending_since is None:
+            return
+        self._pending_since = None
+        self._pending_length = 0
+        full_text = "\n".join(self._parts)
         try:
             await self._bot.edit_message_text(
                 chat_id=self._chat_id,
                 message_id=self._message_id,
-                text=self._full_text,
+                text=full_text,
             )
         except BadRequest:
-            await self._send_new_message(self._full_text)
+            await self._send_new_message(full_text)
 
     async def _send_new_message(self, text: str) -> None:
         for chunk in self._split_text(text):
             message = await self._bot.send_message(chat_id=self._chat_id, text=chunk)
             self._message_id = message.message_id
-            self._full_text = chunk
+            self._parts = [chunk]
+            self._length = len(chunk)
 
     def _split_text(self, text: str) -> list[str]:
-        if len(text) <= self._chunk_limit:
+        step = self._chunk_limit
+        if len(text) <= step:
             return [text]
-        chunks = []
-        start = 0
-        while start < len(text):
-            end = min(start + self._chunk_limit, len(text))
-            chunks.append(text[start:end])
-            start = end
-        return chunks
+        return [text[start : start + step] for start in range(0, len(text), step)]
 
 
 class TelegramAdapter:
@@ -98,17 +193,20 @@ class TelegramAdapter:
         self._user_context: dict[int, _UserContext] = {}
         self._logger = logging.getLogger(__name__)
 
-    def _hash_text(self, text: str) -> str | None:
+    def _hash_text(self, text: str, normalized: Optional[str] = None) -> str | None:
         if not text:
             return None
-        normalized = CodexRunner.normalize_text_for_dedupe(text)
+        if normalized is None:
+            normalized = CodexRunner.normalize_text_for_dedupe(text)
         if not normalized:
             return None
-        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return _new_dedupe_hasher(normalized.encode("utf-8")).hexdigest()
 
     def _reset_dedupe(self, user_id: int) -> _UserContext:
         ctx = self._user_context.setdefault(user_id, _UserContext())
-        ctx.stream_buffer = ""
+        ctx.stream_hasher = _new_dedupe_hasher()
+        ctx.stream_has_data = False
+        ctx.stream_blank_lines = 0
         ctx.dedupe_hashes.clear()
         ctx.pending_jsonl.clear()
         return ctx
@@ -116,45 +214,73 @@ class TelegramAdapter:
     def _append_stream_buffer(self, ctx: _UserContext, text: str) -> None:
         if not text:
             return
-        if ctx.stream_buffer:
-            ctx.stream_buffer = f"{ctx.stream_buffer}\n{text}"
-        else:
-            ctx.stream_buffer = text
-
-    def _prune_dedupe(self, ctx: _UserContext) -> None:
-        if not ctx.dedupe_hashes:
-            return
-        now = time.time()
-        expired = [key for key, ts in ctx.dedupe_hashes.items() if now - ts > _DEDUP_TTL_SECONDS]
-        for key in expired:
-            ctx.dedupe_hashes.pop(key, None)
-        if len(ctx.dedupe_hashes) <= _DEDUP_MAX_ENTRIES:
+        # 逐段归一化后增量喂入哈希，结果与对整段拼接文本做归一化再哈希一致
+        normalized = CodexRunner.normalize_text_for_dedupe(text)
+        line_count = text.replace("\r\n", "\n").replace("\r", "\n").count("\n") + 1
+        if not normalized:
+            ctx.stream_blank_lines += line_count
             return
-        for key, _ in sorted(ctx.dedupe_hashes.items(), key=lambda item: item[1])[: len(ctx.dedupe_hashes) - _DEDUP_MAX_ENTRIES]:
-            ctx.dedupe_hashes.pop(key, None)
-
-    def _should_send(self, ctx: _UserContext, text: str) -> bool:
-        digest = self._hash_text(text)
+        separator = ctx.stream_blank_lines + (1 if ctx.stream_has_data else 0)
+        if separator:
+            ctx.stream_hasher.update(b"\n" * separator)
+        ctx.stream_hasher.update(normalized.encode("utf-8"))
+        ctx.stream_has_data = True
+        ctx.stream_blank_lines = line_count - (normalized.count("\n") + 1)
+
+    def _remember_digest(self, ctx: _UserContext, digest: str, now: float) -> None:
+        # 摘要按写入时间顺序排列，超出容量时直接淘汰最早的条目
+        ctx.dedupe_hashes[digest] = now
+        ctx.dedupe_hashes.move_to_end(digest)
+        while len(ctx.dedupe_hashes) > _DEDUP_MAX_ENTRIES:
+            ctx.dedupe_hashes.popitem(last=False)
+
+    def _should_send(
+        self, ctx: _UserContext, text: str, now: float, normalized: Optional[str] = None
+    ) -> bool:
+        digest = self._hash_text(text, normalized)
         if digest is None:
             return True
-        self._prune_dedupe(ctx)
-        if digest in ctx.dedupe_hashes:
+        seen_at = ctx.dedupe_hashes.get(digest)
+        if seen_at is not None and now - seen_at <= _DEDUP_TTL_SECONDS:
             return False
-        ctx.dedupe_hashes[digest] = time.time()
+        self._remember_digest(ctx, digest, now)
         return True
 
-    def _record_stream_digest(self, ctx: _UserContext) -> None:
-        digest = self._hash_text(ctx.stream_buffer)
-        if digest is None:
+    def _record_stream_digest(self, ctx: _UserContext, now: float) -> None:
+        if not ctx.stream_has_data:
             return
-        self._prune_dedupe(ctx)
-        ctx.dedupe_hashes[digest] = time.time()
+        digest = ctx.stream_hasher.copy().hexdigest()
+        self._remember_digest(ctx, digest, now)
+
+    async def _get_sender(
+        self, ctx: _UserContext, bot, chat_id: int, reset: bool, progress: bool = False
+    ) -> TelegramStreamSender:
+        # 每个用户复用同一个发送器；开始新的回复时清空锚点，另起一条消息
+        sender = ctx.progress_sender if progress else ctx.sender
+        if sender is None or sender.chat_id != chat_id:
+            sender = TelegramStreamSender(bot, chat_id, self._config.message_chunk_limit)
+            if progress:
+                ctx.progress_sender = sender
+            else:
+                ctx.sender = sender
+        elif reset:
+            await sender.reset()
+        return sender
+
+    def _run_stream(self, ctx: _UserContext, bot, chat_id: int) -> StreamSendFunc:
+        # 指令可能先排队：等这次运行真正输出第一段时才清空锚点，
+        # 否则会把仍在运行的上一条指令的输出切到新消息里
+        sender: Optional[TelegramStreamSender] = None
+
+        async def send(text: str, final: bool) -> None:
+            nonlocal sender
+            if sender is None:
+                sender = await self._get_sender(ctx, bot, chat_id, reset=True)
+            await sender.send(text, final)
 
-    def run(self) -> None:
-        try:
-            asyncio.get_running_loop()
-        except RuntimeError:
-            asyncio.set_event_loop(asyncio.new_event_loop())
+        return send
+
+    def _build_application(self) -> Application:
         application = ApplicationBuilder().token(self._config.telegram_bot_token).build()
         application.post_init = self._post_init
         application.add_handler(CommandHandler("help", self._handle_help))
@@ -168,9 +294,41 @@ class TelegramAdapter:
         application.add_handler(
             MessageHandler(filters.TEXT & ~filters.COMMAND, self._handle_text)
         )
+        return application
+
+    def run(self) -> None:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            asyncio.set_event_loop(new_event_loop())
+        application = self._build_application()
         self._logger.info("Telegram 适配器启动，进入 polling bot_id=%s", self._bot_id)
         application.run_polling(close_loop=False, stop_signals=None)
 
+    async def run_async(self) -> None:
+        # 与其他 bot 共享调用方的事件循环；启动顺序与 run_polling 一致，取消时依次停止
+        application = self._build_application()
+        try:
+            async with application:
+                await self._post_init(application)
+                await application.updater.start_polling()
+                await application.start()
+                self._logger.info(
+                    "Telegram 适配器启动，进入 polling bot_id=%s", self._bot_id
+                )
+                try:
+                    await asyncio.Event().wait()
+                finally:
+                    if application.updater.running:
+                        await application.updater.stop()
+                    if application.running:
+                        await application.stop()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # 单个 bot 启动/运行失败不影响其他 bot
+            self._logger.exception("Telegram 适配器异常退出 bot_id=%s", self._bot_id)
+
     async def _post_init(self, application: Application) -> None:
         if self._config.jsonl_sync_interval_seconds <= 0:
             return
@@ -189,17 +347,7 @@ class TelegramAdapter:
             return
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
-            text=(
-                "可用命令：\n"
-                "/new <内容> 提交新指令\n"
-                "/session 查看当前会话绑定（只读）\n"
-                "/stop 停止当前任务\n"
-                "/status 查看状态\n"
-                "/retry 重试上一次指令\n"
-                "/lastresult 查看最近一次结果\n"
-                "/whoami 查看用户 ID\n"
-                "/help 查看帮助"
-            ),
+            text=_HELP_TEXT,
         )
 
     async def _handle_whoami(
@@ -219,7 +367,7 @@ class TelegramAdapter:
         if not await self._authorized(update, context):
             return
         text = update.message.text
-        command = parse_command(text)
+        command = _parse_command_cached(text)
         payload = command.payload if command else None
         if not payload:
             await self._orchestrator.status(
@@ -258,6 +406,7 @@ class TelegramAdapter:
     ) -> None:
         if not await self._authorized(update, context):
             return
+        # 可能在运行中途调用，用独立的发送器，不动当前回复的锚点
         sender = TelegramStreamSender(
             context.bot, update.effective_chat.id, self._config.message_chunk_limit
         )
@@ -271,21 +420,19 @@ class TelegramAdapter:
         if not await self._authorized(update, context):
             return
         user_id = update.effective_user.id
-        last_prompt = self._user_context.get(user_id, _UserContext()).last_prompt
+        user_ctx = self._user_context.setdefault(user_id, _UserContext())
         await self._orchestrator.retry_last(
             user_id,
-            last_prompt,
+            user_ctx.last_prompt,
             lambda msg: context.bot.send_message(chat_id=update.effective_chat.id, text=msg),
-            TelegramStreamSender(
-                context.bot, update.effective_chat.id, self._config.message_chunk_limit
-            ).send,
+            self._run_stream(user_ctx, context.bot, update.effective_chat.id),
         )
 
     async def _handle_new(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         if not await self._authorized(update, context):
             return
         text = update.message.text
-        command = parse_command(text)
+        command = _parse_command_cached(text)
         payload = command.payload if command else None
         if not payload:
             await context.bot.send_message(
@@ -303,18 +450,18 @@ class TelegramAdapter:
         self, update: Update, context: ContextTypes.DEFAULT_TYPE, prompt: str
     ) -> None:
         user_id = update.effective_user.id
-        self._logger.info("收到消息 user_id=%s bot_id=%s", user_id, self._bot_id)
+        if self._logger.isEnabledFor(logging.INFO):
+            self._logger.info("收到消息 user_id=%s bot_id=%s", user_id, self._bot_id)
         user_ctx = self._reset_dedupe(user_id)
         user_ctx.last_prompt = prompt
-        sender = TelegramStreamSender(
-            context.bot, update.effective_chat.id, self._config.message_chunk_limit
-        )
+        send_run_stream = self._run_stream(user_ctx, context.bot, update.effective_chat.id)
+
         async def send_stream(text: str, final: bool) -> None:
             if text:
                 self._append_stream_buffer(user_ctx, text)
-            await sender.send(text, final)
+            await send_run_stream(text, final)
             if final:
-                self._record_stream_digest(user_ctx)
+                self._record_stream_digest(user_ctx, time.monotonic())
 
         await self._orchestrator.submit_prompt(
             user_id,
@@ -347,64 +494,104 @@ class TelegramAdapter:
         return True
 
     async def _sync_jsonl_tick(self, context: ContextTypes.DEFAULT_TYPE) -> None:
-        user_ids = (
-            self._config.telegram_allowed_user_ids
-            if self._config.telegram_allowed_user_ids
-            else set(self._user_context.keys())
-        )
-        for user_id in list(user_ids):
+        now = time.monotonic()
+        log_skipped = self._logger.isEnabledFor(logging.INFO)
+        # 循环内会 setdefault 修改 _user_context，因此这里只做一次元组快照
+        user_ids = tuple(self._config.telegram_allowed_user_ids or self._user_context)
+        running_by_user: dict[int, bool] = {}
+        for user_id in user_ids:
             user_ctx = self._user_context.setdefault(user_id, _UserContext())
             if user_ctx.chat_id is None:
-                user_ctx.chat_id = self._orchestrator.get_last_chat_id(user_id)
+                user_ctx.chat_id = await self._orchestrator.get_last_chat_id(user_id)
             if user_ctx.chat_id is None:
                 continue
             try:
-                running = await self._orchestrator.is_running(user_id)
-                messages = await self._orchestrator.poll_external_results(
-                    user_id, allow_send=not running
-                )
+                running_by_user[user_id] = await self._orchestrator.is_running(user_id)
             except Exception as exc:
                 self._logger.warning("JSONL 同步失败 user_id=%s err=%s", user_id, exc)
-                continue
+        if not running_by_user:
+            return
+        stream_events = self._config.jsonl_stream_events
+        # 一次批量轮询：共用 resume_id 的用户只读取一次 JSONL
+        try:
+            results = await self._orchestrator.poll_external_results_batch(list(running_by_user))
+        except Exception as exc:
+            self._logger.warning(
+                "JSONL 同步失败 user_ids=%s err=%s", list(running_by_user), exc
+            )
+            return
+        for user_id, running in running_by_user.items():
+            user_ctx = self._user_context[user_id]
+            messages = results.get(user_id, [])
             progress_messages = [msg for msg in messages if getattr(msg, "is_progress", False)]
             final_messages = [msg for msg in messages if not getattr(msg, "is_progress", False)]
 
-            def extract_text(msg: object) -> str:
-                return msg.text if hasattr(msg, "text") else str(msg)
+            def extract_text(msg: object) -> tuple[str, Optional[str]]:
+                if hasattr(msg, "text"):
+                    return msg.text, getattr(msg, "normalized", None)
+                return str(msg), None
 
             progress_texts = [extract_text(msg) for msg in progress_messages]
             final_texts = [extract_text(msg) for msg in final_messages]
             if running and progress_texts:
-                if not self._config.jsonl_stream_events:
-                    sender = TelegramStreamSender(
-                        context.bot, user_ctx.chat_id, self._config.message_chunk_limit
+                if not stream_events:
+                    sender = await self._get_sender(
+                        user_ctx, context.bot, user_ctx.chat_id, reset=False, progress=True
                     )
-                    for message in progress_texts:
-                        if not self._should_send(user_ctx, message):
-                            self._logger.info(
-                                "JSONL 去重：跳过重复进度 user_id=%s bot_id=%s",
-                                user_id,
-                                self._bot_id,
-                            )
+                    outgoing = []
+                    for message, normalized in progress_texts:
+                        if not self._should_send(user_ctx, message, now, normalized):
+                            if log_skipped:
+                                self._logger.info(
+                                    "JSONL 去重：跳过重复进度 user_id=%s bot_id=%s",
+                                    user_id,
+                                    self._bot_id,
+                                )
                             continue
-                        await sender.send(message, True)
+                        outgoing.append(message)
+                    await self._send_batched(sender, outgoing)
             if running:
                 if final_texts:
                     user_ctx.pending_jsonl.extend(final_texts)
                 continue
+            if user_ctx.progress_sender is not None:
+                # 运行结束：补发未提交的编辑后丢弃，下次运行的进度另起一条消息
+                await user_ctx.progress_sender.reset()
+                user_ctx.progress_sender = None
 
             pending = user_ctx.pending_jsonl
             if not final_texts and not pending:
                 continue
             user_ctx.pending_jsonl = []
-            sender = TelegramStreamSender(
-                context.bot, user_ctx.chat_id, self._config.message_chunk_limit
+            sender = await self._get_sender(
+                user_ctx, context.bot, user_ctx.chat_id, reset=True
             )
-            for message in pending + final_texts:
-                if not self._should_send(user_ctx, message):
-                    self._logger.info("JSONL 去重：跳过重复结果 user_id=%s bot_id=%s", user_id, self._bot_id)
+            outgoing = []
+            for message, normalized in pending + final_texts:
+                if not self._should_send(user_ctx, message, now, normalized):
+                    if log_skipped:
+                        self._logger.info(
+                            "JSONL 去重：跳过重复结果 user_id=%s bot_id=%s", user_id, self._bot_id
+                        )
                     continue
-                await sender.send(message, True)
+                outgoing.append(message)
+            await self._send_batched(sender, outgoing)
+
+    async def _send_batched(self, sender: TelegramStreamSender, messages: list[str]) -> None:
+        # 将相邻的小消息合并到 chunk_limit 以内再发送，减少 Telegram API 调用
+        batch: list[str] = []
+        batch_length = 0
+        for message in messages:
+            added = len(message) + (1 if batch else 0)
+            if batch and batch_length + added > sender.chunk_limit:
+                await sender.send("\n".join(batch), True)
+                batch = []
+                batch_length = 0
+                added = len(message)
+            batch.append(message)
+            batch_length += added
+        if batch:
+            await sender.send("\n".join(batch), True)
 
     async def _sync_jsonl_loop(self, application: Application) -> None:
         try:
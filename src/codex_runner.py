@@ -1,21 +1,97 @@
 import asyncio
-import hashlib
+import codecs
+import functools
 import json
 import logging
 import os
 import pty
+import re
 import tempfile
 import time
-from datetime import datetime, timezone
-from typing import Awaitable, Callable
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from operator import itemgetter
+from typing import Awaitable, BinaryIO, Callable, Iterator
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson 为可选依赖，缺失时使用标准 json
+    orjson = None
 
 from .config import Config
+from .file_watcher import FileWatcher
 
 
 OutputHandler = Callable[[str, bool], Awaitable[None]]
 StatusHandler = Callable[[str], Awaitable[None]]
 FinalHandler = Callable[[str], Awaitable[None]]
 
+_json_loads = orjson.loads if orjson is not None else json.loads
+_TAIL_BLOCK_SIZE = 64 * 1024
+_RUN_DEDUPE_MAX_ENTRIES = 4096
+_JSONL_READ_SIZE = 64 * 1024
+_STREAM_READ_SIZE = 64 * 1024
+
+_REASONING_TAGS: tuple[tuple[str, tuple[str, ...]], ...] = (
+    ("制定计划", ("plan", "规划", "计划")),
+    ("分析需求", ("analyze", "analysis", "评估", "分析")),
+    ("检查配置", ("config", "配置", "env", "环境")),
+    ("排查问题", ("error", "fail", "失败", "问题")),
+    ("执行测试", ("test", "pytest", "playwright", "测试")),
+    ("部署/服务操作", ("deploy", "systemctl", "service", "服务")),
+    ("重构整理", ("refactor", "重构")),
+    ("更新文档", ("readme", "doc", "文档")),
+    ("验证结果", ("verify", "验证")),
+    ("整理最终回复", ("final", "summary", "最终", "总结")),
+    ("检查数据与日志", ("sqlite", "db", "数据库", "jsonl")),
+)
+_REASONING_KEYWORD_TAGS = {
+    keyword: tag for tag, keywords in _REASONING_TAGS for keyword in keywords
+}
+_FAST_TS_RE = re.compile(
+    r"(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})(?:\.(\d{1,6}))?Z\Z", re.ASCII
+)
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# 忽略大小写直接搜索，避免每行先 lower() 复制一份
+_CONTEXT_COMPACTED_RE = re.compile("context compacted", re.IGNORECASE)
+_LINE_TRAILING_WS_RE = re.compile(r"[^\S\n]+(?=\n|\Z)")
+# 零宽前瞻让每个位置都尝试匹配，重叠的关键词也能命中，与逐个 in 判断等价
+_REASONING_RE = re.compile(
+    "(?=("
+    + "|".join(
+        re.escape(keyword)
+        for keyword in sorted(_REASONING_KEYWORD_TAGS, key=len, reverse=True)
+    )
+    + "))"
+)
+# 推理摘要模板只构造一次，每条推理事件只做一次 % 格式化
+_REASONING_SUMMARY_FMT = "内部推理摘要：%s（已隐藏原文，长度%d字）"
+
+
+# 以 CODEX_HOME 取值为键缓存会话目录，每次查找不再重复 expanduser/join
+@functools.lru_cache(maxsize=8)
+def _sessions_dir_for(codex_home: str | None) -> str:
+    if codex_home is None:
+        codex_home = os.path.expanduser("~/.codex")
+    return os.path.join(codex_home, "sessions")
+
+
+def _open_at_end(path: str) -> tuple[BinaryIO, os.stat_result, int]:
+    handle = open(path, "rb", buffering=0)
+    try:
+        stat = os.fstat(handle.fileno())
+        offset = handle.seek(0, os.SEEK_END)
+    except OSError:
+        handle.close()
+        raise
+    return handle, stat, offset
+
+
+@functools.lru_cache(maxsize=64)
+def _epoch_days(year: int, month: int, day: int) -> int:
+    return date(year, month, day).toordinal() - _EPOCH_ORDINAL
+
 
 class CodexRunner:
     def __init__(self, config: Config) -> None:
@@ -23,13 +99,51 @@ class CodexRunner:
         self._logger = logging.getLogger(__name__)
         self._cpr_request = b"\x1b[6n"
         self._cpr_response = b"\x1b[1;1R"
+        self._session_file_cache: dict[
+            str, tuple[str, dict[str, int], list[str]]
+        ] = {}
+        self._cached_env: dict[str, str] | None = None
+        approvals_mode = config.codex_cli_approvals_mode
+        self._input_prefix = (
+            f"/approvals {approvals_mode}\n".encode("utf-8") if approvals_mode else b""
+        )
+        self._static_args_cache: dict[
+            bool, tuple[tuple[str, ...], tuple[str, ...]]
+        ] = {}
+        # 配置不可变，看门狗使用的正值阈值在构造时算好
+        thresholds = [
+            config.final_result_idle_timeout_seconds,
+            config.no_output_idle_timeout_seconds,
+        ]
+        if not config.jsonl_stream_events:
+            thresholds.append(config.context_compaction_idle_timeout_seconds)
+        self._watchdog_thresholds = tuple(value for value in thresholds if value > 0)
 
     @staticmethod
     def _is_context_compacted(text: str) -> bool:
-        return "context compacted" in text.lower()
+        return _CONTEXT_COMPACTED_RE.search(text) is not None
+
+    def _needs_idle_watchdog(self) -> bool:
+        # 上下文压缩检测只在未开启 JSONL 事件流时生效
+        return (
+            self._config.final_result_idle_timeout_seconds > 0
+            or self._config.no_output_idle_timeout_seconds > 0
+            or not self._config.jsonl_stream_events
+        )
+
+    def _watchdog_delay(self, idle_for: float, check_interval: float) -> float:
+        # 直接睡到最近的空闲阈值，避免每个 check_interval 都空转唤醒；
+        # 已越过阈值（仍在轮询最终结果）时退回固定间隔
+        remaining = [value - idle_for for value in self._watchdog_thresholds]
+        if not remaining or min(remaining) <= 0:
+            return check_interval
+        return max(0.05, min(remaining))
 
     def _build_env(self) -> dict[str, str]:
-        env = os.environ.copy()
+        # 环境变量在进程生命周期内不变，只构建一次；子进程启动时会自行复制
+        if self._cached_env is not None:
+            return self._cached_env
+        env = dict(os.environ)
         env.setdefault("PROMPT_TOOLKIT_NO_CPR", "1")
         env.setdefault("TERM", "xterm-256color")
         runtime_dir = env.get("XDG_RUNTIME_DIR") or f"/run/user/{os.getuid()}"
@@ -37,21 +151,33 @@ class CodexRunner:
         env.setdefault("XDG_RUNTIME_DIR", runtime_dir)
         if os.path.exists(bus_path):
             env.setdefault("DBUS_SESSION_BUS_ADDRESS", f"unix:path={bus_path}")
+        self._cached_env = env
         return env
 
+    def _static_args(self, resumed: bool) -> tuple[tuple[str, ...], tuple[str, ...]]:
+        # 命令头与用户参数只取决于配置，按是否 resume 缓存成元组，每次运行只拼动态部分
+        cached = self._static_args_cache.get(resumed)
+        if cached is None:
+            head = [self._config.codex_cli_cmd]
+            if resumed:
+                head.append("exec")
+                if self._config.codex_cli_skip_git_check:
+                    head.append("--skip-git-repo-check")
+            cached = (tuple(head), tuple(self._config.codex_cli_args))
+            self._static_args_cache[resumed] = cached
+        return cached
+
     def _build_args_for_prompt(
         self, prompt: str, resume_id: str | None, output_last_message_path: str | None = None
     ) -> tuple[list[str], bool]:
-        args = [self._config.codex_cli_cmd]
         active_resume_id = resume_id or self._config.codex_cli_resume_id
+        head, extra_args = self._static_args(bool(active_resume_id))
+        args = list(head)
+        if output_last_message_path:
+            args += ("--output-last-message", output_last_message_path)
+        args += extra_args
         if active_resume_id:
-            args.append("exec")
-            if self._config.codex_cli_skip_git_check:
-                args.append("--skip-git-repo-check")
-            if output_last_message_path:
-                args.extend(["--output-last-message", output_last_message_path])
-            args.extend(self._config.codex_cli_args)
-            args.extend(["resume", active_resume_id])
+            args += ("resume", active_resume_id)
             if self._config.codex_cli_input_mode == "arg":
                 if self._config.codex_cli_approvals_mode:
                     self._logger.warning(
@@ -62,9 +188,6 @@ class CodexRunner:
                 args.append("-")
             return args, True
 
-        if output_last_message_path:
-            args.extend(["--output-last-message", output_last_message_path])
-        args.extend(self._config.codex_cli_args)
         if self._config.codex_cli_input_mode == "arg":
             if self._config.codex_cli_approvals_mode:
                 self._logger.warning(
@@ -73,23 +196,32 @@ class CodexRunner:
             args.append(prompt)
         return args, False
 
-    def _build_input(self, prompt: str) -> str:
-        approvals_mode = self._config.codex_cli_approvals_mode
-        if approvals_mode:
-            return f"/approvals {approvals_mode}\n{prompt}\n"
-        return f"{prompt}\n"
+    def _build_input(self, prompt: str) -> list[bytes]:
+        # /approvals 前缀只取决于配置，构造时已编码好；按片段返回，写入时无需再拼接
+        if self._input_prefix:
+            return [self._input_prefix, prompt.encode("utf-8"), b"\n"]
+        return [prompt.encode("utf-8"), b"\n"]
+
+    @staticmethod
+    def _write_all(fd: int, parts: list[bytes]) -> None:
+        parts = [part for part in parts if part]
+        while parts:
+            written = os.writev(fd, parts)
+            while parts and written >= len(parts[0]):
+                written -= len(parts[0])
+                parts.pop(0)
+            if parts and written:
+                parts[0] = parts[0][written:]
 
     @staticmethod
     def _prepare_last_message_file() -> str | None:
+        # mkstemp 直接返回 fd 和路径，省去 NamedTemporaryFile 的文件对象包装
         try:
-            handle = tempfile.NamedTemporaryFile(
-                prefix="codex-last-message-", suffix=".txt", delete=False
-            )
-            path = handle.name
-            handle.close()
-            return path
+            fd, path = tempfile.mkstemp(prefix="codex-last-message-", suffix=".txt")
         except OSError:
             return None
+        os.close(fd)
+        return path
 
     @staticmethod
     def _read_last_message(path: str | None) -> str | None:
@@ -103,36 +235,124 @@ class CodexRunner:
         return content or None
 
     @staticmethod
-    def _codex_home() -> str:
-        return os.getenv("CODEX_HOME", os.path.expanduser("~/.codex"))
+    def _sessions_dir() -> str:
+        return _sessions_dir_for(os.environ.get("CODEX_HOME"))
 
-    def _find_session_file(self, resume_id: str) -> str | None:
-        sessions_dir = os.path.join(self._codex_home(), "sessions")
-        if not os.path.isdir(sessions_dir):
-            return None
-        candidates: list[tuple[float, str]] = []
-        for root, _, files in os.walk(sessions_dir):
-            for name in files:
-                if resume_id in name and name.endswith(".jsonl"):
-                    path = os.path.join(root, name)
+    @staticmethod
+    def _scan_session_dir(
+        dirpath: str, resume_id: str, dir_mtimes: dict[str, int]
+    ) -> Iterator[tuple[float, str]]:
+        # 先记录目录 mtime 再列目录，扫描期间新建的文件会使缓存失效
+        dir_mtimes[dirpath] = os.stat(dirpath).st_mtime_ns
+        with os.scandir(dirpath) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    try:
+                        yield from CodexRunner._scan_session_dir(
+                            entry.path, resume_id, dir_mtimes
+                        )
+                    except OSError:
+                        continue
+                elif resume_id in entry.name and entry.name.endswith(".jsonl"):
                     try:
-                        mtime = os.path.getmtime(path)
+                        yield entry.stat().st_mtime, entry.path
                     except OSError:
                         continue
-                    candidates.append((mtime, path))
-        if not candidates:
+
+    @staticmethod
+    def _session_dirs_unchanged(dir_mtimes: dict[str, int]) -> bool:
+        for dirpath, mtime in dir_mtimes.items():
+            try:
+                if os.stat(dirpath).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def _find_session_file(self, resume_id: str) -> str | None:
+        sessions_dir = self._sessions_dir()
+        if not os.path.isdir(sessions_dir):
             return None
-        candidates.sort(key=lambda item: item[0], reverse=True)
-        return candidates[0][1]
+        cached = self._session_file_cache.get(resume_id)
+        if (
+            cached is not None
+            and cached[0] == sessions_dir
+            and self._session_dirs_unchanged(cached[1])
+        ):
+            found = []
+            for path in cached[2]:
+                try:
+                    found.append((os.stat(path).st_mtime, path))
+                except OSError:
+                    continue
+        else:
+            dir_mtimes: dict[str, int] = {}
+            try:
+                found = list(self._scan_session_dir(sessions_dir, resume_id, dir_mtimes))
+            except OSError:
+                return None
+            self._session_file_cache[resume_id] = (
+                sessions_dir,
+                dir_mtimes,
+                [path for _, path in found],
+            )
+        latest = max(found, key=itemgetter(0), default=None)
+        return latest[1] if latest else None
 
     def find_session_file(self, resume_id: str) -> str | None:
         return self._find_session_file(resume_id)
 
+    def _session_watch_dir(self) -> str:
+        # codex 按本地日期把新会话写到 sessions/YYYY/MM/DD
+        sessions_dir = self._sessions_dir()
+        path = os.path.join(sessions_dir, time.strftime("%Y/%m/%d"))
+        while path != sessions_dir and not os.path.isdir(path):
+            path = os.path.dirname(path)
+        return path
+
+    @staticmethod
+    def _find_session_file_in_dir(
+        dirpath: str, resume_id: str, min_mtime: float
+    ) -> str | None:
+        # 只列单个目录，不递归；早于 min_mtime 的旧文件不算命中，交给全量扫描
+        latest: tuple[float, str] | None = None
+        try:
+            with os.scandir(dirpath) as entries:
+                for entry in entries:
+                    if resume_id not in entry.name or not entry.name.endswith(".jsonl"):
+                        continue
+                    try:
+                        if not entry.is_file():
+                            continue
+                        mtime = entry.stat().st_mtime
+                    except OSError:
+                        continue
+                    if mtime >= min_mtime and (latest is None or mtime > latest[0]):
+                        latest = (mtime, entry.path)
+        except OSError:
+            return None
+        return latest[1] if latest else None
+
     @staticmethod
     def _parse_timestamp(value: str | None) -> float | None:
         if not value:
             return None
         text = value.strip()
+        # Codex 会话固定写 UTC 的 YYYY-MM-DDTHH:MM:SS(.ffffff)Z，按定长字段直接算
+        # 纪元秒，省去构造 datetime 与时区对象；不符合时回退 fromisoformat
+        match = _FAST_TS_RE.match(text)
+        if match:
+            year, month, day, hour, minute, second, fraction = match.groups()
+            hour, minute, second = int(hour), int(minute), int(second)
+            if hour < 24 and minute < 60 and second < 60:
+                try:
+                    days = _epoch_days(int(year), int(month), int(day))
+                except ValueError:
+                    return None
+                seconds = days * 86400 + hour * 3600 + minute * 60 + second
+                micros = int(fraction.ljust(6, "0")) if fraction else 0
+                # 与 timedelta.total_seconds 相同的算法，结果逐位一致
+                return (seconds * 10**6 + micros) / 10**6
         if text.endswith("Z"):
             text = f"{text[:-1]}+00:00"
         try:
@@ -147,50 +367,87 @@ class CodexRunner:
     def parse_timestamp(value: str | None) -> float | None:
         return CodexRunner._parse_timestamp(value)
 
+    @staticmethod
+    def _assistant_message_from_record(data: dict) -> str | None:
+        payload = data.get("payload") or {}
+        if data.get("type") == "event_msg":
+            if payload.get("type") == "agent_message":
+                message = payload.get("message")
+                if message:
+                    return message.strip()
+            return None
+        if data.get("type") != "response_item":
+            return None
+        if payload.get("type") != "message":
+            return None
+        if payload.get("role") != "assistant":
+            return None
+        content = payload.get("content") or []
+        parts = []
+        for item in content:
+            if item.get("type") == "output_text":
+                text = item.get("text")
+                if text:
+                    parts.append(text)
+        if not parts:
+            return None
+        return "\n".join(parts).strip()
+
+    @staticmethod
+    def _loads_jsonl_line(line: bytes) -> dict | None:
+        # 直接把字节交给 json 解析（装了 orjson 时用 orjson），失败时按 replace 解码重试一次；
+        # 两者的解析错误与非法 UTF-8 错误都是 ValueError 子类
+        try:
+            return _json_loads(line)
+        except ValueError:
+            pass
+        try:
+            return _json_loads(line.decode("utf-8", errors="replace"))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def loads_jsonl_line(line: bytes) -> dict | None:
+        return CodexRunner._loads_jsonl_line(line)
+
+    @staticmethod
+    def _iter_lines_reversed(handle) -> Iterator[bytes]:
+        handle.seek(0, os.SEEK_END)
+        position = handle.tell()
+        remainder = b""
+        while position > 0:
+            read_size = min(_TAIL_BLOCK_SIZE, position)
+            position -= read_size
+            handle.seek(position)
+            lines = (handle.read(read_size) + remainder).split(b"\n")
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                yield line
+        if remainder:
+            yield remainder
+
     @classmethod
     def _extract_last_assistant_message_with_ts(
         cls, path: str
     ) -> tuple[str | None, float | None]:
-        last_message = None
-        last_timestamp = None
+        # JSONL 只追加写入，按偏移倒序命中的第一条就是最后一条助手消息，
+        # 与正序扫描“后写覆盖”的结果一致，命中即可停止
         try:
-            with open(path, "r", encoding="utf-8", errors="replace") as handle:
-                for raw_line in handle:
+            with open(path, "rb") as handle:
+                for raw_line in cls._iter_lines_reversed(handle):
                     line = raw_line.strip()
                     if not line:
                         continue
-                    try:
-                        data = json.loads(line)
-                    except json.JSONDecodeError:
-                        continue
-                    entry_timestamp = cls._parse_timestamp(data.get("timestamp"))
-                    payload = data.get("payload") or {}
-                    if data.get("type") == "event_msg":
-                        if payload.get("type") == "agent_message":
-                            message = payload.get("message")
-                            if message:
-                                last_message = message.strip()
-                                last_timestamp = entry_timestamp
+                    data = cls._loads_jsonl_line(line)
+                    if data is None:
                         continue
-                    if data.get("type") != "response_item":
+                    message = cls._assistant_message_from_record(data)
+                    if message is None:
                         continue
-                    if payload.get("type") != "message":
-                        continue
-                    if payload.get("role") != "assistant":
-                        continue
-                    content = payload.get("content") or []
-                    parts = []
-                    for item in content:
-                        if item.get("type") == "output_text":
-                            text = item.get("text")
-                            if text:
-                                parts.append(text)
-                    if parts:
-                        last_message = "\n".join(parts).strip()
-                        last_timestamp = entry_timestamp
+                    return message or None, cls._parse_timestamp(data.get("timestamp"))
         except OSError:
             return None, None
-        return last_message or None, last_timestamp
+        return None, None
 
     @classmethod
     def _extract_last_assistant_message(cls, path: str) -> str | None:
@@ -236,44 +493,35 @@ class CodexRunner:
     @staticmethod
     def _summarize_reasoning(text: str) -> str:
         lowered = text.lower()
-        tags: list[str] = []
-        if any(word in lowered for word in ("plan", "规划", "计划")):
-            tags.append("制定计划")
-        if any(word in lowered for word in ("analyze", "analysis", "评估", "分析")):
-            tags.append("分析需求")
-        if any(word in lowered for word in ("config", "配置", "env", "环境")):
-            tags.append("检查配置")
-        if any(word in lowered for word in ("error", "fail", "失败", "问题")):
-            tags.append("排查问题")
-        if any(word in lowered for word in ("test", "pytest", "playwright", "测试")):
-            tags.append("执行测试")
-        if any(word in lowered for word in ("deploy", "systemctl", "service", "服务")):
-            tags.append("部署/服务操作")
-        if any(word in lowered for word in ("refactor", "重构")):
-            tags.append("重构整理")
-        if any(word in lowered for word in ("readme", "doc", "文档")):
-            tags.append("更新文档")
-        if any(word in lowered for word in ("verify", "验证")):
-            tags.append("验证结果")
-        if any(word in lowered for word in ("final", "summary", "最终", "总结")):
-            tags.append("整理最终回复")
-        if any(word in lowered for word in ("sqlite", "db", "数据库", "jsonl")):
-            tags.append("检查数据与日志")
+        matched = {
+            _REASONING_KEYWORD_TAGS[match.group(1)]
+            for match in _REASONING_RE.finditer(lowered)
+        }
+        tags = [tag for tag, _ in _REASONING_TAGS if tag in matched]
         if not tags:
             tags.append("整理任务与输出")
-        summary = "；".join(tags[:4])
-        trimmed = text.strip()
-        return f"内部推理摘要：{summary}（已隐藏原文，长度{len(trimmed)}字）"
+        return _REASONING_SUMMARY_FMT % ("；".join(tags[:4]), len(text.strip()))
 
     @staticmethod
     def _normalize_text_for_dedupe(text: str) -> str:
         if not text:
             return ""
-        normalized = text.replace("\r\n", "\n").replace("\r", "\n")
-        lines = [line.rstrip() for line in normalized.split("\n")]
-        while lines and lines[-1] == "":
-            lines.pop()
-        return "\n".join(lines)
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+        # 一次正则替换去掉每行行尾空白，再去掉末尾空行
+        return _LINE_TRAILING_WS_RE.sub("", text).rstrip("\n")
+
+    @classmethod
+    def _remember_output(cls, sent_texts: OrderedDict[str, None], text: str) -> bool:
+        # 单次运行内去重，以归一化文本为键；按 LRU 限制条目数，长时间运行内存恒定
+        normalized = cls._normalize_text_for_dedupe(text)
+        if normalized in sent_texts:
+            sent_texts.move_to_end(normalized)
+            return False
+        sent_texts[normalized] = None
+        if len(sent_texts) > _RUN_DEDUPE_MAX_ENTRIES:
+            sent_texts.popitem(last=False)
+        return True
 
     @staticmethod
     def normalize_text_for_dedupe(text: str) -> str:
@@ -288,100 +536,180 @@ class CodexRunner:
         if not self._config.jsonl_stream_events:
             return
         session_file = None
+        session_parent: str | None = None
+        session_mtime = 0.0
         handle = None
+        watcher: FileWatcher | None = None
+        dir_watcher: FileWatcher | None = None
+        dir_watch_path: str | None = None
         current_inode: int | None = None
         current_offset = 0
         last_stat_check = 0.0
         stat_interval = 0.5
         last_reasoning_at = 0.0
+        # 配置是冻结的，逐行循环里用到的字段先取到局部变量
+        reasoning_throttle = self._config.jsonl_reasoning_throttle_seconds
+        reasoning_summary = self._config.jsonl_reasoning_mode.strip().lower() == "summary"
         last_message = None
+        pending = bytearray()
+
+        def close_handle() -> None:
+            nonlocal handle, watcher, current_inode
+            pending.clear()
+            if watcher is not None:
+                watcher.close()
+                watcher = None
+            if handle is not None:
+                try:
+                    handle.close()
+                except OSError:
+                    pass
+                handle = None
+            current_inode = None
+
+        def close_dir_watcher() -> None:
+            nonlocal dir_watcher
+            if dir_watcher is not None:
+                dir_watcher.close()
+                dir_watcher = None
+
+        async def wait_for_session_file() -> None:
+            nonlocal dir_watcher, dir_watch_path
+            # 会话文件尚未出现时监听所在目录的新建事件，超时仍按原间隔重查。
+            # inotify 不递归，新文件写在 sessions/YYYY/MM/DD 下，所以盯当天的日期目录；
+            # 目录还没建时先盯最深的已存在上级，建出下一级后改盯下一级
+            dirpath = session_parent or await asyncio.to_thread(self._session_watch_dir)
+            if dir_watcher is not None and dirpath != dir_watch_path:
+                close_dir_watcher()
+            if dir_watcher is None:
+                try:
+                    dir_watcher = FileWatcher(dirpath, directory=True)
+                except OSError:
+                    await asyncio.sleep(0.5)
+                    return
+                dir_watch_path = dirpath
+            await dir_watcher.wait(0.5)
+
+        async def wait_for_change() -> None:
+            nonlocal last_stat_check
+            # 有 inotify 时由内核通知唤醒，超时仅作为轮换检测的兜底；
+            # 收到通知后下一轮立即 stat，删除/改名无需等到 stat_interval
+            if watcher is None:
+                await asyncio.sleep(0.2)
+            elif await watcher.wait(stat_interval):
+                last_stat_check = 0.0
+
         try:
             while not finished.is_set():
                 if handle is None:
-                    session_file = self._find_session_file(resume_id)
+                    # 轮换后先只扫原文件所在目录，找不到更新的文件才全量遍历
+                    session_file = None
+                    if session_parent is not None:
+                        session_file = await asyncio.to_thread(
+                            self._find_session_file_in_dir,
+                            session_parent,
+                            resume_id,
+                            session_mtime,
+                        )
                     if not session_file:
-                        await asyncio.sleep(0.5)
+                        session_file = await asyncio.to_thread(self._find_session_file, resume_id)
+                    if not session_file:
+                        await wait_for_session_file()
                         continue
+                    close_dir_watcher()
                     try:
-                        handle = open(
-                            session_file, "r", encoding="utf-8", errors="replace"
+                        handle, stat, current_offset = await asyncio.to_thread(
+                            _open_at_end, session_file
                         )
-                        stat = os.fstat(handle.fileno())
-                        current_inode = stat.st_ino
-                        handle.seek(0, os.SEEK_END)
-                        current_offset = handle.tell()
                     except OSError:
-                        handle = None
+                        close_handle()
                         await asyncio.sleep(0.5)
                         continue
-                line = handle.readline()
-                if not line:
+                    current_inode = stat.st_ino
+                    session_mtime = stat.st_mtime
+                    session_parent = os.path.dirname(session_file)
+                    try:
+                        watcher = FileWatcher(session_file)
+                    except OSError:
+                        watcher = None
+                chunk = await asyncio.to_thread(handle.read, _JSONL_READ_SIZE)
+                if not chunk:
                     now = time.monotonic()
                     if now - last_stat_check >= stat_interval:
                         last_stat_check = now
                         try:
-                            stat = os.stat(session_file)
+                            stat = await asyncio.to_thread(os.stat, session_file)
                         except OSError:
-                            try:
-                                handle.close()
-                            except OSError:
-                                pass
-                            handle = None
-                            current_inode = None
+                            close_handle()
                             session_file = None
                             await asyncio.sleep(0.2)
                             continue
-                        if current_inode is not None and stat.st_ino != current_inode:
-                            try:
-                                handle.close()
-                            except OSError:
-                                pass
-                            handle = None
-                            current_inode = None
-                            await asyncio.sleep(0.2)
-                            continue
-                        if stat.st_size < current_offset:
-                            try:
-                                handle.close()
-                            except OSError:
-                                pass
-                            handle = None
-                            current_inode = None
+                        if (
+                            current_inode is not None and stat.st_ino != current_inode
+                        ) or stat.st_size < current_offset:
+                            close_handle()
                             await asyncio.sleep(0.2)
                             continue
-                    await asyncio.sleep(0.2)
-                    continue
-                current_offset = handle.tell()
-                try:
-                    data = json.loads(line)
-                except json.JSONDecodeError:
+                    await wait_for_change()
                     continue
-                text, is_reasoning = self._event_msg_text(data)
-                if not text:
+                current_offset += len(chunk)
+                # 整块读入后按最后一个换行切出完整行批量处理，半行留在缓冲区
+                pending.extend(chunk)
+                cut = pending.rfind(b"\n")
+                if cut == -1:
                     continue
-                if is_reasoning:
-                    now = time.monotonic()
-                    if (
-                        self._config.jsonl_reasoning_throttle_seconds > 0
-                        and now - last_reasoning_at
-                        < self._config.jsonl_reasoning_throttle_seconds
-                    ):
+                lines = pending[:cut].split(b"\n")
+                del pending[: cut + 1]
+                for line in lines:
+                    data = self._loads_jsonl_line(line)
+                    if data is None:
                         continue
-                    last_reasoning_at = now
-                    mode = self._config.jsonl_reasoning_mode.strip().lower()
-                    if mode == "summary":
-                        await emit(self._summarize_reasoning(text))
-                    continue
-                if text == last_message:
-                    continue
-                last_message = text
-                await emit(text)
+                    text, is_reasoning = self._event_msg_text(data)
+                    if not text:
+                        continue
+                    if is_reasoning:
+                        now = time.monotonic()
+                        if (
+                            reasoning_throttle > 0
+                            and now - last_reasoning_at < reasoning_throttle
+                        ):
+                            continue
+                        last_reasoning_at = now
+                        if reasoning_summary:
+                            await emit(self._summarize_reasoning(text))
+                        continue
+                    if text == last_message:
+                        continue
+                    last_message = text
+                    await emit(text)
         finally:
-            if handle is not None:
-                try:
-                    handle.close()
-                except OSError:
-                    pass
+            close_handle()
+            close_dir_watcher()
+
+    @staticmethod
+    async def _cancel_and_wait(tasks: list[asyncio.Task]) -> None:
+        # 逐个等待已取消的子任务，省去 gather 的聚合 Future 和回调；
+        # 子任务已结束时吞掉其异常，否则是当前任务被取消，继续向上抛
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                if not task.done():
+                    raise
+            except Exception:
+                pass
+
+    @staticmethod
+    async def _wait_process(proc: asyncio.subprocess.Process, timeout: float) -> bool:
+        # asyncio.timeout 只挂一个 call_later，不像 wait_for 额外包一层 Task
+        try:
+            async with asyncio.timeout(timeout):
+                await proc.wait()
+        except TimeoutError:
+            return False
+        return True
 
     async def _emit_final_message(
         self,
@@ -392,6 +720,18 @@ class CodexRunner:
     ) -> None:
         if not on_final:
             return
+        last_message = await asyncio.to_thread(
+            self._lookup_final_message, last_message_path, resume_id, min_timestamp
+        )
+        if last_message:
+            await on_final(last_message)
+
+    def _lookup_final_message(
+        self,
+        last_message_path: str | None,
+        resume_id: str | None,
+        min_timestamp: float | None,
+    ) -> str | None:
         last_message = self._read_last_message(last_message_path)
         if not last_message and resume_id:
             if min_timestamp is None:
@@ -400,8 +740,7 @@ class CodexRunner:
                 last_message = self._read_last_assistant_message_after(
                     resume_id, min_timestamp
                 )
-        if last_message:
-            await on_final(last_message)
+        return last_message
 
     async def run(
         self,
@@ -450,56 +789,71 @@ class CodexRunner:
         forced_done = False
         last_message_sent: str | None = None
         fallback_attempted = False
-        sent_hashes: set[str] = set()
-
-        def hash_text(text: str) -> str:
-            normalized = self._normalize_text_for_dedupe(text)
-            return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        sent_texts: OrderedDict[str, None] = OrderedDict()
 
         async def emit_output(text: str, is_error: bool) -> None:
-            if not is_error:
-                if text:
-                    digest = hash_text(text)
-                    if digest in sent_hashes:
-                        return
-                    sent_hashes.add(digest)
+            if not is_error and text:
+                if not self._remember_output(sent_texts, text):
+                    return
             await on_output(text, is_error)
 
+        async def emit_line(line: bytes | bytearray, is_error: bool) -> None:
+            nonlocal context_compacted
+            text = line.decode("utf-8", errors="replace").rstrip()
+            if self._is_context_compacted(text):
+                context_compacted = True
+            await emit_output(text, is_error)
+
         async def read_stream(stream: asyncio.StreamReader, is_error: bool) -> None:
             nonlocal last_output_at
-            nonlocal context_compacted
+            # 每次就绪整块读取，按最后一个换行切出完整行，残行留在 bytearray 中；
+            # 也不再受 readline 单行长度上限限制
+            pending = bytearray()
             while True:
-                line = await stream.readline()
-                if not line:
+                chunk = await stream.read(_STREAM_READ_SIZE)
+                if not chunk:
                     break
-                text = line.decode("utf-8", errors="replace").rstrip()
                 last_output_at = time.monotonic()
-                if self._is_context_compacted(text):
-                    context_compacted = True
-                await emit_output(text, is_error)
+                pending.extend(chunk)
+                end = pending.rfind(b"\n")
+                if end == -1:
+                    continue
+                lines = pending[:end].split(b"\n")
+                del pending[: end + 1]
+                for line in lines:
+                    await emit_line(line, is_error)
+            if pending:
+                await emit_line(pending, is_error)
 
         async def idle_watchdog() -> None:
             nonlocal forced_done
             nonlocal last_message_sent
             nonlocal fallback_attempted
-            check_interval = min(
-                1.0,
-                max(0.1, self._config.context_compaction_idle_timeout_seconds / 2),
-            )
+            # 循环内反复比较的阈值先绑定为局部变量
+            final_idle_timeout = self._config.final_result_idle_timeout_seconds
+            no_output_idle_timeout = self._config.no_output_idle_timeout_seconds
+            compaction_idle_timeout = self._config.context_compaction_idle_timeout_seconds
+            stream_events = self._config.jsonl_stream_events
+            check_interval = min(1.0, max(0.1, compaction_idle_timeout / 2))
             while not finished.is_set():
-                await asyncio.sleep(check_interval)
+                await asyncio.sleep(
+                    self._watchdog_delay(
+                        time.monotonic() - last_output_at, check_interval
+                    )
+                )
                 if finished.is_set():
                     break
                 idle_for = time.monotonic() - last_output_at
-                if (
-                    self._config.final_result_idle_timeout_seconds > 0
-                    and idle_for >= self._config.final_result_idle_timeout_seconds
-                ):
-                    final_message = self._read_last_message(last_message_path)
+                if final_idle_timeout > 0 and idle_for >= final_idle_timeout:
+                    final_message = await asyncio.to_thread(
+                        self._read_last_message, last_message_path
+                    )
                     if not final_message and active_resume_id and not fallback_attempted:
                         fallback_attempted = True
-                        final_message = self._read_last_assistant_message_after(
-                            active_resume_id, run_started_at
+                        final_message = await asyncio.to_thread(
+                            self._read_last_assistant_message_after,
+                            active_resume_id,
+                            run_started_at,
                         )
                     if final_message:
                         if final_message != last_message_sent:
@@ -513,10 +867,7 @@ class CodexRunner:
                         )
                         proc.terminate()
                         break
-                if (
-                    self._config.no_output_idle_timeout_seconds > 0
-                    and idle_for >= self._config.no_output_idle_timeout_seconds
-                ):
+                if no_output_idle_timeout > 0 and idle_for >= no_output_idle_timeout:
                     await emit_output("检测到长时间无输出，已自动结束。", False)
                     await on_status("timeout")
                     forced_done = True
@@ -528,15 +879,17 @@ class CodexRunner:
                     break
                 if not context_compacted:
                     continue
-                if self._config.jsonl_stream_events:
+                if stream_events:
                     continue
-                if idle_for < self._config.context_compaction_idle_timeout_seconds:
+                if idle_for < compaction_idle_timeout:
                     continue
-                last_message = self._read_last_message(last_message_path)
+                last_message = await asyncio.to_thread(self._read_last_message, last_message_path)
                 if not last_message and active_resume_id and not fallback_attempted:
                     fallback_attempted = True
-                    last_message = self._read_last_assistant_message_after(
-                        active_resume_id, run_started_at
+                    last_message = await asyncio.to_thread(
+                        self._read_last_assistant_message_after,
+                        active_resume_id,
+                        run_started_at,
                     )
                 if last_message and last_message != last_message_sent:
                     last_message_sent = last_message
@@ -564,30 +917,27 @@ class CodexRunner:
 
         try:
             if proc.stdin is not None and self._config.codex_cli_input_mode == "stdin":
-                proc.stdin.write(self._build_input(prompt).encode("utf-8"))
+                proc.stdin.writelines(self._build_input(prompt))
                 await proc.stdin.drain()
                 proc.stdin.close()
 
             tasks = [
                 asyncio.create_task(read_stream(proc.stdout, False)),
                 asyncio.create_task(read_stream(proc.stderr, True)),
-                asyncio.create_task(idle_watchdog()),
-                asyncio.create_task(jsonl_tailer()),
             ]
+            # 只为本次运行实际需要的定时/跟踪逻辑创建任务
+            if self._needs_idle_watchdog():
+                tasks.append(asyncio.create_task(idle_watchdog()))
+            if active_resume_id and self._config.jsonl_stream_events:
+                tasks.append(asyncio.create_task(jsonl_tailer()))
 
-            try:
-                await asyncio.wait_for(
-                    proc.wait(), timeout=self._config.run_timeout_seconds
-                )
-            except asyncio.TimeoutError:
+            if not await self._wait_process(proc, self._config.run_timeout_seconds):
                 await on_status("timeout")
                 proc.terminate()
                 await proc.wait()
 
             finished.set()
-            for task in tasks:
-                task.cancel()
-            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._cancel_and_wait(tasks)
             await self._emit_final_message(
                 on_final, last_message_path, active_resume_id, run_started_at
             )
@@ -643,57 +993,69 @@ class CodexRunner:
         forced_done = False
         last_message_sent: str | None = None
         fallback_attempted = False
-        sent_hashes: set[str] = set()
-
-        def hash_text(text: str) -> str:
-            normalized = self._normalize_text_for_dedupe(text)
-            return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        sent_texts: OrderedDict[str, None] = OrderedDict()
 
         async def emit_output(text: str, is_error: bool) -> None:
-            if not is_error:
-                if text:
-                    digest = hash_text(text)
-                    if digest in sent_hashes:
-                        return
-                    sent_hashes.add(digest)
+            if not is_error and text:
+                if not self._remember_output(sent_texts, text):
+                    return
             await on_output(text, is_error)
 
         async def read_output() -> None:
             nonlocal last_output_at
             nonlocal context_compacted
             text_buffer = ""
-            raw_buffer = b""
+            # bytearray 原地扩展/删除前缀，避免每次拼接和切片都复制整个缓冲区
+            raw_buffer = bytearray()
+            cpr_length = len(self._cpr_request)
+            # 增量解码器自行缓存被截断的多字节字符，无需再保留末尾字节
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
             while True:
-                data = await asyncio.to_thread(os.read, master_fd, 1024)
+                data = await data_queue.get()
                 if not data:
                     break
                 last_output_at = time.monotonic()
-                raw_buffer += data
+                raw_buffer.extend(data)
                 while True:
                     idx = raw_buffer.find(self._cpr_request)
                     if idx == -1:
                         break
                     if idx > 0:
-                        text_buffer += raw_buffer[:idx].decode(
-                            "utf-8", errors="replace"
-                        )
-                    raw_buffer = raw_buffer[idx + len(self._cpr_request) :]
+                        with memoryview(raw_buffer) as view:
+                            text_buffer += decoder.decode(view[:idx])
+                    del raw_buffer[: idx + cpr_length]
                     os.write(master_fd, self._cpr_response)
 
-                if len(raw_buffer) > 3:
-                    emit, raw_buffer = raw_buffer[:-3], raw_buffer[-3:]
-                    text_buffer += emit.decode("utf-8", errors="replace")
+                # 只在末尾恰好是半截 CPR 请求时才留待下次拼接
+                keep = 0
+                for size in range(min(cpr_length - 1, len(raw_buffer)), 0, -1):
+                    if raw_buffer.endswith(self._cpr_request[:size]):
+                        keep = size
+                        break
+                cut = len(raw_buffer) - keep
+                if cut > 0:
+                    with memoryview(raw_buffer) as view:
+                        text_buffer += decoder.decode(view[:cut])
+                    del raw_buffer[:cut]
 
-                while "\n" in text_buffer:
-                    line, text_buffer = text_buffer.split("\n", 1)
+                if "\n" not in text_buffer:
+                    continue
+                # 同一次读取得到的多行逐行去重后合并为一次回调，下游本就按换行拼接
+                lines = text_buffer.split("\n")
+                text_buffer = lines.pop()
+                batch = []
+                for line in lines:
                     line = line.rstrip("\r")
-                    if line:
-                        if self._is_context_compacted(line):
-                            context_compacted = True
-                        await emit_output(line, False)
+                    if not line:
+                        continue
+                    if self._is_context_compacted(line):
+                        context_compacted = True
+                    if self._remember_output(sent_texts, line):
+                        batch.append(line)
+                if batch:
+                    await on_output("\n".join(batch), False)
 
-            if raw_buffer:
-                text_buffer += raw_buffer.decode("utf-8", errors="replace")
+            text_buffer += decoder.decode(bytes(raw_buffer), final=True)
             if text_buffer.strip():
                 if self._is_context_compacted(text_buffer.strip()):
                     context_compacted = True
@@ -703,24 +1065,31 @@ class CodexRunner:
             nonlocal forced_done
             nonlocal last_message_sent
             nonlocal fallback_attempted
-            check_interval = min(
-                1.0,
-                max(0.1, self._config.context_compaction_idle_timeout_seconds / 2),
-            )
+            # 循环内反复比较的阈值先绑定为局部变量
+            final_idle_timeout = self._config.final_result_idle_timeout_seconds
+            no_output_idle_timeout = self._config.no_output_idle_timeout_seconds
+            compaction_idle_timeout = self._config.context_compaction_idle_timeout_seconds
+            stream_events = self._config.jsonl_stream_events
+            check_interval = min(1.0, max(0.1, compaction_idle_timeout / 2))
             while not finished.is_set():
-                await asyncio.sleep(check_interval)
+                await asyncio.sleep(
+                    self._watchdog_delay(
+                        time.monotonic() - last_output_at, check_interval
+                    )
+                )
                 if finished.is_set():
                     break
                 idle_for = time.monotonic() - last_output_at
-                if (
-                    self._config.final_result_idle_timeout_seconds > 0
-                    and idle_for >= self._config.final_result_idle_timeout_seconds
-                ):
-                    final_message = self._read_last_message(last_message_path)
+                if final_idle_timeout > 0 and idle_for >= final_idle_timeout:
+                    final_message = await asyncio.to_thread(
+                        self._read_last_message, last_message_path
+                    )
                     if not final_message and active_resume_id and not fallback_attempted:
                         fallback_attempted = True
-                        final_message = self._read_last_assistant_message_after(
-                            active_resume_id, run_started_at
+                        final_message = await asyncio.to_thread(
+                            self._read_last_assistant_message_after,
+                            active_resume_id,
+                            run_started_at,
                         )
                     if final_message:
                         if final_message != last_message_sent:
@@ -734,10 +1103,7 @@ class CodexRunner:
                         )
                         proc.terminate()
                         break
-                if (
-                    self._config.no_output_idle_timeout_seconds > 0
-                    and idle_for >= self._config.no_output_idle_timeout_seconds
-                ):
+                if no_output_idle_timeout > 0 and idle_for >= no_output_idle_timeout:
                     await emit_output("检测到长时间无输出，已自动结束。", False)
                     await on_status("timeout")
                     forced_done = True
@@ -749,15 +1115,17 @@ class CodexRunner:
                     break
                 if not context_compacted:
                     continue
-                if self._config.jsonl_stream_events:
+                if stream_events:
                     continue
-                if idle_for < self._config.context_compaction_idle_timeout_seconds:
+                if idle_for < compaction_idle_timeout:
                     continue
-                last_message = self._read_last_message(last_message_path)
+                last_message = await asyncio.to_thread(self._read_last_message, last_message_path)
                 if not last_message and active_resume_id and not fallback_attempted:
                     fallback_attempted = True
-                    last_message = self._read_last_assistant_message_after(
-                        active_resume_id, run_started_at
+                    last_message = await asyncio.to_thread(
+                        self._read_last_assistant_message_after,
+                        active_resume_id,
+                        run_started_at,
                     )
                 if last_message and last_message != last_message_sent:
                     last_message_sent = last_message
@@ -783,31 +1151,43 @@ class CodexRunner:
 
             await self._tail_jsonl_events(active_resume_id, finished, emit)
 
+        loop = asyncio.get_running_loop()
+        data_queue: asyncio.Queue[bytes] = asyncio.Queue()
+
+        def pump_output() -> None:
+            # 由事件循环在 master_fd 可读时回调，直接读取，不再每次派发到线程池
+            try:
+                data = os.read(master_fd, 65536)
+            except BlockingIOError:
+                return
+            except OSError:
+                data = b""
+            if not data:
+                loop.remove_reader(master_fd)
+            data_queue.put_nowait(data)
+
         try:
+            loop.add_reader(master_fd, pump_output)
             tasks = [
                 asyncio.create_task(read_output()),
-                asyncio.create_task(idle_watchdog()),
-                asyncio.create_task(jsonl_tailer()),
             ]
+            if self._needs_idle_watchdog():
+                tasks.append(asyncio.create_task(idle_watchdog()))
+            if active_resume_id and self._config.jsonl_stream_events:
+                tasks.append(asyncio.create_task(jsonl_tailer()))
 
             if self._config.codex_cli_input_mode == "stdin":
-                os.write(master_fd, self._build_input(prompt).encode("utf-8"))
+                self._write_all(master_fd, self._build_input(prompt))
             elif self._config.codex_cli_approvals_mode:
                 self._logger.warning("PTY arg 模式无法注入 /approvals 指令，已跳过")
 
-            try:
-                await asyncio.wait_for(
-                    proc.wait(), timeout=self._config.run_timeout_seconds
-                )
-            except asyncio.TimeoutError:
+            if not await self._wait_process(proc, self._config.run_timeout_seconds):
                 await on_status("timeout")
                 proc.terminate()
                 await proc.wait()
 
             finished.set()
-            for task in tasks:
-                task.cancel()
-            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._cancel_and_wait(tasks)
             await self._emit_final_message(
                 on_final, last_message_path, active_resume_id, run_started_at
             )
@@ -823,6 +1203,7 @@ class CodexRunner:
             finished.set()
             raise
         finally:
+            loop.remove_reader(master_fd)
             os.close(master_fd)
             if last_message_path:
                 try:
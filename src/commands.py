@@ -13,31 +13,33 @@ class CommandType(str, Enum):
     LASTRESULT = "lastresult"
 
 
-@dataclass
+@dataclass(frozen=True)
 class ParsedCommand:
     type: CommandType
     payload: Optional[str] = None
 
 
+# 命令名 -> (类型, 是否携带参数)，一次字典查找完成分派
+_COMMAND_TABLE: dict[str, tuple[CommandType, bool]] = {
+    "stop": (CommandType.STOP, False),
+    "status": (CommandType.STATUS, False),
+    "retry": (CommandType.RETRY, False),
+    "new": (CommandType.NEW, True),
+    "session": (CommandType.SESSION, True),
+    "help": (CommandType.HELP, False),
+    "lastresult": (CommandType.LASTRESULT, False),
+}
+
+
 def parse_command(text: str) -> Optional[ParsedCommand]:
     text = text.strip()
     if not text.startswith("/"):
         return None
     parts = text.split(maxsplit=1)
-    cmd = parts[0][1:].lower()
-    payload = parts[1].strip() if len(parts) > 1 else None
-    if cmd == "stop":
-        return ParsedCommand(CommandType.STOP)
-    if cmd == "status":
-        return ParsedCommand(CommandType.STATUS)
-    if cmd == "retry":
-        return ParsedCommand(CommandType.RETRY)
-    if cmd == "new":
-        return ParsedCommand(CommandType.NEW, payload)
-    if cmd == "session":
-        return ParsedCommand(CommandType.SESSION, payload)
-    if cmd == "help":
-        return ParsedCommand(CommandType.HELP)
-    if cmd == "lastresult":
-        return ParsedCommand(CommandType.LASTRESULT)
-    return None
+    entry = _COMMAND_TABLE.get(parts[0][1:].lower())
+    if entry is None:
+        return None
+    command_type, takes_payload = entry
+    if takes_payload and len(parts) > 1:
+        return ParsedCommand(command_type, parts[1].strip())
+    return ParsedCommand(command_type)
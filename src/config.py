@@ -3,12 +3,12 @@ from dataclasses import dataclass
 from typing import Optional, Set, List
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Config:
     telegram_bot_token: str
     telegram_allowed_user_ids: Set[int]
     codex_cli_cmd: str
-    codex_cli_args: list[str]
+    codex_cli_args: tuple[str, ...]
     codex_cli_input_mode: str
     codex_cli_resume_id: Optional[str]
     codex_cli_approvals_mode: Optional[str]
@@ -29,12 +29,12 @@ class Config:
     message_chunk_limit: int
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class BaseConfig:
     db_path: str
     lock_path: str
     codex_cli_cmd: str
-    codex_cli_args: List[str]
+    codex_cli_args: tuple[str, ...]
     codex_cli_input_mode: str
     codex_cli_approvals_mode: Optional[str]
     codex_cli_skip_git_check: bool
@@ -53,17 +53,17 @@ class BaseConfig:
     message_chunk_limit: int
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class BotConfig:
     name: str
     token: str
     allowed_user_ids: Set[int]
     resume_id: Optional[str]
     codex_workdir: str
-    codex_cli_args: Optional[List[str]] = None
+    codex_cli_args: Optional[tuple[str, ...]] = None
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class AppConfig:
     base: BaseConfig
     bots: List[BotConfig]
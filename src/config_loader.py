@@ -1,10 +1,8 @@
+import functools
 import os
 import re
 import shlex
-try:
-    import tomllib  # Python 3.11+
-except ModuleNotFoundError:  # pragma: no cover - fallback for Python 3.10
-    import tomli as tomllib
+import tomllib
 from dataclasses import dataclass
 from typing import Any, Mapping, Optional
 
@@ -22,13 +20,7 @@ class ConfigLoadResult:
 def _parse_int_set(value: str) -> set[int]:
     if not value.strip():
         return set()
-    items = []
-    for part in value.split(","):
-        part = part.strip()
-        if not part:
-            continue
-        items.append(int(part))
-    return set(items)
+    return set(map(int, filter(None, (part.strip() for part in value.split(",")))))
 
 
 def _parse_optional(value: str) -> Optional[str]:
@@ -40,9 +32,18 @@ def _parse_bool(value: str) -> bool:
     return value.strip().lower() in {"1", "true", "yes", "on"}
 
 
-def _load_dotenv(path: str = ".env") -> None:
-    if not os.path.exists(path):
-        return
+def _file_signature(path: str) -> Optional[tuple[int, int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+# 以 (路径, mtime/size/inode) 为键缓存解析结果，文件改动后签名变化自动重新解析
+@functools.lru_cache(maxsize=4)
+def _parse_dotenv(path: str, signature: tuple[int, int, int]) -> tuple[tuple[str, str], ...]:
+    items: list[tuple[str, str]] = []
     with open(path, "r", encoding="utf-8") as handle:
         for raw_line in handle:
             line = raw_line.strip()
@@ -59,18 +60,46 @@ def _load_dotenv(path: str = ".env") -> None:
                 continue
             if value and value[0] in ("'", '"') and value[-1] == value[0]:
                 value = value[1:-1]
-            if key not in os.environ:
-                os.environ[key] = value
+            items.append((key, value))
+    return tuple(items)
 
 
-def resolve_env_placeholders(value: str, env: Mapping[str, str]) -> str:
-    def replace(match: re.Match[str]) -> str:
+@functools.lru_cache(maxsize=4)
+def _parse_toml(
+    path: str, signature: Optional[tuple[int, int, int]]
+) -> dict[str, Any]:
+    with open(path, "rb") as handle:
+        return tomllib.load(handle)
+
+
+def _load_dotenv(path: str = ".env") -> None:
+    signature = _file_signature(path)
+    if signature is None:
+        return
+    for key, value in _parse_dotenv(path, signature):
+        if key not in os.environ:
+            os.environ[key] = value
+
+
+# 替换回调用带 __slots__ 的可调用对象，不再每次调用新建闭包
+class _EnvResolver:
+    __slots__ = ("env",)
+
+    def __init__(self, env: Mapping[str, str]) -> None:
+        self.env = env
+
+    def __call__(self, match: re.Match[str]) -> str:
         key = match.group(1)
-        if key not in env:
+        if key not in self.env:
             raise KeyError(key)
-        return env[key]
+        return self.env[key]
+
 
-    return _ENV_PATTERN.sub(replace, value)
+def resolve_env_placeholders(value: str, env: Mapping[str, str]) -> str:
+    # 绝大多数字段不含占位符，先做一次子串判断，省掉正则替换和回调
+    if "${ENV:" not in value:
+        return value
+    return _ENV_PATTERN.sub(_EnvResolver(env), value)
 
 
 def _resolve_value(value: Any, env: Mapping[str, str]) -> Any:
@@ -119,9 +148,9 @@ def _build_base_config(env: Mapping[str, str], base_data: Mapping[str, Any]) ->
         codex_cli_args_value = env.get("CODEX_CLI_ARGS", "")
     codex_cli_args_value = _resolve_value(codex_cli_args_value, env)
     if isinstance(codex_cli_args_value, list):
-        codex_cli_args = [str(item) for item in codex_cli_args_value]
+        codex_cli_args = tuple(str(item) for item in codex_cli_args_value)
     else:
-        codex_cli_args = shlex.split(str(codex_cli_args_value))
+        codex_cli_args = tuple(shlex.split(str(codex_cli_args_value)))
 
     return BaseConfig(
         db_path=db_path,
@@ -165,8 +194,8 @@ def _parse_allowed_user_ids(raw: Any, env: Mapping[str, str]) -> set[int]:
 def load_toml_config(path: str, env: Mapping[str, str] | None = None) -> ConfigLoadResult:
     if env is None:
         env = os.environ
-    with open(path, "rb") as handle:
-        data = tomllib.load(handle)
+    # 文件不存在时签名为 None，open 照常抛错且异常不会被缓存
+    data = _parse_toml(path, _file_signature(path))
 
     base_data = data.get("base", {}) or {}
     bots_data = data.get("bots", []) or []
@@ -220,9 +249,9 @@ def load_toml_config(path: str, env: Mapping[str, str] | None = None) -> ConfigL
         else:
             codex_cli_args_raw = _resolve_value(codex_cli_args_raw, env)
             if isinstance(codex_cli_args_raw, list):
-                codex_cli_args = [str(item) for item in codex_cli_args_raw]
+                codex_cli_args = tuple(str(item) for item in codex_cli_args_raw)
             else:
-                codex_cli_args = shlex.split(str(codex_cli_args_raw))
+                codex_cli_args = tuple(shlex.split(str(codex_cli_args_raw)))
 
         bots.append(
             BotConfig(
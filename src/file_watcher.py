@@ -0,0 +1,81 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+from typing import Optional
+
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_MOVE_SELF = 0x00000800
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+# 内核把 IN_NONBLOCK/IN_CLOEXEC 定义为 O_NONBLOCK/O_CLOEXEC，取值随架构不同，不能写死
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = os.O_CLOEXEC
+_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_MOVE_SELF | _IN_DELETE_SELF
+_DIR_WATCH_MASK = _IN_CREATE | _IN_MOVED_TO | _IN_MOVE_SELF | _IN_DELETE_SELF
+
+_libc: Optional[ctypes.CDLL] = None
+_libc_loaded = False
+
+
+def _load_libc() -> Optional[ctypes.CDLL]:
+    global _libc, _libc_loaded
+    if _libc_loaded:
+        return _libc
+    _libc_loaded = True
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1") or not hasattr(libc, "inotify_add_watch"):
+        return None
+    _libc = libc
+    return _libc
+
+
+# 基于 inotify 等待文件变更（directory=True 时等待目录内新建/移入文件）；
+# 不可用时构造抛 OSError，由调用方退回轮询
+class FileWatcher:
+    def __init__(self, path: str, directory: bool = False) -> None:
+        libc = _load_libc()
+        if libc is None:
+            raise OSError("当前平台不支持 inotify")
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        mask = _DIR_WATCH_MASK if directory else _WATCH_MASK
+        if libc.inotify_add_watch(fd, os.fsencode(path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(errno, os.strerror(errno), path)
+        self._fd = fd
+        self._changed = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(fd, self._on_readable)
+
+    def _on_readable(self) -> None:
+        try:
+            while os.read(self._fd, 4096):
+                pass
+        except OSError:
+            pass
+        self._changed.set()
+
+    async def wait(self, timeout: float) -> bool:
+        try:
+            async with asyncio.timeout(timeout):
+                await self._changed.wait()
+        except TimeoutError:
+            return False
+        self._changed.clear()
+        return True
+
+    def close(self) -> None:
+        if self._fd < 0:
+            return
+        self._loop.remove_reader(self._fd)
+        os.close(self._fd)
+        self._fd = -1
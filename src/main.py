@@ -1,7 +1,7 @@
+import asyncio
 import atexit
 import os
 import sys
-import threading
 
 from .config import build_runtime_config
 from .config_loader import load_app_config
@@ -10,7 +10,7 @@ from .store import Store
 from .session_manager import SessionManager
 from .codex_runner import CodexRunner
 from .orchestrator import Orchestrator
-from .adapters.telegram_adapter import TelegramAdapter
+from .adapters.telegram_adapter import TelegramAdapter, new_event_loop
 from .process_lock import ProcessLock
 
 
@@ -28,7 +28,7 @@ def main() -> None:
     store = Store(db_path)
     store.init()
 
-    threads: list[threading.Thread] = []
+    adapters: list[TelegramAdapter] = []
     for bot in app_config.bots:
         runtime_config = build_runtime_config(app_config.base, bot)
         session_manager = SessionManager(store)
@@ -36,15 +36,21 @@ def main() -> None:
         orchestrator = Orchestrator(
             runtime_config, session_manager, store, runner, bot_id=bot.name
         )
-        adapter = TelegramAdapter(runtime_config, orchestrator, bot_id=bot.name)
-        thread = threading.Thread(
-            target=adapter.run, name=f"bot-{bot.name}", daemon=True
+        adapters.append(
+            TelegramAdapter(runtime_config, orchestrator, bot_id=bot.name)
         )
-        thread.start()
-        threads.append(thread)
 
-    for thread in threads:
-        thread.join()
+    # 所有 bot 共享一个事件循环：协程里的同步阻塞调用会卡住全部 bot，
+    # SQLite 走 Store.call / read / submit，文件 IO 走 asyncio.to_thread
+    try:
+        with asyncio.Runner(loop_factory=new_event_loop) as runner:
+            runner.run(_run_adapters(adapters))
+    finally:
+        store.close()
+
+
+async def _run_adapters(adapters: list[TelegramAdapter]) -> None:
+    await asyncio.gather(*(adapter.run_async() for adapter in adapters))
 
 
 if __name__ == "__main__":
@@ -1,8 +1,9 @@
+import os
 import time
 import uuid
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Deque, Optional
+from typing import Any, Deque, Optional
 from collections import deque
 
 
@@ -22,8 +23,18 @@ class RunStatus(str, Enum):
     TIMEOUT = "timeout"
 
 
+# 每个会话最多排队的指令数，超出时丢弃最早的一条
+SESSION_QUEUE_MAXLEN = 256
+
+
 def new_id(prefix: str) -> str:
-    return f"{prefix}_{uuid.uuid4().hex}"
+    # 64 位随机数足够区分会话，省去构造 UUID 对象
+    return f"{prefix}_{os.urandom(8).hex()}"
+
+
+def new_run_id() -> str:
+    # 运行记录需要追溯，保留完整 uuid4
+    return f"run_{uuid.uuid4().hex}"
 
 
 @dataclass
@@ -35,10 +46,15 @@ class Session:
     current_run_id: Optional[str] = None
     resume_id: Optional[str] = None
     last_result: Optional[str] = None
+    # last_result 的去重摘要，由编排器首次用到时计算；last_result 变化时清空
+    last_result_hash: Optional[str] = None
     jsonl_last_ts: Optional[float] = None
     jsonl_last_hash: Optional[str] = None
     last_chat_id: Optional[int] = None
-    queue: Deque[str] = field(default_factory=deque)
+    # 排队指令与提交时附带的回调成对保存
+    queue: Deque[tuple[str, Any]] = field(
+        default_factory=lambda: deque(maxlen=SESSION_QUEUE_MAXLEN)
+    )
     last_activity: float = field(default_factory=time.time)
 
 
@@ -1,20 +1,66 @@
 import asyncio
+import functools
 import hashlib
-import json
 import logging
 import os
 import time
-from dataclasses import dataclass
-from typing import Awaitable, Callable, Optional
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterable, Optional
 
 from .config import Config
-from .models import Run, RunStatus, SessionState, new_id
+from .models import Run, RunStatus, Session, SessionState
 from .session_manager import SessionManager
 from .store import Store
 from .codex_runner import CodexRunner
 from .stream_broker import StreamBroker
 
 
+_DIGEST_PREFIX = "b2:"
+# 只有这两类记录会产出消息；不含标记的行（工具调用、token 统计等）直接跳过，不做 JSON 解码
+_JSONL_MESSAGE_MARKER = b'"response_item"'
+_JSONL_REASONING_MARKER = b'"agent_reasoning"'
+# 每个 (bot_id, resume_id) 的同步状态都持有一个打开的文件，按 LRU 限制数量
+_JSONL_STATES_MAXLEN = 256
+_JSONL_OPEN_FLAGS = os.O_RDONLY | getattr(os, "O_CLOEXEC", 0)
+_O_NOATIME = getattr(os, "O_NOATIME", 0)
+
+
+def _open_jsonl(path: str):
+    # O_NOATIME 避免每次读取都回写 atime；非文件属主时内核返回 EPERM，退回普通只读
+    try:
+        fd = os.open(path, _JSONL_OPEN_FLAGS | _O_NOATIME)
+    except PermissionError:
+        fd = os.open(path, _JSONL_OPEN_FLAGS)
+    return os.fdopen(fd, "rb", buffering=0)
+
+
+def _dedupe_hexdigest(text: str) -> str:
+    # 摘要只做相等比较，16 字节 blake2b 比 SHA-256 快；加前缀与历史记录区分
+    return _DIGEST_PREFIX + hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _sha256_hexdigest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8"), usedforsecurity=False).hexdigest()
+
+
+def _matches_stored_digest(normalized: str, digest: str, stored: Optional[str]) -> bool:
+    if not stored:
+        return False
+    if stored == digest:
+        return True
+    # 升级前 jsonl_last_hash 持久化的是无前缀 SHA-256，仍按旧算法比较
+    return not stored.startswith(_DIGEST_PREFIX) and _sha256_hexdigest(normalized) == stored
+
+
+# 固定文案的运行结果摘要；ERROR 需要拼接错误详情，单独处理
+_RUN_SUMMARIES = {
+    RunStatus.DONE: "运行完成。",
+    RunStatus.CANCELED: "运行已取消。",
+    RunStatus.TIMEOUT: "运行超时。",
+}
+
+
 @dataclass
 class _JsonlSyncState:
     path: Optional[str] = None
@@ -22,12 +68,35 @@ class _JsonlSyncState:
     offset: int = 0
     handle: Optional[object] = None
     last_reasoning_at: float = 0.0
+    # 上次读取末尾不完整的一行，等下次读到换行再解析
+    pending: bytearray = field(default_factory=bytearray)
+    # 重启后从库中恢复的各用户读取位置 (offset, inode)，首次打开文件时取 inode 一致的最小值
+    hydrated: bool = False
+    saved_positions: list[tuple[int, int]] = field(default_factory=list)
+    persisted_offset: Optional[int] = None
+    # 上次读到文件末尾时的 (mtime_ns, size)，以及已确认在库中有同步游标的用户
+    signature: Optional[tuple[int, int]] = None
+    synced_users: set[int] = field(default_factory=set)
+
+    def reset(self) -> None:
+        if self.handle is not None:
+            try:
+                self.handle.close()
+            except OSError:
+                pass
+        self.handle = None
+        self.path = None
+        self.inode = None
+        self.offset = 0
+        self.signature = None
+        self.pending.clear()
 
 
 @dataclass
 class ExternalMessage:
     text: str
     is_progress: bool = False
+    normalized: Optional[str] = None
 
 
 SendTextFunc = Callable[[str], Awaitable[None]]
@@ -48,10 +117,13 @@ class Orchestrator:
         self._store = store
         self._runner = runner
         self._bot_id = bot_id
+        # 只在事件循环线程里读写，检查与登记之间没有 await，无需额外加锁
         self._active_tasks: dict[int, asyncio.Task] = {}
-        self._active_lock = asyncio.Lock()
+        self._current_runs: dict[int, asyncio.Task] = {}
         self._logger = logging.getLogger(__name__)
-        self._jsonl_states: dict[str, _JsonlSyncState] = {}
+        self._jsonl_states: OrderedDict[str, _JsonlSyncState] = OrderedDict()
+        self._reasoning_summary = config.jsonl_reasoning_mode.strip().lower() == "summary"
+        self._dedupe_digest = functools.lru_cache(maxsize=1024)(self._compute_dedupe_digest)
 
     async def submit_prompt(
         self,
@@ -61,34 +133,67 @@ class Orchestrator:
         send_stream: StreamSendFunc,
     ) -> None:
         session = await self._session_manager.get_or_create(user_id, self._bot_id)
-        self._store.record_message(session.session_id, "user", prompt)
-
-        async with self._active_lock:
-            active_task = self._active_tasks.get(user_id)
-            if active_task and not active_task.done():
-                await self._session_manager.enqueue_prompt(user_id, prompt, self._bot_id)
-                queued = await self._session_manager.peek_queue(user_id, self._bot_id)
-                await send_status(
-                    f"已收到新指令，当前任务结束后执行。排队中：{queued}"
-                )
-                return
+        self._store.submit(self._store.record_message, session.session_id, "user", prompt)
+
+        active_task = self._active_tasks.get(user_id)
+        if active_task and not active_task.done():
+            # 检查与入队之间没有 await：消费者要么还没做出队判断、会取到这条，
+            # 要么已经注销，这里就走不到
+            queued = self._session_manager.push_prompt(
+                session, prompt, (send_status, send_stream)
+            )
+            await send_status(f"已收到新指令，当前任务结束后执行。排队中：{queued}")
+            return
+
+        task = asyncio.create_task(
+            self._consume_prompts(user_id, prompt, send_status, send_stream)
+        )
+        self._active_tasks[user_id] = task
+        self._logger.info("启动任务 user_id=%s bot_id=%s", user_id, self._bot_id)
 
-            resume_id = session.resume_id
-            task = asyncio.create_task(
-                self._run_once(user_id, prompt, send_status, send_stream, resume_id)
+    async def _consume_prompts(
+        self,
+        user_id: int,
+        prompt: str,
+        send_status: SendTextFunc,
+        send_stream: StreamSendFunc,
+    ) -> None:
+        next_item: Optional[tuple[str, Any]] = (prompt, (send_status, send_stream))
+        while next_item:
+            next_prompt, callbacks = next_item
+            if callbacks is not None:
+                send_status, send_stream = callbacks
+            session = await self._session_manager.get_or_create(user_id, self._bot_id)
+            run_task = asyncio.create_task(
+                self._run_once(user_id, next_prompt, send_status, send_stream, session.resume_id)
             )
-            self._active_tasks[user_id] = task
-            self._logger.info("启动任务 user_id=%s bot_id=%s", user_id, self._bot_id)
+            self._current_runs[user_id] = run_task
+            try:
+                await asyncio.wait((run_task,))
+            except asyncio.CancelledError:
+                run_task.cancel()
+                raise
+            if not run_task.cancelled() and run_task.exception() is not None:
+                self._logger.error(
+                    "任务异常 user_id=%s bot_id=%s err=%s",
+                    user_id,
+                    self._bot_id,
+                    run_task.exception(),
+                )
+            # 出队判断与下面的注销之间不能有 await，否则期间入队的指令无人消费
+            next_item = self._session_manager.pop_prompt(session)
+        self._active_tasks.pop(user_id, None)
+        self._current_runs.pop(user_id, None)
+        await send_status("等待新指令。")
 
     async def cancel_run(self, user_id: int, send_status: SendTextFunc) -> None:
-        async with self._active_lock:
-            task = self._active_tasks.get(user_id)
-            if not task or task.done():
-                await send_status("当前没有运行中的任务。")
-                return
-            task.cancel()
-            await send_status("已请求停止当前任务。")
-            self._logger.info("取消任务 user_id=%s", user_id)
+        task = self._current_runs.get(user_id)
+        if not task or task.done():
+            await send_status("当前没有运行中的任务。")
+            return
+        task.cancel()
+        await send_status("已请求停止当前任务。")
+        self._logger.info("取消任务 user_id=%s", user_id)
 
     async def status(self, user_id: int, send_status: SendTextFunc) -> None:
         session = await self._session_manager.get_or_create(user_id, self._bot_id)
@@ -109,27 +214,25 @@ class Orchestrator:
     async def set_chat_id(self, user_id: int, chat_id: int) -> None:
         await self._session_manager.set_chat_id(user_id, chat_id, self._bot_id)
 
-    def get_last_chat_id(self, user_id: int) -> Optional[int]:
-        return self._store.get_last_chat_id_by_user_id(user_id, self._bot_id)
+    async def get_last_chat_id(self, user_id: int) -> Optional[int]:
+        return await self._store.read(
+            self._store.get_last_chat_id_by_user_id, user_id, self._bot_id
+        )
 
     def _extract_jsonl_message(
         self, data: dict
     ) -> tuple[Optional[float], Optional[str]]:
         timestamp = self._runner.parse_timestamp(data.get("timestamp"))
-        if data.get("type") != "response_item":
+        payload = data.get("payload")
+        if data.get("type") != "response_item" or not payload:
             return timestamp, None
-        payload = data.get("payload") or {}
-        if payload.get("type") != "message":
-            return timestamp, None
-        if payload.get("role") != "assistant":
+        if (payload.get("type"), payload.get("role")) != ("message", "assistant"):
             return timestamp, None
-        content = payload.get("content") or []
-        parts = []
-        for item in content:
-            if item.get("type") == "output_text":
-                text = item.get("text")
-                if text:
-                    parts.append(text)
+        parts = [
+            text
+            for item in payload.get("content") or ()
+            if item.get("type") == "output_text" and (text := item.get("text"))
+        ]
         if not parts:
             return timestamp, None
         return timestamp, "\n".join(parts).strip()
@@ -146,125 +249,271 @@ class Orchestrator:
         text = payload.get("text")
         if not text:
             return timestamp, None
-        mode = self._config.jsonl_reasoning_mode.strip().lower()
-        if mode == "summary":
+        if self._reasoning_summary:
             return timestamp, CodexRunner._summarize_reasoning(text)
         return timestamp, None
 
-    async def poll_external_results(
-        self, user_id: int, allow_send: bool
-    ) -> list[ExternalMessage]:
-        resume_id = await self.get_resume_id(user_id)
-        if not resume_id:
-            return []
-        session = await self._session_manager.get_or_create(user_id, self._bot_id)
-        last_result_hash = None
-        if session.last_result:
-            normalized = self._runner.normalize_text_for_dedupe(session.last_result)
-            if normalized:
-                last_result_hash = hashlib.sha256(
-                    normalized.encode("utf-8")
-                ).hexdigest()
-        last_ts, last_hash = self._store.get_jsonl_state_by_user_id(user_id, self._bot_id)
-        state_key = f"{self._bot_id}:{resume_id}"
-        state = self._jsonl_states.setdefault(state_key, _JsonlSyncState())
+    def _compute_dedupe_digest(self, text: str) -> tuple[str, str]:
+        normalized = self._runner.normalize_text_for_dedupe(text)
+        return normalized, _dedupe_hexdigest(normalized)
+
+    def _jsonl_state(self, key: str) -> _JsonlSyncState:
+        state = self._jsonl_states.get(key)
+        if state is not None:
+            self._jsonl_states.move_to_end(key)
+            return state
+        state = self._jsonl_states[key] = _JsonlSyncState()
+        if len(self._jsonl_states) > _JSONL_STATES_MAXLEN:
+            _, evicted = self._jsonl_states.popitem(last=False)
+            evicted.reset()
+        return state
+
+    def _read_jsonl_lines(
+        self, state: _JsonlSyncState, resume_id: str, read: bool
+    ) -> Optional[list[bytearray]]:
         path = self._runner.find_session_file(resume_id)
         if not path:
-            return []
-
-        def reset_handle() -> None:
-            if state.handle is not None:
-                try:
-                    state.handle.close()
-                except OSError:
-                    pass
-            state.handle = None
-            state.path = None
-            state.inode = None
-            state.offset = 0
+            return None
 
         if state.path != path:
-            reset_handle()
+            state.reset()
 
         if state.handle is None:
             try:
-                state.handle = open(path, "r", encoding="utf-8", errors="replace")
+                state.handle = _open_jsonl(path)
                 stat = os.fstat(state.handle.fileno())
                 state.inode = stat.st_ino
                 state.path = path
+                offsets = [
+                    offset
+                    for offset, inode in state.saved_positions
+                    if inode == stat.st_ino and offset <= stat.st_size
+                ]
+                if offsets:
+                    state.offset = min(offsets)
+                    state.persisted_offset = state.offset
+                state.saved_positions.clear()
             except OSError:
-                reset_handle()
-                return []
+                state.reset()
+                return None
 
         try:
             stat = os.stat(path)
         except OSError:
-            reset_handle()
-            return []
+            state.reset()
+            return None
         if state.inode is not None and stat.st_ino != state.inode:
-            reset_handle()
-            return []
+            state.reset()
+            return None
         if stat.st_size < state.offset:
-            reset_handle()
+            state.reset()
+            return None
+        if not read:
+            return []
+        state.signature = (stat.st_mtime_ns, stat.st_size)
+        if stat.st_size == state.offset:
             return []
 
-        if last_ts is None and last_hash is None:
-            baseline = time.time()
-            self._store.update_session_jsonl_state(session.session_id, baseline, None)
+        try:
+            data = os.pread(state.handle.fileno(), stat.st_size - state.offset, state.offset)
+        except OSError:
+            state.reset()
+            return None
+        state.offset += len(data)
+        pending = state.pending
+        pending.extend(data)
+        end = pending.rfind(b"\n")
+        if end == -1:
             return []
+        lines = pending[:end].split(b"\n")
+        del pending[: end + 1]
+        return lines
 
-        state.handle.seek(state.offset)
-        messages: list[ExternalMessage] = []
-        updated = False
-        for raw_line in state.handle:
+    def _jsonl_unchanged(self, state: _JsonlSyncState, resume_id: str) -> bool:
+        if state.signature is None:
+            return False
+        path = self._runner.find_session_file(resume_id)
+        if path != state.path:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return (stat.st_mtime_ns, stat.st_size) == state.signature
+
+    async def poll_external_results(
+        self, user_id: int, allow_send: bool
+    ) -> list[ExternalMessage]:
+        results = await self.poll_external_results_batch([user_id])
+        return results.get(user_id, [])
+
+    async def poll_external_results_batch(
+        self, user_ids: Iterable[int]
+    ) -> dict[int, list[ExternalMessage]]:
+        groups: dict[str, list[int]] = {}
+        for user_id in user_ids:
+            resume_id = await self.get_resume_id(user_id)
+            if resume_id:
+                groups.setdefault(resume_id, []).append(user_id)
+        results: dict[int, list[ExternalMessage]] = {}
+        for resume_id, group in groups.items():
+            try:
+                await self._poll_jsonl_group(resume_id, group, results)
+            except Exception as exc:
+                self._logger.warning(
+                    "JSONL 同步失败 resume_id=%s user_ids=%s err=%s", resume_id, group, exc
+                )
+        return results
+
+    async def _poll_jsonl_group(
+        self, resume_id: str, user_ids: list[int], results: dict[int, list[ExternalMessage]]
+    ) -> None:
+        state_key = f"{self._bot_id}:{resume_id}"
+        state = self._jsonl_state(state_key)
+        if state.synced_users.issuperset(user_ids) and await asyncio.to_thread(
+            self._jsonl_unchanged, state, resume_id
+        ):
+            for user_id in user_ids:
+                results[user_id] = []
+            return
+        sessions = {}
+        cursors = {}
+        for user_id in user_ids:
+            sessions[user_id] = await self._session_manager.get_or_create(user_id, self._bot_id)
+            cursors[user_id] = await self._store.read(
+                self._store.get_jsonl_state_by_user_id, user_id, self._bot_id
+            )
+        if not state.hydrated:
+            # 组内各用户的位置可能不同，取最小的才不会漏掉任何人还没收到的行
+            for user_id in user_ids:
+                offset, inode = await self._store.read(
+                    self._store.get_jsonl_position_by_user_id, user_id, self._bot_id
+                )
+                if offset is not None and inode is not None:
+                    state.saved_positions.append((offset, inode))
+            state.hydrated = True
+        baseline_users = {
+            user_id
+            for user_id, (last_ts, last_hash) in cursors.items()
+            if last_ts is None and last_hash is None
+        }
+        lines = await asyncio.to_thread(
+            self._read_jsonl_lines, state, resume_id, len(baseline_users) < len(user_ids)
+        )
+        if lines is None:
+            return
+
+        for user_id in baseline_users:
+            await self._store.call(
+                self._store.update_session_jsonl_state,
+                sessions[user_id].session_id,
+                time.time(),
+                None,
+            )
+            results[user_id] = []
+
+        records = self._parse_jsonl_records(state, lines)
+        position = state.offset - len(state.pending)
+        position_changed = position != state.persisted_offset
+        for user_id in user_ids:
+            if user_id in baseline_users:
+                continue
+            last_ts, last_hash = cursors[user_id]
+            results[user_id] = await self._apply_jsonl_records(
+                user_id,
+                sessions[user_id],
+                records,
+                last_ts,
+                last_hash,
+                position if position_changed else None,
+                state.inode,
+            )
+        if len(baseline_users) < len(user_ids):
+            state.persisted_offset = position
+        state.synced_users.update(user_ids)
+
+    def _parse_jsonl_records(
+        self, state: _JsonlSyncState, lines: list[bytearray]
+    ) -> list[tuple[bool, Optional[float], str]]:
+        records: list[tuple[bool, Optional[float], str]] = []
+        throttle = self._config.jsonl_reasoning_throttle_seconds
+        for raw_line in lines:
             line = raw_line.strip()
             if not line:
                 continue
-            try:
-                data = json.loads(line)
-            except json.JSONDecodeError:
+            if _JSONL_MESSAGE_MARKER not in line and _JSONL_REASONING_MARKER not in line:
+                continue
+            data = CodexRunner.loads_jsonl_line(line)
+            if data is None:
                 continue
             progress_ts, progress_text = self._extract_jsonl_progress(data)
             if progress_text:
                 now = time.monotonic()
-                if (
-                    self._config.jsonl_reasoning_throttle_seconds > 0
-                    and now - state.last_reasoning_at
-                    < self._config.jsonl_reasoning_throttle_seconds
-                ):
+                if throttle > 0 and now - state.last_reasoning_at < throttle:
                     continue
                 state.last_reasoning_at = now
-                messages.append(ExternalMessage(progress_text, is_progress=True))
-                if progress_ts is not None:
-                    last_ts = max(last_ts or progress_ts, progress_ts)
-                    updated = True
+                records.append((True, progress_ts, progress_text))
                 continue
             timestamp, text = self._extract_jsonl_message(data)
             if not text or timestamp is None:
                 continue
+            records.append((False, timestamp, text))
+        return records
+
+    async def _apply_jsonl_records(
+        self,
+        user_id: int,
+        session: Session,
+        records: list[tuple[bool, Optional[float], str]],
+        last_ts: Optional[float],
+        last_hash: Optional[str],
+        position: Optional[int],
+        inode: Optional[int],
+    ) -> list[ExternalMessage]:
+        last_result_hash = None
+        if session.last_result:
+            if session.last_result_hash is None:
+                normalized, digest = self._dedupe_digest(session.last_result)
+                # 归一化后为空记为 ""，同样视为无摘要，但不必每次轮询重算
+                session.last_result_hash = digest if normalized else ""
+            last_result_hash = session.last_result_hash
+        messages: list[ExternalMessage] = []
+        updated = False
+        for is_progress, timestamp, text in records:
+            if is_progress:
+                normalized, _ = self._dedupe_digest(text)
+                messages.append(ExternalMessage(text, is_progress=True, normalized=normalized))
+                if timestamp is not None:
+                    last_ts = max(last_ts or timestamp, timestamp)
+                    updated = True
+                continue
             if last_ts is not None and timestamp < last_ts:
                 continue
-            normalized = self._runner.normalize_text_for_dedupe(text)
-            digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+            normalized, digest = self._dedupe_digest(text)
             if last_result_hash and digest == last_result_hash:
                 last_ts = max(last_ts or timestamp, timestamp)
                 last_hash = digest
                 updated = True
                 continue
-            if last_hash and digest == last_hash:
+            if _matches_stored_digest(normalized, digest, last_hash):
                 last_ts = max(last_ts or timestamp, timestamp)
                 updated = True
                 continue
-            messages.append(ExternalMessage(text, is_progress=False))
+            messages.append(ExternalMessage(text, is_progress=False, normalized=normalized))
             await self._session_manager.set_last_result(user_id, text, self._bot_id)
             last_ts = max(last_ts or timestamp, timestamp)
             last_hash = digest
             updated = True
-        state.offset = state.handle.tell()
 
-        if updated:
-            self._store.update_session_jsonl_state(
-                session.session_id, last_ts, last_hash
+        if updated or position is not None:
+            await self._store.call(
+                self._store.update_session_jsonl_state,
+                session.session_id,
+                last_ts,
+                last_hash,
+                None,
+                position,
+                inode,
             )
         return messages
 
@@ -277,13 +526,17 @@ class Orchestrator:
         session = await self._session_manager.get_or_create(user_id, self._bot_id)
         result = session.last_result
         if not result:
-            result = self._store.get_last_result_by_user_id(user_id, self._bot_id)
+            result = await self._store.read(
+                self._store.get_last_result_by_user_id, user_id, self._bot_id
+            )
             if result:
                 await self._session_manager.set_last_result(user_id, result, self._bot_id)
         if not result:
             resume_id = session.resume_id or self._config.codex_cli_resume_id
             if resume_id:
-                result = self._runner.read_last_assistant_message(resume_id)
+                result = await asyncio.to_thread(
+                    self._runner.read_last_assistant_message, resume_id
+                )
                 if result:
                     await self._session_manager.set_last_result(user_id, result, self._bot_id)
         if not result:
@@ -317,10 +570,7 @@ class Orchestrator:
         send_stream: StreamSendFunc,
         resume_id: Optional[str],
     ) -> None:
-        session = await self._session_manager.set_state(user_id, SessionState.RUNNING, self._bot_id)
-        run = Run(run_id=new_id("run"), session_id=session.session_id, prompt=prompt)
-        self._store.record_run(run)
-        await self._session_manager.set_current_run(user_id, run.run_id, self._bot_id)
+        run = await self._session_manager.start_run(user_id, prompt, self._bot_id)
         self._logger.info("任务开始 run_id=%s user_id=%s bot_id=%s", run.run_id, user_id, self._bot_id)
 
         await send_status("已开始执行。")
@@ -370,40 +620,16 @@ class Orchestrator:
         finally:
             run.finished_at = time.time()
             await broker.stop()
-            self._store.update_run(run.run_id, run.status, run.finished_at, run.error)
-            if final_message:
-                await self._session_manager.set_last_result(user_id, final_message, self._bot_id)
-            await self._session_manager.set_current_run(user_id, None, self._bot_id)
-            await self._session_manager.set_state(user_id, SessionState.IDLE, self._bot_id)
+            await self._session_manager.finish_run(
+                user_id, run, final_message or None, self._bot_id
+            )
             self._logger.info(
                 "任务结束 run_id=%s status=%s bot_id=%s", run.run_id, run.status.value, self._bot_id
             )
             await send_status(self._format_run_summary(run))
-            await self._post_run_cleanup(user_id, send_status, send_stream)
-
-    async def _post_run_cleanup(
-        self,
-        user_id: int,
-        send_status: SendTextFunc,
-        send_stream: StreamSendFunc,
-    ) -> None:
-        async with self._active_lock:
-            self._active_tasks.pop(user_id, None)
-
-        queued_prompt = await self._session_manager.dequeue_prompt(user_id, self._bot_id)
-        if queued_prompt:
-            await self.submit_prompt(user_id, queued_prompt, send_status, send_stream)
-        else:
-            await send_status("等待新指令。")
 
     def _format_run_summary(self, run: Run) -> str:
-        if run.status == RunStatus.DONE:
-            return "运行完成。"
-        if run.status == RunStatus.CANCELED:
-            return "运行已取消。"
-        if run.status == RunStatus.TIMEOUT:
-            return "运行超时。"
         if run.status == RunStatus.ERROR:
             detail = run.error or "未知错误"
             return f"运行失败：{detail}"
-        return "运行结束。"
+        return _RUN_SUMMARIES.get(run.status, "运行结束。")
@@ -1,8 +1,9 @@
 import asyncio
+import logging
 import time
-from typing import Optional
+from typing import Any, Optional
 
-from .models import Session, SessionState
+from .models import Run, Session, SessionState, new_run_id
 from .store import Store
 
 
@@ -10,95 +11,181 @@ class SessionManager:
     def __init__(self, store: Store) -> None:
         self._store = store
         self._sessions: dict[tuple[str, int], Session] = {}
-        self._lock = asyncio.Lock()
+        # 每个 (bot_id, user_id) 一把锁，不同用户的会话操作互不等待
+        self._locks: dict[tuple[str, int], asyncio.Lock] = {}
+        self._logger = logging.getLogger(__name__)
 
-    def _get_or_create_locked(self, bot_id: str, user_id: int) -> Session:
+    def _lock_for(self, bot_id: str, user_id: int) -> asyncio.Lock:
+        # 单事件循环内查找与插入之间没有 await，无需再用全局锁保护字典
+        lock = self._locks.get((bot_id, user_id))
+        if lock is None:
+            lock = self._locks[(bot_id, user_id)] = asyncio.Lock()
+        return lock
+
+    async def _get_or_create_locked(self, bot_id: str, user_id: int) -> Session:
         session = self._sessions.get((bot_id, user_id))
         if session is None:
             session = Session(user_id=user_id, bot_id=bot_id)
             self._sessions[(bot_id, user_id)] = session
-            self._store.record_session(session)
+            await self._store.call(self._store.record_session, session)
         return session
 
     async def get_or_create(self, user_id: int, bot_id: str = "default") -> Session:
-        async with self._lock:
-            session = self._get_or_create_locked(bot_id, user_id)
+        async with self._lock_for(bot_id, user_id):
+            session = await self._get_or_create_locked(bot_id, user_id)
             session.last_activity = time.time()
             return session
 
     async def set_state(self, user_id: int, state: SessionState, bot_id: str = "default") -> Session:
-        async with self._lock:
-            session = self._get_or_create_locked(bot_id, user_id)
+        async with self._lock_for(bot_id, user_id):
+            session = await self._get_or_create_locked(bot_id, user_id)
             session.state = state
             session.last_activity = time.time()
-            self._store.update_session_state(session.session_id, state)
+            await self._store.call(
+                self._store.update_session_state, session.session_id, state, session.last_activity
+            )
             return session
 
     async def set_current_run(self, user_id: int, run_id: Optional[str], bot_id: str = "default") -> Session:
-        async with self._lock:
-            session = self._get_or_create_locked(bot_id, user_id)
+        async with self._lock_for(bot_id, user_id):
+            session = await self._get_or_create_locked(bot_id, user_id)
             session.current_run_id = run_id
             session.last_activity = time.time()
             return session
 
     async def set_resume_id(self, user_id: int, resume_id: Optional[str], bot_id: str = "default") -> Session:
-        async with self._lock:
-            session = self._get_or_create_locked(bot_id, user_id)
+        async with self._lock_for(bot_id, user_id):
+            session = await self._get_or_create_locked(bot_id, user_id)
             session.resume_id = resume_id
             session.last_activity = time.time()
-            self._store.update_session_resume_id(session.session_id, resume_id)
+            await self._store.call(
+                self._store.update_session_resume_id,
+                session.session_id,
+                resume_id,
+                session.last_activity,
+            )
             return session
 
     async def set_last_result(self, user_id: int, last_result: Optional[str], bot_id: str = "default") -> Session:
-        async with self._lock:
-            session = self._get_or_create_locked(bot_id, user_id)
+        async with self._lock_for(bot_id, user_id):
+            session = await self._get_or_create_locked(bot_id, user_id)
             session.last_result = last_result
+            session.last_result_hash = None
             session.last_activity = time.time()
-            self._store.update_session_last_result(session.session_id, last_result)
+            await self._store.call(
+                self._store.update_session_last_result,
+                session.session_id,
+                last_result,
+                session.last_activity,
+            )
             return session
 
     async def set_jsonl_state(
         self, user_id: int, last_ts: Optional[float], last_hash: Optional[str], bot_id: str = "default"
     ) -> Session:
-        async with self._lock:
-            session = self._get_or_create_locked(bot_id, user_id)
+        async with self._lock_for(bot_id, user_id):
+            session = await self._get_or_create_locked(bot_id, user_id)
             session.jsonl_last_ts = last_ts
             session.jsonl_last_hash = last_hash
             session.last_activity = time.time()
-            self._store.update_session_jsonl_state(
-                session.session_id, last_ts, last_hash
+            await self._store.call(
+                self._store.update_session_jsonl_state,
+                session.session_id,
+                last_ts,
+                last_hash,
+                session.last_activity,
             )
             return session
 
     async def set_chat_id(self, user_id: int, chat_id: int, bot_id: str = "default") -> Session:
-        async with self._lock:
-            session = self._get_or_create_locked(bot_id, user_id)
+        async with self._lock_for(bot_id, user_id):
+            session = await self._get_or_create_locked(bot_id, user_id)
             session.last_chat_id = chat_id
             session.last_activity = time.time()
-            self._store.update_session_chat_id(session.session_id, chat_id)
+            await self._store.call(
+                self._store.update_session_chat_id,
+                session.session_id,
+                chat_id,
+                session.last_activity,
+            )
             if session.jsonl_last_ts is None and session.jsonl_last_hash is None:
-                session.jsonl_last_ts = time.time()
-                self._store.update_session_jsonl_state(
-                    session.session_id, session.jsonl_last_ts, session.jsonl_last_hash
+                session.jsonl_last_ts = session.last_activity
+                await self._store.call(
+                    self._store.update_session_jsonl_state,
+                    session.session_id,
+                    session.jsonl_last_ts,
+                    session.jsonl_last_hash,
+                    session.last_activity,
                 )
             return session
 
-    async def enqueue_prompt(self, user_id: int, prompt: str, bot_id: str = "default") -> Session:
-        async with self._lock:
-            session = self._get_or_create_locked(bot_id, user_id)
-            session.queue.append(prompt)
+    async def start_run(self, user_id: int, prompt: str, bot_id: str = "default") -> Run:
+        # 取会话、生成运行记录、置为运行中在同一次加锁内完成
+        async with self._lock_for(bot_id, user_id):
+            session = await self._get_or_create_locked(bot_id, user_id)
+            run = Run(run_id=new_run_id(), session_id=session.session_id, prompt=prompt)
+            session.state = SessionState.RUNNING
+            session.current_run_id = run.run_id
+            session.last_activity = time.time()
+            await self._store.call(
+                self._store.begin_run, run, SessionState.RUNNING, session.last_activity
+            )
+            return run
+
+    async def finish_run(
+        self, user_id: int, run: Run, last_result: Optional[str], bot_id: str = "default"
+    ) -> Session:
+        async with self._lock_for(bot_id, user_id):
+            session = await self._get_or_create_locked(bot_id, user_id)
+            if last_result is not None:
+                session.last_result = last_result
+                session.last_result_hash = None
+            session.current_run_id = None
+            session.state = SessionState.IDLE
             session.last_activity = time.time()
+            await self._store.call(
+                self._store.finish_run,
+                run,
+                SessionState.IDLE,
+                last_result,
+                session.last_activity,
+            )
             return session
 
+    # 排队指令只存在内存里，入队/出队不碰存储，因此不取会话锁、中间也没有 await：
+    # 会话锁会跨存储调用持有，若在锁上等待，调用方的检查与入队/出队之间就可能被插队
+    def push_prompt(self, session: Session, prompt: str, payload: Any = None) -> int:
+        if len(session.queue) == session.queue.maxlen:
+            self._logger.warning(
+                "排队指令已满，丢弃最早的一条 user_id=%s bot_id=%s",
+                session.user_id,
+                session.bot_id,
+            )
+        session.queue.append((prompt, payload))
+        session.last_activity = time.time()
+        return len(session.queue)
+
+    def pop_prompt(self, session: Session) -> Optional[tuple[str, Any]]:
+        if not session.queue:
+            return None
+        session.last_activity = time.time()
+        return session.queue.popleft()
+
+    async def enqueue_prompt(self, user_id: int, prompt: str, bot_id: str = "default") -> Session:
+        session = await self.get_or_create(user_id, bot_id)
+        self.push_prompt(session, prompt)
+        return session
+
     async def dequeue_prompt(self, user_id: int, bot_id: str = "default") -> Optional[str]:
-        async with self._lock:
-            session = self._get_or_create_locked(bot_id, user_id)
-            if not session.queue:
-                return None
-            session.last_activity = time.time()
-            return session.queue.popleft()
+        session = await self.get_or_create(user_id, bot_id)
+        item = self.pop_prompt(session)
+        return item[0] if item is not None else None
 
     async def peek_queue(self, user_id: int, bot_id: str = "default") -> int:
-        async with self._lock:
-            session = self._get_or_create_locked(bot_id, user_id)
+        # 只读取队列长度，会话已存在时不必排队等锁
+        session = self._sessions.get((bot_id, user_id))
+        if session is not None:
+            return len(session.queue)
+        async with self._lock_for(bot_id, user_id):
+            session = await self._get_or_create_locked(bot_id, user_id)
             return len(session.queue)
@@ -1,16 +1,165 @@
+import asyncio
+import functools
+import logging
+import os
 import sqlite3
 import threading
 import time
-from typing import Optional
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator, Optional, TypeVar
 
 from .models import Run, Session, SessionState, RunStatus
 
+T = TypeVar("T")
+
+
+_SQL_INSERT_SESSION = """
+    INSERT OR REPLACE INTO sessions
+    (session_id, user_id, bot_id, state, resume_id, last_result, jsonl_last_ts, jsonl_last_hash, last_chat_id, created_at, last_activity)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+_SQL_UPDATE_SESSION_STATE = "UPDATE sessions SET state = ?, last_activity = ? WHERE session_id = ?"
+_SQL_UPDATE_SESSION_STATE_RESULT = """
+    UPDATE sessions
+    SET state = ?, last_result = ?, last_activity = ?
+    WHERE session_id = ?
+"""
+_SQL_UPDATE_SESSION_RESUME_ID = (
+    "UPDATE sessions SET resume_id = ?, last_activity = ? WHERE session_id = ?"
+)
+_SQL_UPDATE_SESSION_LAST_RESULT = (
+    "UPDATE sessions SET last_result = ?, last_activity = ? WHERE session_id = ?"
+)
+_SQL_UPDATE_SESSION_JSONL_STATE = """
+    UPDATE sessions
+    SET jsonl_last_ts = ?, jsonl_last_hash = ?, last_activity = ?,
+        jsonl_offset = COALESCE(?, jsonl_offset), jsonl_inode = COALESCE(?, jsonl_inode)
+    WHERE session_id = ?
+"""
+_SQL_UPDATE_SESSION_CHAT_ID = """
+    UPDATE sessions
+    SET last_chat_id = ?, last_activity = ?
+    WHERE session_id = ?
+"""
+_SQL_SELECT_LAST_RESULT = """
+    SELECT last_result
+    FROM sessions
+    WHERE user_id = ? AND (bot_id = ? OR bot_id IS NULL) AND last_result IS NOT NULL
+    ORDER BY last_activity DESC
+    LIMIT 1
+"""
+_SQL_SELECT_JSONL_STATE = """
+    SELECT jsonl_last_ts, jsonl_last_hash
+    FROM sessions
+    WHERE user_id = ? AND (bot_id = ? OR bot_id IS NULL)
+    ORDER BY last_activity DESC
+    LIMIT 1
+"""
+_SQL_SELECT_JSONL_POSITION = """
+    SELECT jsonl_offset, jsonl_inode
+    FROM sessions
+    WHERE user_id = ? AND (bot_id = ? OR bot_id IS NULL) AND jsonl_offset IS NOT NULL
+    ORDER BY last_activity DESC
+    LIMIT 1
+"""
+_SQL_SELECT_LAST_CHAT_ID = """
+    SELECT last_chat_id
+    FROM sessions
+    WHERE user_id = ? AND (bot_id = ? OR bot_id IS NULL) AND last_chat_id IS NOT NULL
+    ORDER BY last_activity DESC
+    LIMIT 1
+"""
+_SQL_INSERT_MESSAGE = "INSERT INTO messages (session_id, sender, content, ts) VALUES (?, ?, ?, ?)"
+_SQL_INSERT_RUN = """
+    INSERT INTO runs (run_id, session_id, status, prompt, started_at, finished_at, error)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+_SQL_UPDATE_RUN = "UPDATE runs SET status = ?, finished_at = ?, error = ? WHERE run_id = ?"
+
+
+def _activity_time(last_activity: Optional[float]) -> float:
+    return time.time() if last_activity is None else last_activity
+
 
 class Store:
     def __init__(self, db_path: str) -> None:
         self._db_path = db_path
-        self._conn = sqlite3.connect(self._db_path, check_same_thread=False)
+        # 写连接只有一个，由锁串行化；读走每线程各自的连接
+        self._conn = self._connect(check_same_thread=False)
         self._lock = threading.Lock()
+        self._local = threading.local()
+        self._readers: list[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._logger = logging.getLogger(__name__)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store")
+        self._read_executor = ThreadPoolExecutor(
+            max_workers=min(4, os.cpu_count() or 1), thread_name_prefix="store-read"
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+    def _connect(self, check_same_thread: bool = True) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self._db_path, check_same_thread=check_same_thread, cached_statements=256
+        )
+        for pragma in (
+            "PRAGMA busy_timeout=5000",
+            "PRAGMA temp_store=MEMORY",
+            "PRAGMA mmap_size=268435456",
+            "PRAGMA cache_size=-20000",
+        ):
+            conn.execute(pragma)
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # 允许跨线程是为了 close() 能统一关闭，平时只由创建它的线程使用
+            conn = self._local.conn = self._connect(check_same_thread=False)
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self._read_executor.shutdown(wait=True)
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        with self._lock:
+            self._conn.close()
+
+    async def call(self, func: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    async def read(self, func: Callable[..., T], *args: Any) -> T:
+        # 只用于 get_* 查询；需要读到的写入必须已经 await 过 call
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, functools.partial(func, *args))
+
+    def submit(self, func: Callable[..., Any], *args: Any) -> None:
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(self._log_submit_failure)
+
+    def _log_submit_failure(self, future: Future) -> None:
+        exc = future.exception()
+        if exc is not None:
+            self._logger.warning("后台写入失败 err=%s", exc)
+
+    @contextmanager
+    def _tx(self) -> Iterator[sqlite3.Cursor]:
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                yield cur
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
 
     def _ensure_column(self, table: str, column: str, definition: str) -> None:
         cur = self._conn.cursor()
@@ -20,8 +169,7 @@ class Store:
             cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
 
     def init(self) -> None:
-        with self._lock:
-            cur = self._conn.cursor()
+        with self._tx() as cur:
             cur.execute(
                 """
                 CREATE TABLE IF NOT EXISTS users (
@@ -42,6 +190,8 @@ class Store:
                     last_result TEXT,
                     jsonl_last_ts REAL,
                     jsonl_last_hash TEXT,
+                    jsonl_offset INTEGER,
+                    jsonl_inode INTEGER,
                     last_chat_id INTEGER,
                     created_at REAL NOT NULL,
                     last_activity REAL NOT NULL
@@ -76,181 +226,192 @@ class Store:
             self._ensure_column("sessions", "last_result", "TEXT")
             self._ensure_column("sessions", "jsonl_last_ts", "REAL")
             self._ensure_column("sessions", "jsonl_last_hash", "TEXT")
+            self._ensure_column("sessions", "jsonl_offset", "INTEGER")
+            self._ensure_column("sessions", "jsonl_inode", "INTEGER")
             self._ensure_column("sessions", "last_chat_id", "INTEGER")
             self._ensure_column("sessions", "bot_id", "TEXT")
             cur.execute("UPDATE sessions SET bot_id = ? WHERE bot_id IS NULL", ("default",))
-            self._conn.commit()
-
-    def record_session(self, session: Session) -> None:
-        with self._lock:
-            cur = self._conn.cursor()
             cur.execute(
                 """
-                INSERT OR REPLACE INTO sessions
-                (session_id, user_id, bot_id, state, resume_id, last_result, jsonl_last_ts, jsonl_last_hash, last_chat_id, created_at, last_activity)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    session.session_id,
-                    session.user_id,
-                    session.bot_id,
-                    session.state.value,
-                    session.resume_id,
-                    session.last_result,
-                    session.jsonl_last_ts,
-                    session.jsonl_last_hash,
-                    session.last_chat_id,
-                    time.time(),
-                    session.last_activity,
-                ),
+                CREATE INDEX IF NOT EXISTS idx_sessions_user_activity
+                ON sessions(user_id, last_activity DESC)
+                """
             )
-            self._conn.commit()
 
-    def update_session_state(self, session_id: str, state: SessionState) -> None:
-        with self._lock:
-            cur = self._conn.cursor()
+    @staticmethod
+    def _session_row(session: Session, created_at: float) -> tuple:
+        return (
+            session.session_id,
+            session.user_id,
+            session.bot_id,
+            session.state.value,
+            session.resume_id,
+            session.last_result,
+            session.jsonl_last_ts,
+            session.jsonl_last_hash,
+            session.last_chat_id,
+            created_at,
+            session.last_activity,
+        )
+
+    def record_session(self, session: Session) -> None:
+        with self._tx() as cur:
+            cur.execute(_SQL_INSERT_SESSION, self._session_row(session, time.time()))
+
+    def record_sessions(self, sessions: Iterable[Session]) -> None:
+        now = time.time()
+        rows = [self._session_row(session, now) for session in sessions]
+        with self._tx() as cur:
+            cur.executemany(_SQL_INSERT_SESSION, rows)
+
+    def update_session_state(
+        self, session_id: str, state: SessionState, last_activity: Optional[float] = None
+    ) -> None:
+        with self._tx() as cur:
             cur.execute(
-                "UPDATE sessions SET state = ?, last_activity = ? WHERE session_id = ?",
-                (state.value, time.time(), session_id),
+                _SQL_UPDATE_SESSION_STATE,
+                (state.value, _activity_time(last_activity), session_id),
             )
-            self._conn.commit()
 
-    def update_session_resume_id(self, session_id: str, resume_id: str | None) -> None:
-        with self._lock:
-            cur = self._conn.cursor()
+    def update_session_resume_id(
+        self, session_id: str, resume_id: str | None, last_activity: Optional[float] = None
+    ) -> None:
+        with self._tx() as cur:
             cur.execute(
-                "UPDATE sessions SET resume_id = ?, last_activity = ? WHERE session_id = ?",
-                (resume_id, time.time(), session_id),
+                _SQL_UPDATE_SESSION_RESUME_ID,
+                (resume_id, _activity_time(last_activity), session_id),
             )
-            self._conn.commit()
 
     def update_session_last_result(
-        self, session_id: str, last_result: str | None
+        self, session_id: str, last_result: str | None, last_activity: Optional[float] = None
     ) -> None:
-        with self._lock:
-            cur = self._conn.cursor()
+        with self._tx() as cur:
             cur.execute(
-                "UPDATE sessions SET last_result = ?, last_activity = ? WHERE session_id = ?",
-                (last_result, time.time(), session_id),
+                _SQL_UPDATE_SESSION_LAST_RESULT,
+                (last_result, _activity_time(last_activity), session_id),
             )
-            self._conn.commit()
+
+    def update_sessions_last_result(
+        self, results: Iterable[tuple[str, str | None]], last_activity: Optional[float] = None
+    ) -> None:
+        activity = _activity_time(last_activity)
+        rows = [(last_result, activity, session_id) for session_id, last_result in results]
+        with self._tx() as cur:
+            cur.executemany(_SQL_UPDATE_SESSION_LAST_RESULT, rows)
 
     def get_last_result_by_user_id(self, user_id: int, bot_id: str = "default") -> Optional[str]:
-        with self._lock:
-            cur = self._conn.cursor()
-            cur.execute(
-                """
-                SELECT last_result
-                FROM sessions
-                WHERE user_id = ? AND (bot_id = ? OR bot_id IS NULL) AND last_result IS NOT NULL
-                ORDER BY last_activity DESC
-                LIMIT 1
-                """,
-                (user_id, bot_id),
-            )
-            row = cur.fetchone()
+        row = self._reader().execute(_SQL_SELECT_LAST_RESULT, (user_id, bot_id)).fetchone()
         return row[0] if row else None
 
     def update_session_jsonl_state(
-        self, session_id: str, last_ts: float | None, last_hash: str | None
+        self,
+        session_id: str,
+        last_ts: float | None,
+        last_hash: str | None,
+        last_activity: Optional[float] = None,
+        offset: Optional[int] = None,
+        inode: Optional[int] = None,
     ) -> None:
-        with self._lock:
-            cur = self._conn.cursor()
+        with self._tx() as cur:
             cur.execute(
-                """
-                UPDATE sessions
-                SET jsonl_last_ts = ?, jsonl_last_hash = ?, last_activity = ?
-                WHERE session_id = ?
-                """,
-                (last_ts, last_hash, time.time(), session_id),
+                _SQL_UPDATE_SESSION_JSONL_STATE,
+                (last_ts, last_hash, _activity_time(last_activity), offset, inode, session_id),
             )
-            self._conn.commit()
 
     def get_jsonl_state_by_user_id(
         self, user_id: int, bot_id: str = "default"
     ) -> tuple[Optional[float], Optional[str]]:
-        with self._lock:
-            cur = self._conn.cursor()
-            cur.execute(
-                """
-                SELECT jsonl_last_ts, jsonl_last_hash
-                FROM sessions
-                WHERE user_id = ? AND (bot_id = ? OR bot_id IS NULL)
-                ORDER BY last_activity DESC
-                LIMIT 1
-                """,
-                (user_id, bot_id),
-            )
-            row = cur.fetchone()
+        row = self._reader().execute(_SQL_SELECT_JSONL_STATE, (user_id, bot_id)).fetchone()
         if not row:
             return None, None
         return row[0], row[1]
 
-    def update_session_chat_id(self, session_id: str, chat_id: int) -> None:
-        with self._lock:
-            cur = self._conn.cursor()
+    def get_jsonl_position_by_user_id(
+        self, user_id: int, bot_id: str = "default"
+    ) -> tuple[Optional[int], Optional[int]]:
+        row = self._reader().execute(_SQL_SELECT_JSONL_POSITION, (user_id, bot_id)).fetchone()
+        if not row:
+            return None, None
+        return row[0], row[1]
+
+    def update_session_chat_id(
+        self, session_id: str, chat_id: int, last_activity: Optional[float] = None
+    ) -> None:
+        with self._tx() as cur:
             cur.execute(
-                """
-                UPDATE sessions
-                SET last_chat_id = ?, last_activity = ?
-                WHERE session_id = ?
-                """,
-                (chat_id, time.time(), session_id),
+                _SQL_UPDATE_SESSION_CHAT_ID,
+                (chat_id, _activity_time(last_activity), session_id),
             )
-            self._conn.commit()
 
     def get_last_chat_id_by_user_id(self, user_id: int, bot_id: str = "default") -> Optional[int]:
-        with self._lock:
-            cur = self._conn.cursor()
-            cur.execute(
-                """
-                SELECT last_chat_id
-                FROM sessions
-                WHERE user_id = ? AND (bot_id = ? OR bot_id IS NULL) AND last_chat_id IS NOT NULL
-                ORDER BY last_activity DESC
-                LIMIT 1
-                """,
-                (user_id, bot_id),
-            )
-            row = cur.fetchone()
+        row = self._reader().execute(_SQL_SELECT_LAST_CHAT_ID, (user_id, bot_id)).fetchone()
         return row[0] if row else None
 
     def record_message(self, session_id: str, sender: str, content: str) -> None:
-        with self._lock:
-            cur = self._conn.cursor()
+        with self._tx() as cur:
             cur.execute(
-                "INSERT INTO messages (session_id, sender, content, ts) VALUES (?, ?, ?, ?)",
+                _SQL_INSERT_MESSAGE,
                 (session_id, sender, content, time.time()),
             )
-            self._conn.commit()
+
+    @staticmethod
+    def _insert_run(cur: sqlite3.Cursor, run: Run) -> None:
+        cur.execute(
+            _SQL_INSERT_RUN,
+            (
+                run.run_id,
+                run.session_id,
+                run.status.value,
+                run.prompt,
+                run.started_at,
+                run.finished_at,
+                run.error,
+            ),
+        )
 
     def record_run(self, run: Run) -> None:
-        with self._lock:
-            cur = self._conn.cursor()
-            cur.execute(
-                """
-                INSERT INTO runs (run_id, session_id, status, prompt, started_at, finished_at, error)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    run.run_id,
-                    run.session_id,
-                    run.status.value,
-                    run.prompt,
-                    run.started_at,
-                    run.finished_at,
-                    run.error,
-                ),
-            )
-            self._conn.commit()
+        with self._tx() as cur:
+            self._insert_run(cur, run)
 
     def update_run(
         self, run_id: str, status: RunStatus, finished_at: Optional[float], error: Optional[str]
     ) -> None:
-        with self._lock:
-            cur = self._conn.cursor()
+        with self._tx() as cur:
             cur.execute(
-                "UPDATE runs SET status = ?, finished_at = ?, error = ? WHERE run_id = ?",
+                _SQL_UPDATE_RUN,
                 (status.value, finished_at, error, run_id),
             )
-            self._conn.commit()
+
+    def begin_run(
+        self, run: Run, state: SessionState, last_activity: Optional[float] = None
+    ) -> None:
+        with self._tx() as cur:
+            self._insert_run(cur, run)
+            cur.execute(
+                _SQL_UPDATE_SESSION_STATE,
+                (state.value, _activity_time(last_activity), run.session_id),
+            )
+
+    def finish_run(
+        self,
+        run: Run,
+        state: SessionState,
+        last_result: Optional[str] = None,
+        last_activity: Optional[float] = None,
+    ) -> None:
+        last_activity = _activity_time(last_activity)
+        with self._tx() as cur:
+            cur.execute(
+                _SQL_UPDATE_RUN,
+                (run.status.value, run.finished_at, run.error, run.run_id),
+            )
+            if last_result is None:
+                cur.execute(
+                    _SQL_UPDATE_SESSION_STATE,
+                    (state.value, last_activity, run.session_id),
+                )
+            else:
+                cur.execute(
+                    _SQL_UPDATE_SESSION_STATE_RESULT,
+                    (state.value, last_result, last_activity, run.session_id),
+                )
@@ -1,10 +1,15 @@
 import asyncio
 import time
-from typing import Awaitable, Callable, List
+from typing import Awaitable, Callable, Iterator, List, Optional
 
 
 SendFunc = Callable[[str, bool], Awaitable[None]]
 
+_STDERR_PREFIX = "[stderr] "
+_STDERR_LINE_BREAK = "\n" + _STDERR_PREFIX
+# 缓冲超过这么多个整包的字数时，push 就地等待一次刷新，发送跟不上时反压生产者
+_MAX_BUFFERED_CHUNKS = 8
+
 
 class StreamBroker:
     def __init__(
@@ -17,7 +22,15 @@ class StreamBroker:
         self._flush_interval = flush_interval
         self._chunk_limit = chunk_limit
         self._buffer: List[str] = []
-        self._lock = asyncio.Lock()
+        self._buffered_length = 0
+        # 最近一次追加的行及其连续重复次数，用于把重复的进度行折叠成一条
+        self._last_line: Optional[str] = None
+        self._last_count = 0
+        self._max_buffered_length = chunk_limit * _MAX_BUFFERED_CHUNKS
+        # 刷新循环与 push 触发的反压刷新互斥，保证各包按顺序发出
+        self._flush_lock = asyncio.Lock()
+        # 有待发送内容时才置位，空闲时刷新循环不再按固定间隔空转
+        self._pending = asyncio.Event()
         self._flush_task: asyncio.Task | None = None
         self._last_flush_at = 0.0
 
@@ -35,33 +48,109 @@ class StreamBroker:
         await self.flush(final=True)
 
     async def push(self, text: str, is_error: bool) -> None:
-        line = f"[stderr] {text}" if is_error else text
-        async with self._lock:
-            self._buffer.append(line)
+        # 单事件循环内 append 与 flush 的整体换出之间没有 await，追加本身无需加锁；
+        # 发送期间新到的输出落在换出后的新列表里，不会丢失
+        # 空行是正文排版（段落、代码块）的一部分，不参与重复折叠，原样保留
+        collapsible = bool(text.strip())
+        if is_error:
+            # 多行 stderr 每行都带前缀，按换行切包后每段仍能看出来源
+            text = _STDERR_PREFIX + text.replace("\n", _STDERR_LINE_BREAK)
+        if collapsible and text == self._last_line and self._buffer:
+            # 与上一行相同且尚未发出：原地改写为计数形式，不再追加
+            self._last_count += 1
+            previous = self._buffer[-1]
+            self._buffer[-1] = f"{text} (x{self._last_count})"
+            self._buffered_length += len(self._buffer[-1]) - len(previous)
+            return
+        self._last_line = text if collapsible else None
+        self._last_count = 1
+        self._buffer.append(text)
+        self._buffered_length += len(text) + 1
+        self._pending.set()
+        if self._buffered_length > self._max_buffered_length:
+            await self.flush(final=False)
 
     async def flush(self, final: bool = False) -> None:
-        async with self._lock:
+        async with self._flush_lock:
+            # 取走缓冲前清除待发送标记：显式 flush 过的内容不会再让刷新循环空醒一次，
+            # 发送期间新 push 的内容会重新置位
+            self._pending.clear()
             if not self._buffer:
                 return
-            content = "\n".join(self._buffer)
-            self._buffer.clear()
-
-        for chunk in self._split(content):
-            await self._send_func(chunk, final)
-        self._last_flush_at = time.monotonic()
+            buffer, self._buffer = self._buffer, []
+            # 每条计入了一个换行，减一即拼接后的总长；不超过上限时整体一次发出，不走分包
+            joined_length = self._buffered_length - 1
+            self._buffered_length = 0
+            if joined_length <= self._chunk_limit:
+                await self._send_func("\n".join(buffer), final)
+                self._last_flush_at = time.monotonic()
+                return
+            # 按顺序发送（下游会把相邻包追加到同一条消息），只有最后一包带 final，
+            # 前面的包不会各自触发一次强制编辑
+            previous: Optional[str] = None
+            for chunk in self._packets(buffer):
+                if previous is not None:
+                    await self._send_func(previous, False)
+                previous = chunk
+            if previous is not None:
+                await self._send_func(previous, final)
+            self._last_flush_at = time.monotonic()
 
     async def _flush_loop(self) -> None:
+        interval = self._flush_interval
+        deadline: Optional[float] = None
         while True:
-            await asyncio.sleep(self._flush_interval)
+            await self._pending.wait()
+            now = time.monotonic()
+            # 按固定节拍刷新：发送耗时计入节拍，落后时立即补发；
+            # 空闲超过一个间隔后从首条输出起重新计时，把窗口内的输出合并成一次发送
+            if deadline is None or deadline < now - interval:
+                deadline = now + interval
+            await asyncio.sleep(max(0.0, deadline - now))
             await self.flush(final=False)
+            deadline += interval
+
+    def _packets(self, buffer: List[str]) -> Iterator[str]:
+        # 按条目边界把相邻输出合并成不超过 chunk_limit 的包，不先拼接整个缓冲区
+        limit = self._chunk_limit
+        packet: List[str] = []
+        size = -1
+        for entry in buffer:
+            length = len(entry)
+            if length > limit:
+                # 单条超长输出优先在换行处切开，尾段继续与后续条目合并
+                if packet:
+                    yield "\n".join(packet)
+                pieces = self._split(entry)
+                yield from pieces[:-1]
+                entry = pieces[-1]
+                length = len(entry)
+                packet = []
+                size = -1
+            elif size + 1 + length > limit:
+                yield "\n".join(packet)
+                packet = []
+                size = -1
+            packet.append(entry)
+            size += 1 + length
+        if packet:
+            yield "\n".join(packet)
 
     def _split(self, content: str) -> list[str]:
-        if len(content) <= self._chunk_limit:
+        limit = self._chunk_limit
+        total = len(content)
+        if total <= limit:
             return [content]
         chunks = []
         start = 0
-        while start < len(content):
-            end = min(start + self._chunk_limit, len(content))
-            chunks.append(content[start:end])
-            start = end
+        while total - start > limit:
+            newline = content.rfind("\n", start + 1, start + limit + 1)
+            if newline == -1:
+                chunks.append(content[start : start + limit])
+                start += limit
+            else:
+                chunks.append(content[start:newline])
+                start = newline + 1
+        if start < total:
+            chunks.append(content[start:])
         return chunks
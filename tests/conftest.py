@@ -1,6 +1,76 @@
+import asyncio
 import os
+import shutil
 import sys
+from typing import Iterator
+
+import pytest
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover - uvloop 为可选依赖，缺失时使用标准事件循环
+    uvloop = None
 
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
+
+from src.config import Config  # noqa: E402
+from src.store import Store  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def event_loop_policy():
+    # 装了 uvloop 时异步测试也跑在 uvloop 上，与 new_event_loop 的选择保持一致
+    if uvloop is not None:
+        return uvloop.EventLoopPolicy()
+    return asyncio.DefaultEventLoopPolicy()
+
+
+@pytest.fixture(scope="session")
+def base_config() -> Config:
+    # Config 是冻结的 dataclass，各测试用 dataclasses.replace 覆盖自己关心的字段
+    return Config(
+        telegram_bot_token="token",
+        telegram_allowed_user_ids={1},
+        codex_cli_cmd="codex",
+        codex_cli_args=[],
+        codex_cli_input_mode="stdin",
+        codex_cli_resume_id=None,
+        codex_cli_approvals_mode="3",
+        codex_cli_skip_git_check=True,
+        codex_cli_use_pty=False,
+        codex_workdir=".",
+        stream_flush_interval=0.01,
+        stream_include_stderr=False,
+        progress_tick_interval=0.5,
+        run_timeout_seconds=5.0,
+        context_compaction_idle_timeout_seconds=60.0,
+        no_output_idle_timeout_seconds=900.0,
+        final_result_idle_timeout_seconds=30.0,
+        jsonl_sync_interval_seconds=0.0,
+        jsonl_stream_events=False,
+        jsonl_reasoning_throttle_seconds=10.0,
+        jsonl_reasoning_mode="hidden",
+        message_chunk_limit=1000,
+    )
+
+
+@pytest.fixture(scope="session")
+def store_template(tmp_path_factory) -> str:
+    # 建表、建索引只做一次；checkpoint 后主库文件已包含全部 schema，可直接复制
+    path = str(tmp_path_factory.mktemp("store") / "template.db")
+    template = Store(path)
+    template.init()
+    template._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    template.close()
+    return path
+
+
+@pytest.fixture
+def store(store_template, tmp_path) -> Iterator[Store]:
+    path = tmp_path / "test.db"
+    shutil.copyfile(store_template, path)
+    store = Store(str(path))
+    yield store
+    store.close()
@@ -1,6 +1,5 @@
 import asyncio
 import json
-import time
 import pytest
 
 from src.codex_runner import CodexRunner
@@ -375,6 +374,59 @@ async def test_codex_runner_dedupes_duplicate_outputs(tmp_path):
     assert outputs.count("dup") == 1
 
 
+@pytest.mark.asyncio
+async def test_codex_runner_reads_stream_in_chunks(tmp_path):
+    script = tmp_path / "fake_codex.py"
+    script.write_text(
+        "#!/usr/bin/env python3\n"
+        "import sys, time\n"
+        "sys.stdout.write('he'); sys.stdout.flush(); time.sleep(0.05)\n"
+        "sys.stdout.write('llo\\n' + 'x' * 100000 + '\\n中文\\ntail')\n"
+        "sys.stdout.flush()\n"
+    )
+    script.chmod(0o755)
+
+    config = Config(
+        telegram_bot_token="token",
+        telegram_allowed_user_ids={1},
+        codex_cli_cmd=str(script),
+        codex_cli_args=[],
+        codex_cli_input_mode="stdin",
+        codex_cli_resume_id=None,
+        codex_cli_approvals_mode=None,
+        codex_cli_skip_git_check=False,
+        codex_cli_use_pty=False,
+        codex_workdir=".",
+        stream_flush_interval=0.01,
+        stream_include_stderr=False,
+        progress_tick_interval=0.05,
+        run_timeout_seconds=2.0,
+        context_compaction_idle_timeout_seconds=60.0,
+        no_output_idle_timeout_seconds=2.0,
+        final_result_idle_timeout_seconds=0.1,
+        jsonl_sync_interval_seconds=0.0,
+        jsonl_stream_events=False,
+        jsonl_reasoning_throttle_seconds=10.0,
+        jsonl_reasoning_mode="hidden",
+        message_chunk_limit=1000,
+    )
+    runner = CodexRunner(config)
+
+    outputs = []
+
+    async def on_output(text: str, is_error: bool) -> None:
+        if not is_error:
+            outputs.append(text)
+
+    async def on_status(status: str) -> None:
+        return None
+
+    return_code = await runner.run("hello", on_output, on_status)
+
+    assert return_code == 0
+    assert outputs == ["hello", "x" * 100000, "中文", "tail"]
+
+
 @pytest.mark.asyncio
 async def test_codex_runner_idle_no_output_times_out(tmp_path):
     script = tmp_path / "fake_codex.py"
@@ -467,6 +519,7 @@ def test_codex_runner_summarizes_reasoning_safely():
     summary = CodexRunner._summarize_reasoning(raw)
     assert "内部推理摘要" in summary
     assert "unique-token-xyz" not in summary
+    assert summary == "内部推理摘要：执行测试；整理最终回复（已隐藏原文，长度%d字）" % len(raw)
 
 
 def test_codex_runner_normalizes_dedupe_text():
@@ -513,10 +566,12 @@ async def test_codex_runner_tails_jsonl_and_relocates(tmp_path, monkeypatch):
     runner = CodexRunner(config)
 
     outputs: list[str] = []
+    output_added = asyncio.Event()
     finished = asyncio.Event()
 
     async def emit(text: str) -> None:
         outputs.append(text)
+        output_added.set()
 
     task = asyncio.create_task(
         runner._tail_jsonl_events(resume_id, finished, emit)
@@ -529,11 +584,14 @@ async def test_codex_runner_tails_jsonl_and_relocates(tmp_path, monkeypatch):
         )
 
     async def wait_for_output(expected: str) -> None:
-        start = time.monotonic()
-        while expected not in outputs:
-            if time.monotonic() - start > 2.0:
-                raise AssertionError(f"missing output: {expected}")
-            await asyncio.sleep(0.05)
+        # 由 emit 唤醒，而不是固定间隔轮询 outputs
+        try:
+            async with asyncio.timeout(2.0):
+                while expected not in outputs:
+                    output_added.clear()
+                    await output_added.wait()
+        except TimeoutError:
+            raise AssertionError(f"missing output: {expected}") from None
 
     await wait_for_output("one")
 
@@ -550,3 +608,388 @@ async def test_codex_runner_tails_jsonl_and_relocates(tmp_path, monkeypatch):
 
     finished.set()
     await asyncio.wait_for(task, timeout=2.0)
+
+
+def test_codex_runner_extracts_last_message_across_blocks(tmp_path, monkeypatch):
+    from src import codex_runner
+
+    monkeypatch.setattr(codex_runner, "_TAIL_BLOCK_SIZE", 16)
+    session_file = tmp_path / "session.jsonl"
+    filler = '{"type":"event_msg","payload":{"type":"token_count"}}'
+    session_file.write_text(
+        "\n".join(
+            [
+                '{"timestamp":"2026-01-01T00:00:01Z","type":"event_msg","payload":{"type":"agent_message","message":"early"}}',
+                *([filler] * 5),
+            ]
+        )
+    )
+    message, timestamp = CodexRunner._extract_last_assistant_message_with_ts(
+        str(session_file)
+    )
+    assert message == "early"
+    assert timestamp is not None
+
+    with open(session_file, "a", encoding="utf-8") as handle:
+        handle.write(
+            '\n{"timestamp":"2026-01-01T00:00:02Z","type":"event_msg","payload":{"type":"agent_message","message":"late"}}'
+        )
+    assert CodexRunner._extract_last_assistant_message(str(session_file)) == "late"
+
+
+def test_codex_runner_session_file_cache_sees_new_nested_file(tmp_path, monkeypatch):
+    import os
+
+    codex_home = tmp_path / "codex"
+    day_one = codex_home / "sessions" / "2026" / "01" / "01"
+    day_one.mkdir(parents=True)
+    monkeypatch.setenv("CODEX_HOME", str(codex_home))
+
+    resume_id = "resume-cache"
+    first = day_one / f"rollout-1-{resume_id}.jsonl"
+    first.write_text("")
+    os.utime(first, (1_000_000, 1_000_000))
+
+    config = Config(
+        telegram_bot_token="token",
+        telegram_allowed_user_ids={1},
+        codex_cli_cmd="codex",
+        codex_cli_args=[],
+        codex_cli_input_mode="stdin",
+        codex_cli_resume_id=None,
+        codex_cli_approvals_mode=None,
+        codex_cli_skip_git_check=False,
+        codex_cli_use_pty=False,
+        codex_workdir=".",
+        stream_flush_interval=0.01,
+        stream_include_stderr=False,
+        progress_tick_interval=0.05,
+        run_timeout_seconds=2.0,
+        context_compaction_idle_timeout_seconds=60.0,
+        no_output_idle_timeout_seconds=2.0,
+        final_result_idle_timeout_seconds=30.0,
+        jsonl_sync_interval_seconds=0.0,
+        jsonl_stream_events=True,
+        jsonl_reasoning_throttle_seconds=0.0,
+        jsonl_reasoning_mode="hidden",
+        message_chunk_limit=1000,
+    )
+    runner = CodexRunner(config)
+    assert runner.find_session_file(resume_id) == str(first)
+    assert runner.find_session_file(resume_id) == str(first)
+
+    day_two = codex_home / "sessions" / "2026" / "01" / "02"
+    day_two.mkdir()
+    second = day_two / f"rollout-2-{resume_id}.jsonl"
+    second.write_text("")
+    assert runner.find_session_file(resume_id) == str(second)
+
+
+@pytest.mark.asyncio
+async def test_codex_runner_pty_answers_cpr_and_splits_lines(tmp_path):
+    script = tmp_path / "fake_codex.py"
+    script.write_text(
+        "#!/usr/bin/env python3\n"
+        "import sys, termios, time\n"
+        "attrs = termios.tcgetattr(0)\n"
+        "attrs[3] &= ~termios.ECHO\n"
+        "termios.tcsetattr(0, termios.TCSANOW, attrs)\n"
+        "sys.stdout.buffer.write(b'he\\x1b[6nllo\\nworld\\n\\xe4\\xb8')\n"
+        "sys.stdout.flush()\n"
+        "time.sleep(0.1)\n"
+        "sys.stdout.buffer.write(b'\\xad\\xe6\\x96\\x87\\x1b[')\n"
+        "sys.stdout.flush()\n"
+        "time.sleep(0.1)\n"
+        "sys.stdout.buffer.write(b'6n\\n')\n"
+        "sys.stdout.flush()\n"
+        "time.sleep(0.2)\n"
+    )
+    script.chmod(0o755)
+
+    config = Config(
+        telegram_bot_token="token",
+        telegram_allowed_user_ids={1},
+        codex_cli_cmd=str(script),
+        codex_cli_args=[],
+        codex_cli_input_mode="arg",
+        codex_cli_resume_id=None,
+        codex_cli_approvals_mode=None,
+        codex_cli_skip_git_check=False,
+        codex_cli_use_pty=True,
+        codex_workdir=".",
+        stream_flush_interval=0.01,
+        stream_include_stderr=False,
+        progress_tick_interval=0.05,
+        run_timeout_seconds=5.0,
+        context_compaction_idle_timeout_seconds=60.0,
+        no_output_idle_timeout_seconds=5.0,
+        final_result_idle_timeout_seconds=0.0,
+        jsonl_sync_interval_seconds=0.0,
+        jsonl_stream_events=False,
+        jsonl_reasoning_throttle_seconds=10.0,
+        jsonl_reasoning_mode="hidden",
+        message_chunk_limit=1000,
+    )
+    runner = CodexRunner(config)
+
+    outputs = []
+
+    async def on_output(text: str, is_error: bool) -> None:
+        outputs.append(text)
+
+    async def on_status(status: str) -> None:
+        return None
+
+    return_code = await runner.run("hello", on_output, on_status)
+
+    assert return_code == 0
+    assert "\n".join(outputs).split("\n") == ["hello", "world", "中文"]
+
+
+def test_codex_runner_watchdog_sleeps_until_nearest_threshold():
+    config = Config(
+        telegram_bot_token="token",
+        telegram_allowed_user_ids={1},
+        codex_cli_cmd="codex",
+        codex_cli_args=[],
+        codex_cli_input_mode="stdin",
+        codex_cli_resume_id=None,
+        codex_cli_approvals_mode=None,
+        codex_cli_skip_git_check=False,
+        codex_cli_use_pty=False,
+        codex_workdir=".",
+        stream_flush_interval=0.1,
+        stream_include_stderr=False,
+        progress_tick_interval=1.0,
+        run_timeout_seconds=5.0,
+        context_compaction_idle_timeout_seconds=60.0,
+        no_output_idle_timeout_seconds=900.0,
+        final_result_idle_timeout_seconds=30.0,
+        jsonl_sync_interval_seconds=0.0,
+        jsonl_stream_events=False,
+        jsonl_reasoning_throttle_seconds=10.0,
+        jsonl_reasoning_mode="hidden",
+        message_chunk_limit=1000,
+    )
+    runner = CodexRunner(config)
+
+    assert runner._watchdog_delay(10.0, 1.0) == 20.0
+    assert runner._watchdog_delay(29.99, 1.0) == 0.05
+    # 已越过最终结果阈值时按固定间隔继续轮询
+    assert runner._watchdog_delay(45.0, 1.0) == 1.0
+
+
+def test_codex_runner_parse_timestamp_fast_path_matches_fromisoformat():
+    from datetime import datetime
+
+    for value in (
+        "2026-01-01T00:00:01Z",
+        "2026-02-28T23:59:59.5Z",
+        "2024-02-29T12:34:56.123456Z",
+        "2026-01-01T08:00:00+08:00",
+    ):
+        expected = datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+        assert CodexRunner.parse_timestamp(value) == expected
+    assert CodexRunner.parse_timestamp("2026-02-30T00:00:00Z") is None
+    assert CodexRunner.parse_timestamp("2026-01-01T24:00:00Z") is None
+
+
+@pytest.mark.parametrize("use_stdlib", [False, True])
+def test_codex_runner_loads_jsonl_bytes_with_invalid_utf8(monkeypatch, use_stdlib):
+    from src import codex_runner
+
+    if use_stdlib:
+        monkeypatch.setattr(codex_runner, "_json_loads", json.loads)
+    line = b'{"type":"event_msg","payload":{"message":"ok\xff"}}\n'
+    data = CodexRunner._loads_jsonl_line(line)
+    assert data["payload"]["message"] == "ok�"
+    assert CodexRunner._loads_jsonl_line(b'{"type":') is None
+
+
+def test_codex_runner_finds_newer_session_file_in_parent_dir(tmp_path):
+    import os
+
+    resume_id = "resume-parent"
+    old = tmp_path / f"rollout-1-{resume_id}.jsonl"
+    old.write_text("")
+    os.utime(old, (1_000_000, 1_000_000))
+    (tmp_path / "nested").mkdir()
+    (tmp_path / "nested" / f"rollout-3-{resume_id}.jsonl").write_text("")
+
+    assert CodexRunner._find_session_file_in_dir(
+        str(tmp_path), resume_id, 2_000_000
+    ) is None
+
+    new = tmp_path / f"rollout-2-{resume_id}.jsonl"
+    new.write_text("")
+    assert CodexRunner._find_session_file_in_dir(
+        str(tmp_path), resume_id, 2_000_000
+    ) == str(new)
+
+
+def test_codex_runner_output_dedupe_is_bounded(monkeypatch):
+    from collections import OrderedDict
+
+    from src import codex_runner
+
+    monkeypatch.setattr(codex_runner, "_RUN_DEDUPE_MAX_ENTRIES", 2)
+    sent_texts = OrderedDict()
+
+    assert CodexRunner._remember_output(sent_texts, "a") is True
+    assert CodexRunner._remember_output(sent_texts, "a  \r\n") is False
+    assert CodexRunner._remember_output(sent_texts, "b") is True
+    assert CodexRunner._remember_output(sent_texts, "c") is True
+    assert list(sent_texts) == ["b", "c"]
+    assert CodexRunner._remember_output(sent_texts, "a") is True
+
+
+@pytest.mark.asyncio
+async def test_codex_runner_tails_jsonl_partial_and_batched_lines(tmp_path, monkeypatch):
+    codex_home = tmp_path / "codex"
+    sessions_dir = codex_home / "sessions"
+    sessions_dir.mkdir(parents=True)
+    monkeypatch.setenv("CODEX_HOME", str(codex_home))
+
+    resume_id = "resume-chunked"
+    session_file = sessions_dir / f"rollout-1-{resume_id}.jsonl"
+    session_file.write_text("")
+
+    config = Config(
+        telegram_bot_token="token",
+        telegram_allowed_user_ids={1},
+        codex_cli_cmd="codex",
+        codex_cli_args=[],
+        codex_cli_input_mode="stdin",
+        codex_cli_resume_id=None,
+        codex_cli_approvals_mode=None,
+        codex_cli_skip_git_check=False,
+        codex_cli_use_pty=False,
+        codex_workdir=".",
+        stream_flush_interval=0.01,
+        stream_include_stderr=False,
+        progress_tick_interval=0.05,
+        run_timeout_seconds=2.0,
+        context_compaction_idle_timeout_seconds=60.0,
+        no_output_idle_timeout_seconds=2.0,
+        final_result_idle_timeout_seconds=30.0,
+        jsonl_sync_interval_seconds=0.0,
+        jsonl_stream_events=True,
+        jsonl_reasoning_throttle_seconds=0.0,
+        jsonl_reasoning_mode="hidden",
+        message_chunk_limit=1000,
+    )
+    runner = CodexRunner(config)
+
+    outputs: list[str] = []
+    output_added = asyncio.Event()
+    finished = asyncio.Event()
+
+    async def emit(text: str) -> None:
+        outputs.append(text)
+        output_added.set()
+
+    task = asyncio.create_task(
+        runner._tail_jsonl_events(resume_id, finished, emit)
+    )
+
+    await asyncio.sleep(0.2)
+    first = '{"type":"event_msg","payload":{"type":"agent_message","message":"one"}}\n'
+    second = '{"type":"event_msg","payload":{"type":"agent_message","message":"two"}}\n'
+    with open(session_file, "a", encoding="utf-8") as handle:
+        handle.write(first[:20])
+    await asyncio.sleep(0.3)
+    assert outputs == []
+    with open(session_file, "a", encoding="utf-8") as handle:
+        handle.write(first[20:] + second)
+
+    async with asyncio.timeout(2.0):
+        while len(outputs) < 2:
+            output_added.clear()
+            await output_added.wait()
+
+    finished.set()
+    await asyncio.wait_for(task, timeout=2.0)
+    assert outputs == ["one", "two"]
+
+
+def test_codex_runner_writes_input_parts_fully():
+    import os
+
+    config = Config(
+        telegram_bot_token="token",
+        telegram_allowed_user_ids={1},
+        codex_cli_cmd="codex",
+        codex_cli_args=[],
+        codex_cli_input_mode="stdin",
+        codex_cli_resume_id=None,
+        codex_cli_approvals_mode="3",
+        codex_cli_skip_git_check=False,
+        codex_cli_use_pty=False,
+        codex_workdir=".",
+        stream_flush_interval=0.1,
+        stream_include_stderr=False,
+        progress_tick_interval=1.0,
+        run_timeout_seconds=5.0,
+        context_compaction_idle_timeout_seconds=60.0,
+        no_output_idle_timeout_seconds=900.0,
+        final_result_idle_timeout_seconds=30.0,
+        jsonl_sync_interval_seconds=0.0,
+        jsonl_stream_events=False,
+        jsonl_reasoning_throttle_seconds=10.0,
+        jsonl_reasoning_mode="hidden",
+        message_chunk_limit=1000,
+    )
+    runner = CodexRunner(config)
+
+    parts = runner._build_input("你好")
+    assert b"".join(parts) == "/approvals 3\n你好\n".encode("utf-8")
+
+    read_fd, write_fd = os.pipe()
+    try:
+        runner._write_all(write_fd, parts)
+        os.close(write_fd)
+        write_fd = -1
+        assert os.read(read_fd, 1024) == b"".join(parts)
+    finally:
+        os.close(read_fd)
+        if write_fd >= 0:
+            os.close(write_fd)
+
+
+@pytest.mark.asyncio
+async def test_codex_runner_cancel_and_wait_drains_tasks():
+    async def sleeper() -> None:
+        await asyncio.sleep(10)
+
+    async def failing() -> None:
+        raise RuntimeError("boom")
+
+    tasks = [asyncio.create_task(sleeper()), asyncio.create_task(failing())]
+    await asyncio.sleep(0)
+
+    await CodexRunner._cancel_and_wait(tasks)
+
+    assert all(task.done() for task in tasks)
+    assert tasks[0].cancelled()
+
+
+def test_codex_runner_sessions_dir_follows_codex_home(tmp_path, monkeypatch):
+    monkeypatch.setenv("CODEX_HOME", str(tmp_path / "a"))
+    assert CodexRunner._sessions_dir() == str(tmp_path / "a" / "sessions")
+    monkeypatch.setenv("CODEX_HOME", str(tmp_path / "b"))
+    assert CodexRunner._sessions_dir() == str(tmp_path / "b" / "sessions")
+
+
+def test_codex_runner_session_watch_dir_follows_dated_dirs(base_config, tmp_path, monkeypatch):
+    monkeypatch.setenv("CODEX_HOME", str(tmp_path))
+    monkeypatch.setattr("src.codex_runner.time.strftime", lambda fmt: "2026/01/02")
+    runner = CodexRunner(base_config)
+    sessions_dir = tmp_path / "sessions"
+    sessions_dir.mkdir()
+
+    # inotify 不递归：日期目录未建时盯最深的已存在上级
+    assert runner._session_watch_dir() == str(sessions_dir)
+    (sessions_dir / "2026").mkdir()
+    assert runner._session_watch_dir() == str(sessions_dir / "2026")
+    (sessions_dir / "2026" / "01" / "02").mkdir(parents=True)
+    assert runner._session_watch_dir() == str(sessions_dir / "2026" / "01" / "02")
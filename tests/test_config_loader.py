@@ -1,6 +1,8 @@
 import textwrap
 
-from src.config_loader import load_toml_config, resolve_env_placeholders
+import pytest
+
+from src.config_loader import _parse_int_set, load_toml_config, resolve_env_placeholders
 
 
 def test_env_placeholder_resolve():
@@ -70,6 +72,36 @@ def test_base_codex_cli_args_empty_falls_back_to_env(tmp_path):
         {"CODEX_CLI_ARGS": "--dangerously-bypass-approvals-and-sandbox"},
     )
     assert result.errors == []
-    assert result.app_config.base.codex_cli_args == [
-        "--dangerously-bypass-approvals-and-sandbox"
-    ]
+    assert result.app_config.base.codex_cli_args == (
+        "--dangerously-bypass-approvals-and-sandbox",
+    )
+
+
+def test_load_toml_config_reparses_after_change(tmp_path):
+    content = textwrap.dedent(
+        """
+        [[bots]]
+        name = "{name}"
+        token = "abc"
+        allowed_user_ids = [1]
+        resume_id = "resume-1"
+        codex_workdir = "/app/project-alpha"
+        """
+    ).strip()
+    path = tmp_path / "config.toml"
+    path.write_text(content.format(name="bot-alpha"), encoding="utf-8")
+    assert load_toml_config(str(path), {}).app_config.bots[0].name == "bot-alpha"
+    assert load_toml_config(str(path), {}).app_config.bots[0].name == "bot-alpha"
+
+    path.write_text(content.format(name="bot-beta-renamed"), encoding="utf-8")
+    assert load_toml_config(str(path), {}).app_config.bots[0].name == "bot-beta-renamed"
+
+
+def test_parse_int_set_skips_blank_items():
+    assert _parse_int_set("") == set()
+    assert _parse_int_set(" 1, 2,,3 , ") == {1, 2, 3}
+
+
+def test_env_placeholder_missing_key_raises():
+    with pytest.raises(KeyError, match="MISSING"):
+        resolve_env_placeholders("x-${ENV:A}-${ENV:MISSING}", {"A": "1"})
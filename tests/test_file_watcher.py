@@ -0,0 +1,34 @@
+import pytest
+
+from src.file_watcher import FileWatcher
+
+
+@pytest.mark.asyncio
+async def test_file_watcher_wakes_on_append(tmp_path):
+    path = tmp_path / "session.jsonl"
+    path.write_text("")
+    try:
+        watcher = FileWatcher(str(path))
+    except OSError:
+        pytest.skip("inotify 不可用")
+    try:
+        assert await watcher.wait(0.05) is False
+        with open(path, "a", encoding="utf-8") as handle:
+            handle.write("line\n")
+        assert await watcher.wait(2.0) is True
+    finally:
+        watcher.close()
+
+
+@pytest.mark.asyncio
+async def test_file_watcher_wakes_on_new_file_in_directory(tmp_path):
+    try:
+        watcher = FileWatcher(str(tmp_path), directory=True)
+    except OSError:
+        pytest.skip("inotify 不可用")
+    try:
+        assert await watcher.wait(0.05) is False
+        (tmp_path / "rollout.jsonl").write_text("")
+        assert await watcher.wait(2.0) is True
+    finally:
+        watcher.close()
@@ -7,6 +7,7 @@ def test_main_creates_session_manager_per_bot(monkeypatch, tmp_path):
     from src import main as main_mod
 
     created_orchestrators = []
+    started_adapters = []
 
     class FakeSessionManager:
         def __init__(self, store):
@@ -19,6 +20,9 @@ def test_main_creates_session_manager_per_bot(monkeypatch, tmp_path):
         def init(self):
             return None
 
+        def close(self):
+            return None
+
     class FakeProcessLock:
         def __init__(self, path):
             self.path = path
@@ -48,20 +52,8 @@ def test_main_creates_session_manager_per_bot(monkeypatch, tmp_path):
             self.orchestrator = orchestrator
             self.bot_id = bot_id
 
-        def run(self):
-            return None
-
-    class FakeThread:
-        def __init__(self, target, name, daemon):
-            self.target = target
-            self.name = name
-            self.daemon = daemon
-
-        def start(self):
-            return None
-
-        def join(self):
-            return None
+        async def run_async(self):
+            started_adapters.append(self.bot_id)
 
     base = BaseConfig(
         db_path=str(tmp_path / "db.sqlite3"),
@@ -113,12 +105,12 @@ def test_main_creates_session_manager_per_bot(monkeypatch, tmp_path):
     monkeypatch.setattr(main_mod, "CodexRunner", FakeRunner)
     monkeypatch.setattr(main_mod, "Orchestrator", FakeOrchestrator)
     monkeypatch.setattr(main_mod, "TelegramAdapter", FakeAdapter)
-    monkeypatch.setattr(main_mod.threading, "Thread", FakeThread)
     monkeypatch.setattr(main_mod.atexit, "register", lambda *_args, **_kwargs: None)
 
     main_mod.main()
 
     assert len(created_orchestrators) == len(app_config.bots)
+    assert started_adapters == ["gateway", "stock"]
     assert len({id(item.session_manager) for item in created_orchestrators}) == len(
         app_config.bots
     )
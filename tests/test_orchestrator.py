@@ -1,12 +1,13 @@
 import asyncio
 import json
+import threading
+from dataclasses import replace
+
 import pytest
 
 from src.codex_runner import CodexRunner
-from src.config import Config
 from src.orchestrator import ExternalMessage, Orchestrator
 from src.session_manager import SessionManager
-from src.store import Store
 
 
 class ControlledRunner:
@@ -40,33 +41,8 @@ class ControlledRunner:
 
 
 @pytest.mark.asyncio
-async def test_orchestrator_queue_processes_next_prompt(tmp_path):
-    config = Config(
-        telegram_bot_token="token",
-        telegram_allowed_user_ids={1},
-        codex_cli_cmd="codex",
-        codex_cli_args=[],
-        codex_cli_input_mode="stdin",
-        codex_cli_resume_id=None,
-        codex_cli_approvals_mode="3",
-        codex_cli_skip_git_check=True,
-        codex_cli_use_pty=False,
-        codex_workdir=".",
-        stream_flush_interval=0.01,
-        stream_include_stderr=False,
-        progress_tick_interval=0.5,
-        run_timeout_seconds=5.0,
-        context_compaction_idle_timeout_seconds=60.0,
-        no_output_idle_timeout_seconds=900.0,
-        final_result_idle_timeout_seconds=30.0,
-        jsonl_sync_interval_seconds=0.0,
-        jsonl_stream_events=False,
-        jsonl_reasoning_throttle_seconds=10.0,
-        jsonl_reasoning_mode="hidden",
-        message_chunk_limit=1000,
-    )
-    store = Store(str(tmp_path / "test.db"))
-    store.init()
+async def test_orchestrator_queue_processes_next_prompt(base_config, store):
+    config = base_config
     session_manager = SessionManager(store)
     runner = ControlledRunner()
     orchestrator = Orchestrator(config, session_manager, store, runner)
@@ -81,47 +57,129 @@ async def test_orchestrator_queue_processes_next_prompt(tmp_path):
         stream_messages.append(text)
 
     await orchestrator.submit_prompt(1, "first", send_status, send_stream)
+    consumer = orchestrator._active_tasks[1]
     await runner.started.wait()
     await orchestrator.submit_prompt(1, "second", send_status, send_stream)
 
     queued = await session_manager.peek_queue(1)
     assert queued == 1
+    assert status_messages[-1].endswith("排队中：1")
 
     runner.finish.set()
-    await asyncio.sleep(0.05)
+    # 消费者在队列排空后结束，直接等它而不是固定睡眠
+    await asyncio.wait_for(consumer, 1.0)
 
     assert runner.calls == ["first", "second"]
     assert any("任务结束" in msg or "运行完成" in msg for msg in status_messages)
 
 
 @pytest.mark.asyncio
-async def test_orchestrator_set_resume_id_disabled(tmp_path):
-    config = Config(
-        telegram_bot_token="token",
-        telegram_allowed_user_ids={1},
-        codex_cli_cmd="codex",
-        codex_cli_args=[],
-        codex_cli_input_mode="stdin",
-        codex_cli_resume_id=None,
-        codex_cli_approvals_mode="3",
-        codex_cli_skip_git_check=True,
-        codex_cli_use_pty=False,
-        codex_workdir=".",
-        stream_flush_interval=0.01,
-        stream_include_stderr=False,
-        progress_tick_interval=0.5,
-        run_timeout_seconds=5.0,
-        context_compaction_idle_timeout_seconds=60.0,
-        no_output_idle_timeout_seconds=900.0,
-        final_result_idle_timeout_seconds=30.0,
-        jsonl_sync_interval_seconds=0.0,
-        jsonl_stream_events=False,
-        jsonl_reasoning_throttle_seconds=10.0,
-        jsonl_reasoning_mode="hidden",
-        message_chunk_limit=1000,
+async def test_orchestrator_queued_prompt_streams_to_its_own_reply(base_config, store):
+    session_manager = SessionManager(store)
+    runner = ControlledRunner()
+    orchestrator = Orchestrator(base_config, session_manager, store, runner)
+
+    first_stream = []
+    second_stream = []
+
+    async def send_status(msg: str) -> None:
+        pass
+
+    async def send_first(text: str, final: bool) -> None:
+        first_stream.append(text)
+
+    async def send_second(text: str, final: bool) -> None:
+        second_stream.append(text)
+
+    await orchestrator.submit_prompt(1, "first", send_status, send_first)
+    consumer = orchestrator._active_tasks[1]
+    await runner.started.wait()
+    await orchestrator.submit_prompt(1, "second", send_status, send_second)
+
+    runner.finish.set()
+    await asyncio.wait_for(consumer, 1.0)
+
+    assert runner.calls == ["first", "second"]
+    # 排队指令的输出走它自己提交时的回调，不会接在上一条回复后面
+    assert first_stream == ["ok"]
+    assert second_stream == ["ok"]
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_cancel_keeps_consuming_queue(base_config, store):
+    config = base_config
+    session_manager = SessionManager(store)
+    runner = ControlledRunner()
+    orchestrator = Orchestrator(config, session_manager, store, runner)
+
+    status_messages = []
+
+    async def send_status(msg: str) -> None:
+        status_messages.append(msg)
+
+    async def send_stream(text: str, final: bool) -> None:
+        pass
+
+    await orchestrator.submit_prompt(1, "first", send_status, send_stream)
+    consumer = orchestrator._active_tasks[1]
+    await runner.started.wait()
+    await orchestrator.submit_prompt(1, "second", send_status, send_stream)
+    runner.started.clear()
+    await orchestrator.cancel_run(1, send_status)
+    await asyncio.wait_for(runner.started.wait(), 1.0)
+
+    assert runner.calls == ["first", "second"]
+    assert "运行已取消。" in status_messages
+
+    runner.finish.set()
+    await asyncio.wait_for(consumer, 1.0)
+    assert status_messages[-1] == "等待新指令。"
+    assert not await orchestrator.is_running(1)
+    count = await store.call(
+        lambda: store._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
     )
-    store = Store(str(tmp_path / "test.db"))
-    store.init()
+    assert count == 2
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_queues_prompt_submitted_while_consumer_finishes(base_config, store):
+    session_manager = SessionManager(store)
+    runner = ControlledRunner()
+    runner.finish.set()
+    orchestrator = Orchestrator(base_config, session_manager, store, runner)
+
+    status_messages = []
+    side_tasks = []
+
+    async def send_status(msg: str) -> None:
+        status_messages.append(msg)
+        if msg == "运行完成。" and not side_tasks:
+            # 消费者收尾时会话锁正被 JSONL 同步占用，同时有新指令提交
+            side_tasks.append(asyncio.create_task(session_manager.set_last_result(1, "x")))
+            side_tasks.append(
+                asyncio.create_task(orchestrator.submit_prompt(1, "second", send_status, send_stream))
+            )
+            await asyncio.sleep(0)
+
+    async def send_stream(text: str, final: bool) -> None:
+        pass
+
+    await orchestrator.submit_prompt(1, "first", send_status, send_stream)
+    consumer = orchestrator._active_tasks[1]
+    await asyncio.wait_for(consumer, 1.0)
+    await asyncio.gather(*side_tasks)
+    consumer = orchestrator._active_tasks.get(1)
+    if consumer is not None:
+        await asyncio.wait_for(consumer, 1.0)
+
+    assert runner.calls == ["first", "second"]
+    assert await session_manager.peek_queue(1) == 0
+    assert status_messages[-1] == "等待新指令。"
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_set_resume_id_disabled(base_config, store):
+    config = base_config
     session_manager = SessionManager(store)
     runner = ControlledRunner()
     orchestrator = Orchestrator(config, session_manager, store, runner)
@@ -139,33 +197,8 @@ async def test_orchestrator_set_resume_id_disabled(tmp_path):
 
 
 @pytest.mark.asyncio
-async def test_orchestrator_last_result_returns_final_message(tmp_path):
-    config = Config(
-        telegram_bot_token="token",
-        telegram_allowed_user_ids={1},
-        codex_cli_cmd="codex",
-        codex_cli_args=[],
-        codex_cli_input_mode="stdin",
-        codex_cli_resume_id=None,
-        codex_cli_approvals_mode="3",
-        codex_cli_skip_git_check=True,
-        codex_cli_use_pty=False,
-        codex_workdir=".",
-        stream_flush_interval=0.01,
-        stream_include_stderr=False,
-        progress_tick_interval=0.5,
-        run_timeout_seconds=5.0,
-        context_compaction_idle_timeout_seconds=60.0,
-        no_output_idle_timeout_seconds=900.0,
-        final_result_idle_timeout_seconds=30.0,
-        jsonl_sync_interval_seconds=0.0,
-        jsonl_stream_events=False,
-        jsonl_reasoning_throttle_seconds=10.0,
-        jsonl_reasoning_mode="hidden",
-        message_chunk_limit=1000,
-    )
-    store = Store(str(tmp_path / "test.db"))
-    store.init()
+async def test_orchestrator_last_result_returns_final_message(base_config, store):
+    config = base_config
     session_manager = SessionManager(store)
     runner = ControlledRunner()
     runner.final_message = "final answer"
@@ -181,9 +214,10 @@ async def test_orchestrator_last_result_returns_final_message(tmp_path):
         stream_messages.append(text)
 
     await orchestrator.submit_prompt(1, "first", send_status, send_stream)
+    consumer = orchestrator._active_tasks[1]
     await runner.started.wait()
     runner.finish.set()
-    await asyncio.sleep(0.05)
+    await asyncio.wait_for(consumer, 1.0)
 
     stream_messages.clear()
     await orchestrator.last_result(1, send_status, send_stream)
@@ -192,33 +226,8 @@ async def test_orchestrator_last_result_returns_final_message(tmp_path):
 
 
 @pytest.mark.asyncio
-async def test_orchestrator_last_result_falls_back_to_store(tmp_path):
-    config = Config(
-        telegram_bot_token="token",
-        telegram_allowed_user_ids={1},
-        codex_cli_cmd="codex",
-        codex_cli_args=[],
-        codex_cli_input_mode="stdin",
-        codex_cli_resume_id=None,
-        codex_cli_approvals_mode="3",
-        codex_cli_skip_git_check=True,
-        codex_cli_use_pty=False,
-        codex_workdir=".",
-        stream_flush_interval=0.01,
-        stream_include_stderr=False,
-        progress_tick_interval=0.5,
-        run_timeout_seconds=5.0,
-        context_compaction_idle_timeout_seconds=60.0,
-        no_output_idle_timeout_seconds=900.0,
-        final_result_idle_timeout_seconds=30.0,
-        jsonl_sync_interval_seconds=0.0,
-        jsonl_stream_events=False,
-        jsonl_reasoning_throttle_seconds=10.0,
-        jsonl_reasoning_mode="hidden",
-        message_chunk_limit=1000,
-    )
-    store = Store(str(tmp_path / "test.db"))
-    store.init()
+async def test_orchestrator_last_result_falls_back_to_store(base_config, store):
+    config = base_config
     session_manager = SessionManager(store)
     runner = ControlledRunner()
     orchestrator = Orchestrator(config, session_manager, store, runner)
@@ -244,7 +253,39 @@ async def test_orchestrator_last_result_falls_back_to_store(tmp_path):
 
 
 @pytest.mark.asyncio
-async def test_orchestrator_jsonl_sync_dedupes_last_result(tmp_path, monkeypatch):
+async def test_orchestrator_blocking_lookups_run_off_event_loop(base_config, store):
+    class ThreadRecordingRunner(ControlledRunner):
+        def __init__(self) -> None:
+            super().__init__()
+            self.read_threads: list[str] = []
+
+        def read_last_assistant_message(self, resume_id: str) -> str | None:
+            self.read_threads.append(threading.current_thread().name)
+            return "from jsonl"
+
+    session_manager = SessionManager(store)
+    runner = ThreadRecordingRunner()
+    config = replace(base_config, codex_cli_resume_id="resume")
+    orchestrator = Orchestrator(config, session_manager, store, runner)
+
+    await orchestrator.set_chat_id(1, 42)
+    assert await orchestrator.get_last_chat_id(1) == 42
+
+    stream_messages = []
+
+    async def send_status(msg: str) -> None:
+        pass
+
+    async def send_stream(text: str, final: bool) -> None:
+        stream_messages.append(text)
+
+    await orchestrator.last_result(1, send_status, send_stream)
+    assert stream_messages == ["from jsonl"]
+    assert runner.read_threads and runner.read_threads[0] != threading.current_thread().name
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_jsonl_sync_dedupes_last_result(base_config, store, tmp_path, monkeypatch):
     resume_id = "resume-sync"
     codex_home = tmp_path / "codex"
     sessions_dir = codex_home / "sessions"
@@ -268,32 +309,10 @@ async def test_orchestrator_jsonl_sync_dedupes_last_result(tmp_path, monkeypatch
         encoding="utf-8",
     )
 
-    config = Config(
-        telegram_bot_token="token",
-        telegram_allowed_user_ids={1},
-        codex_cli_cmd="codex",
-        codex_cli_args=[],
-        codex_cli_input_mode="stdin",
+    config = replace(
+        base_config,
         codex_cli_resume_id=resume_id,
-        codex_cli_approvals_mode="3",
-        codex_cli_skip_git_check=True,
-        codex_cli_use_pty=False,
-        codex_workdir=".",
-        stream_flush_interval=0.01,
-        stream_include_stderr=False,
-        progress_tick_interval=0.5,
-        run_timeout_seconds=5.0,
-        context_compaction_idle_timeout_seconds=60.0,
-        no_output_idle_timeout_seconds=900.0,
-        final_result_idle_timeout_seconds=30.0,
-        jsonl_sync_interval_seconds=0.0,
-        jsonl_stream_events=False,
-        jsonl_reasoning_throttle_seconds=10.0,
-        jsonl_reasoning_mode="hidden",
-        message_chunk_limit=1000,
     )
-    store = Store(str(tmp_path / "test.db"))
-    store.init()
     session_manager = SessionManager(store)
     runner = ControlledRunner()
     runner.session_file = str(session_file)
@@ -310,7 +329,24 @@ async def test_orchestrator_jsonl_sync_dedupes_last_result(tmp_path, monkeypatch
 
 
 @pytest.mark.asyncio
-async def test_orchestrator_jsonl_sync_emits_reasoning_progress(tmp_path, monkeypatch):
+async def test_orchestrator_memoizes_last_result_hash_on_session(base_config, store):
+    config = replace(
+        base_config,
+        codex_cli_resume_id="resume-memo",
+    )
+    session_manager = SessionManager(store)
+    orchestrator = Orchestrator(config, session_manager, store, ControlledRunner())
+    session = await session_manager.set_last_result(1, "cached result")
+
+    await orchestrator._apply_jsonl_records(1, session, [], 0.0, None, None, None)
+    assert session.last_result_hash == orchestrator._dedupe_digest("cached result")[1]
+
+    await session_manager.set_last_result(1, "new result")
+    assert session.last_result_hash is None
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_jsonl_sync_emits_reasoning_progress(base_config, store, tmp_path, monkeypatch):
     resume_id = "resume-reasoning"
     codex_home = tmp_path / "codex"
     sessions_dir = codex_home / "sessions"
@@ -330,32 +366,12 @@ async def test_orchestrator_jsonl_sync_emits_reasoning_progress(tmp_path, monkey
         encoding="utf-8",
     )
 
-    config = Config(
-        telegram_bot_token="token",
-        telegram_allowed_user_ids={1},
-        codex_cli_cmd="codex",
-        codex_cli_args=[],
-        codex_cli_input_mode="stdin",
+    config = replace(
+        base_config,
         codex_cli_resume_id=resume_id,
-        codex_cli_approvals_mode="3",
-        codex_cli_skip_git_check=True,
-        codex_cli_use_pty=False,
-        codex_workdir=".",
-        stream_flush_interval=0.01,
-        stream_include_stderr=False,
-        progress_tick_interval=0.5,
-        run_timeout_seconds=5.0,
-        context_compaction_idle_timeout_seconds=60.0,
-        no_output_idle_timeout_seconds=900.0,
-        final_result_idle_timeout_seconds=30.0,
-        jsonl_sync_interval_seconds=0.0,
-        jsonl_stream_events=False,
         jsonl_reasoning_throttle_seconds=0.0,
         jsonl_reasoning_mode="summary",
-        message_chunk_limit=1000,
     )
-    store = Store(str(tmp_path / "test.db"))
-    store.init()
     session_manager = SessionManager(store)
     runner = ControlledRunner()
     runner.session_file = str(session_file)
@@ -368,13 +384,14 @@ async def test_orchestrator_jsonl_sync_emits_reasoning_progress(tmp_path, monkey
     assert isinstance(messages[0], ExternalMessage)
     assert messages[0].is_progress is True
     assert messages[0].text.startswith("内部推理摘要")
+    assert messages[0].normalized == runner.normalize_text_for_dedupe(messages[0].text)
 
     session = await session_manager.get_or_create(1)
     assert session.last_result is None
 
 
 @pytest.mark.asyncio
-async def test_orchestrator_jsonl_sync_suppresses_hidden_reasoning(tmp_path, monkeypatch):
+async def test_orchestrator_jsonl_sync_suppresses_hidden_reasoning(base_config, store, tmp_path, monkeypatch):
     resume_id = "resume-hidden"
     codex_home = tmp_path / "codex"
     sessions_dir = codex_home / "sessions"
@@ -394,32 +411,11 @@ async def test_orchestrator_jsonl_sync_suppresses_hidden_reasoning(tmp_path, mon
         encoding="utf-8",
     )
 
-    config = Config(
-        telegram_bot_token="token",
-        telegram_allowed_user_ids={1},
-        codex_cli_cmd="codex",
-        codex_cli_args=[],
-        codex_cli_input_mode="stdin",
+    config = replace(
+        base_config,
         codex_cli_resume_id=resume_id,
-        codex_cli_approvals_mode="3",
-        codex_cli_skip_git_check=True,
-        codex_cli_use_pty=False,
-        codex_workdir=".",
-        stream_flush_interval=0.01,
-        stream_include_stderr=False,
-        progress_tick_interval=0.5,
-        run_timeout_seconds=5.0,
-        context_compaction_idle_timeout_seconds=60.0,
-        no_output_idle_timeout_seconds=900.0,
-        final_result_idle_timeout_seconds=30.0,
-        jsonl_sync_interval_seconds=0.0,
-        jsonl_stream_events=False,
         jsonl_reasoning_throttle_seconds=0.0,
-        jsonl_reasoning_mode="hidden",
-        message_chunk_limit=1000,
     )
-    store = Store(str(tmp_path / "test.db"))
-    store.init()
     session_manager = SessionManager(store)
     runner = ControlledRunner()
     runner.session_file = str(session_file)
@@ -429,3 +425,398 @@ async def test_orchestrator_jsonl_sync_suppresses_hidden_reasoning(tmp_path, mon
 
     messages = await orchestrator.poll_external_results(1, allow_send=True)
     assert messages == []
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_jsonl_sync_keeps_partial_line_for_next_poll(base_config, store, tmp_path, monkeypatch):
+    resume_id = "resume-partial"
+    codex_home = tmp_path / "codex"
+    sessions_dir = codex_home / "sessions"
+    sessions_dir.mkdir(parents=True)
+    monkeypatch.setenv("CODEX_HOME", str(codex_home))
+
+    record = json.dumps(
+        {
+            "timestamp": "2026-01-01T00:00:01Z",
+            "type": "event_msg",
+            "payload": {"type": "agent_reasoning", "text": "planning steps"},
+        }
+    ).encode("utf-8")
+    session_file = sessions_dir / f"rollout-1-{resume_id}.jsonl"
+    session_file.write_bytes(record + b"\n" + record[:20])
+
+    config = replace(
+        base_config,
+        codex_cli_resume_id=resume_id,
+        jsonl_reasoning_throttle_seconds=0.0,
+        jsonl_reasoning_mode="summary",
+    )
+    session_manager = SessionManager(store)
+    runner = ControlledRunner()
+    runner.session_file = str(session_file)
+    orchestrator = Orchestrator(config, session_manager, store, runner)
+
+    await session_manager.set_jsonl_state(1, 0.0, None)
+
+    assert len(await orchestrator.poll_external_results(1, allow_send=True)) == 1
+    assert await orchestrator.poll_external_results(1, allow_send=True) == []
+
+    with open(session_file, "ab") as handle:
+        handle.write(record[20:] + b"\n")
+    messages = await orchestrator.poll_external_results(1, allow_send=True)
+    assert len(messages) == 1
+    assert messages[0].is_progress is True
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_jsonl_sync_resumes_persisted_offset(base_config, store, tmp_path, monkeypatch):
+    resume_id = "resume-offset"
+    codex_home = tmp_path / "codex"
+    sessions_dir = codex_home / "sessions"
+    sessions_dir.mkdir(parents=True)
+    monkeypatch.setenv("CODEX_HOME", str(codex_home))
+
+    record = json.dumps(
+        {
+            "timestamp": "2026-01-01T00:00:01Z",
+            "type": "event_msg",
+            "payload": {"type": "agent_reasoning", "text": "planning steps"},
+        }
+    ).encode("utf-8")
+    session_file = sessions_dir / f"rollout-1-{resume_id}.jsonl"
+    session_file.write_bytes(record + b"\n" + record[:20])
+
+    config = replace(
+        base_config,
+        codex_cli_resume_id=resume_id,
+        jsonl_reasoning_throttle_seconds=0.0,
+        jsonl_reasoning_mode="summary",
+    )
+    runner = ControlledRunner()
+    runner.session_file = str(session_file)
+    session_manager = SessionManager(store)
+    orchestrator = Orchestrator(config, session_manager, store, runner)
+    await session_manager.set_jsonl_state(1, 0.0, None)
+    assert len(await orchestrator.poll_external_results(1, allow_send=True)) == 1
+
+    offset, inode = store.get_jsonl_position_by_user_id(1)
+    assert offset == len(record) + 1
+    assert inode == session_file.stat().st_ino
+
+    # 模拟重启：新的会话与编排器从库中恢复位置，不再重放已读过的行
+    session_manager = SessionManager(store)
+    orchestrator = Orchestrator(config, session_manager, store, runner)
+    await session_manager.set_jsonl_state(1, 0.0, None)
+    assert await orchestrator.poll_external_results(1, allow_send=True) == []
+
+    with open(session_file, "ab") as handle:
+        handle.write(record[20:] + b"\n")
+    messages = await orchestrator.poll_external_results(1, allow_send=True)
+    assert len(messages) == 1
+    assert store.get_jsonl_position_by_user_id(1)[0] == 2 * (len(record) + 1)
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_jsonl_sync_resumes_smallest_offset_in_group(
+    base_config, store, tmp_path, monkeypatch
+):
+    resume_id = "resume-group-offset"
+    codex_home = tmp_path / "codex"
+    sessions_dir = codex_home / "sessions"
+    sessions_dir.mkdir(parents=True)
+    monkeypatch.setenv("CODEX_HOME", str(codex_home))
+
+    def record(ts: str, text: str) -> bytes:
+        return json.dumps(
+            {
+                "timestamp": ts,
+                "type": "response_item",
+                "payload": {
+                    "type": "message",
+                    "role": "assistant",
+                    "content": [{"type": "output_text", "text": text}],
+                },
+            }
+        ).encode("utf-8") + b"\n"
+
+    first = record("2026-01-01T00:00:01Z", "first result")
+    second = record("2026-01-01T00:00:02Z", "second result")
+    session_file = sessions_dir / f"rollout-1-{resume_id}.jsonl"
+    session_file.write_bytes(first + second)
+    inode = session_file.stat().st_ino
+
+    config = replace(base_config, codex_cli_resume_id=resume_id)
+    runner = ControlledRunner()
+    runner.session_file = str(session_file)
+    session_manager = SessionManager(store)
+    # 重启后的新编排器：用户 1 已读到文件末尾，用户 2 只同步到第一行
+    ahead = await session_manager.get_or_create(1)
+    behind = await session_manager.get_or_create(2)
+    store.update_session_jsonl_state(
+        ahead.session_id,
+        runner.parse_timestamp("2026-01-01T00:00:03Z"),
+        None,
+        offset=len(first) + len(second),
+        inode=inode,
+    )
+    store.update_session_jsonl_state(
+        behind.session_id,
+        runner.parse_timestamp("2026-01-01T00:00:01Z"),
+        None,
+        offset=len(first),
+        inode=inode,
+    )
+
+    orchestrator = Orchestrator(config, session_manager, store, runner)
+    results = await orchestrator.poll_external_results_batch([1, 2])
+
+    assert results[1] == []
+    assert [message.text for message in results[2]] == ["second result"]
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_jsonl_sync_skips_unchanged_file(base_config, store, tmp_path, monkeypatch):
+    resume_id = "resume-unchanged"
+    codex_home = tmp_path / "codex"
+    sessions_dir = codex_home / "sessions"
+    sessions_dir.mkdir(parents=True)
+    monkeypatch.setenv("CODEX_HOME", str(codex_home))
+
+    record = json.dumps(
+        {
+            "timestamp": "2026-01-01T00:00:01Z",
+            "type": "event_msg",
+            "payload": {"type": "agent_reasoning", "text": "planning steps"},
+        }
+    ).encode("utf-8")
+    session_file = sessions_dir / f"rollout-1-{resume_id}.jsonl"
+    session_file.write_bytes(record + b"\n")
+
+    config = replace(
+        base_config,
+        codex_cli_resume_id=resume_id,
+        jsonl_reasoning_throttle_seconds=0.0,
+        jsonl_reasoning_mode="summary",
+    )
+    runner = ControlledRunner()
+    runner.session_file = str(session_file)
+    session_manager = SessionManager(store)
+    orchestrator = Orchestrator(config, session_manager, store, runner)
+    await session_manager.set_jsonl_state(1, 0.0, None)
+    assert len(await orchestrator.poll_external_results(1, allow_send=True)) == 1
+
+    reads = []
+    original_read = store.read
+
+    async def counting_read(func, *args):
+        reads.append(func.__name__)
+        return await original_read(func, *args)
+
+    monkeypatch.setattr(store, "read", counting_read)
+    assert await orchestrator.poll_external_results(1, allow_send=True) == []
+    assert reads == []
+
+    with open(session_file, "ab") as handle:
+        handle.write(record + b"\n")
+    assert len(await orchestrator.poll_external_results(1, allow_send=True)) == 1
+    assert reads == ["get_jsonl_state_by_user_id"]
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_jsonl_sync_skips_irrelevant_lines_without_decoding(base_config, store, tmp_path, monkeypatch):
+    resume_id = "resume-skip"
+    codex_home = tmp_path / "codex"
+    sessions_dir = codex_home / "sessions"
+    sessions_dir.mkdir(parents=True)
+    monkeypatch.setenv("CODEX_HOME", str(codex_home))
+
+    lines = [
+        {"timestamp": "2026-01-01T00:00:01Z", "type": "event_msg", "payload": {"type": "token_count"}},
+        {"timestamp": "2026-01-01T00:00:02Z", "type": "turn_context", "payload": {}},
+        {
+            "timestamp": "2026-01-01T00:00:03Z",
+            "type": "response_item",
+            "payload": {
+                "type": "message",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": "hello"}],
+            },
+        },
+    ]
+    session_file = sessions_dir / f"rollout-1-{resume_id}.jsonl"
+    session_file.write_text("".join(json.dumps(item) + "\n" for item in lines), encoding="utf-8")
+
+    config = replace(
+        base_config,
+        codex_cli_resume_id=resume_id,
+        jsonl_reasoning_throttle_seconds=0.0,
+        jsonl_reasoning_mode="summary",
+    )
+    session_manager = SessionManager(store)
+    runner = ControlledRunner()
+    runner.session_file = str(session_file)
+    orchestrator = Orchestrator(config, session_manager, store, runner)
+    await session_manager.set_jsonl_state(1, 0.0, None)
+
+    decoded: list[bytes] = []
+    loads = CodexRunner.loads_jsonl_line
+
+    def counting_loads(line):
+        decoded.append(bytes(line))
+        return loads(line)
+
+    monkeypatch.setattr(CodexRunner, "loads_jsonl_line", staticmethod(counting_loads))
+    messages = await orchestrator.poll_external_results(1, allow_send=True)
+
+    assert [message.text for message in messages] == ["hello"]
+    assert len(decoded) == 1
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_jsonl_batch_reads_shared_file_once(base_config, store, tmp_path, monkeypatch):
+    resume_id = "resume-shared"
+    codex_home = tmp_path / "codex"
+    sessions_dir = codex_home / "sessions"
+    sessions_dir.mkdir(parents=True)
+    monkeypatch.setenv("CODEX_HOME", str(codex_home))
+
+    session_file = sessions_dir / f"rollout-1-{resume_id}.jsonl"
+    session_file.write_text(
+        json.dumps(
+            {
+                "timestamp": "2026-01-01T00:00:01Z",
+                "type": "response_item",
+                "payload": {
+                    "type": "message",
+                    "role": "assistant",
+                    "content": [{"type": "output_text", "text": "shared result"}],
+                },
+            }
+        )
+        + "\n",
+        encoding="utf-8",
+    )
+
+    config = replace(
+        base_config,
+        telegram_allowed_user_ids={1, 2},
+        codex_cli_resume_id=resume_id,
+    )
+    session_manager = SessionManager(store)
+    runner = ControlledRunner()
+    runner.session_file = str(session_file)
+    orchestrator = Orchestrator(config, session_manager, store, runner)
+    await session_manager.set_jsonl_state(1, 0.0, None)
+    await session_manager.set_jsonl_state(2, 0.0, None)
+
+    reads = []
+    read_jsonl_lines = orchestrator._read_jsonl_lines
+
+    def counting_read(*args):
+        reads.append(args)
+        return read_jsonl_lines(*args)
+
+    monkeypatch.setattr(orchestrator, "_read_jsonl_lines", counting_read)
+    results = await orchestrator.poll_external_results_batch([1, 2])
+
+    assert len(reads) == 1
+    assert [message.text for message in results[1]] == ["shared result"]
+    assert [message.text for message in results[2]] == ["shared result"]
+    assert store.get_last_result_by_user_id(2) == "shared result"
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_jsonl_batch_keeps_results_when_other_group_fails(base_config, store, tmp_path, monkeypatch):
+    resume_id = "resume-ok"
+    codex_home = tmp_path / "codex"
+    sessions_dir = codex_home / "sessions"
+    sessions_dir.mkdir(parents=True)
+    monkeypatch.setenv("CODEX_HOME", str(codex_home))
+
+    session_file = sessions_dir / f"rollout-1-{resume_id}.jsonl"
+    session_file.write_text(
+        json.dumps(
+            {
+                "timestamp": "2026-01-01T00:00:01Z",
+                "type": "response_item",
+                "payload": {
+                    "type": "message",
+                    "role": "assistant",
+                    "content": [{"type": "output_text", "text": "ok result"}],
+                },
+            }
+        )
+        + "\n",
+        encoding="utf-8",
+    )
+
+    config = replace(base_config, codex_cli_resume_id=resume_id)
+    session_manager = SessionManager(store)
+    runner = ControlledRunner()
+    runner.session_file = str(session_file)
+    orchestrator = Orchestrator(config, session_manager, store, runner)
+    await session_manager.set_jsonl_state(1, 0.0, None)
+    await session_manager.set_jsonl_state(2, 0.0, None)
+    await session_manager.set_resume_id(2, "resume-bad")
+
+    read_jsonl_lines = orchestrator._read_jsonl_lines
+
+    def failing_read(state, group_resume_id, read):
+        if group_resume_id == "resume-bad":
+            raise OSError("boom")
+        return read_jsonl_lines(state, group_resume_id, read)
+
+    monkeypatch.setattr(orchestrator, "_read_jsonl_lines", failing_read)
+    results = await orchestrator.poll_external_results_batch([1, 2])
+
+    assert [message.text for message in results[1]] == ["ok result"]
+    assert 2 not in results
+
+
+def test_orchestrator_caches_dedupe_digest(base_config, store):
+    config = base_config
+    orchestrator = Orchestrator(config, SessionManager(store), store, CodexRunner(config))
+
+    first = orchestrator._dedupe_digest("result  \n")
+    second = orchestrator._dedupe_digest("result  \n")
+    assert first == second
+    assert first[0] == "result"
+    assert orchestrator._dedupe_digest.cache_info().hits == 1
+
+
+def test_orchestrator_evicts_least_recent_jsonl_state(base_config, store, tmp_path, monkeypatch):
+    from src import orchestrator as orchestrator_module
+
+    monkeypatch.setattr(orchestrator_module, "_JSONL_STATES_MAXLEN", 2)
+    config = base_config
+    orchestrator = Orchestrator(config, SessionManager(store), store, CodexRunner(config))
+    path = tmp_path / "session.jsonl"
+    path.write_bytes(b"{}\n")
+
+    first = orchestrator._jsonl_state("a")
+    first.handle = orchestrator_module._open_jsonl(str(path))
+    orchestrator._jsonl_state("b")
+    orchestrator._jsonl_state("a")
+    orchestrator._jsonl_state("c")
+
+    assert list(orchestrator._jsonl_states) == ["a", "c"]
+    assert first.handle is not None
+    evicted_handle = orchestrator._jsonl_states["a"].handle
+    orchestrator._jsonl_state("d")
+    assert list(orchestrator._jsonl_states) == ["c", "d"]
+    assert evicted_handle.closed
+    assert first.handle is None
+
+
+def test_orchestrator_digest_matches_legacy_sha256():
+    import hashlib
+
+    from src.orchestrator import _dedupe_hexdigest, _matches_stored_digest
+
+    digest = _dedupe_hexdigest("result")
+    assert digest.startswith("b2:")
+    legacy = hashlib.sha256(b"result").hexdigest()
+    assert _matches_stored_digest("result", digest, digest)
+    assert _matches_stored_digest("result", digest, legacy)
+    assert not _matches_stored_digest("other", _dedupe_hexdigest("other"), legacy)
+    assert not _matches_stored_digest("result", digest, None)
@@ -1,20 +1,25 @@
 from __future__ import annotations
 
+import functools
 import re
 from pathlib import Path
 
+_LONG_ID_PATTERN = re.compile(r"\b\d{9,}\b")
+_ALLOWED_IDS = frozenset({"123456789", "987654321"})
+
+
+@functools.lru_cache(maxsize=None)
+def _read_text(path: str) -> str:
+    return Path(path).read_text(encoding="utf-8")
+
 
 def test_gitignore_blocks_local_config() -> None:
-    text = Path(".gitignore").read_text(encoding="utf-8")
+    text = _read_text(".gitignore")
     assert "config.toml" in text
     assert ".env.old" in text
 
 
 def test_examples_use_placeholder_ids() -> None:
-    allowed_ids = {"123456789", "987654321"}
-    pattern = re.compile(r"\\b\\d{9,}\\b")
-    paths = [Path("README.md"), Path("config.toml.example")]
-    for path in paths:
-        content = path.read_text(encoding="utf-8")
-        for match in pattern.findall(content):
-            assert match in allowed_ids
+    for path in ("README.md", "config.toml.example"):
+        for match in _LONG_ID_PATTERN.finditer(_read_text(path)):
+            assert match.group(0) in _ALLOWED_IDS, f"{path}: {match.group(0)}"
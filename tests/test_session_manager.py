@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from src import models
+from src.session_manager import SessionManager
+
+
+@pytest.mark.asyncio
+async def test_session_queue_drops_oldest_when_full(store, monkeypatch):
+    monkeypatch.setattr(models, "SESSION_QUEUE_MAXLEN", 2)
+    session_manager = SessionManager(store)
+
+    for prompt in ("a", "b", "c"):
+        await session_manager.enqueue_prompt(1, prompt)
+
+    assert await session_manager.peek_queue(1) == 2
+    assert await session_manager.dequeue_prompt(1) == "b"
+    assert await session_manager.dequeue_prompt(1) == "c"
+    assert await session_manager.dequeue_prompt(1) is None
+
+
+def test_new_ids_have_expected_shape():
+    session_id = models.new_id("sess")
+    assert session_id.startswith("sess_") and len(session_id) == len("sess_") + 16
+    run_id = models.new_run_id()
+    assert run_id.startswith("run_") and len(run_id) == len("run_") + 32
+
+
+@pytest.mark.asyncio
+async def test_session_locks_are_per_user(store):
+    session_manager = SessionManager(store)
+
+    async with session_manager._lock_for("default", 1):
+        session = await asyncio.wait_for(session_manager.get_or_create(2), timeout=1.0)
+    assert session.user_id == 2
+    assert session_manager._lock_for("default", 1) is session_manager._lock_for("default", 1)
+
+
+@pytest.mark.asyncio
+async def test_start_and_finish_run_update_session_and_store(store):
+    from src.models import RunStatus, SessionState
+
+    session_manager = SessionManager(store)
+
+    run = await session_manager.start_run(1, "prompt", "bot-a")
+    session = await session_manager.get_or_create(1, "bot-a")
+    assert run.session_id == session.session_id
+    assert session.state == SessionState.RUNNING
+    assert session.current_run_id == run.run_id
+
+    run.status = RunStatus.DONE
+    await session_manager.finish_run(1, run, "result", "bot-a")
+    assert session.state == SessionState.IDLE
+    assert session.current_run_id is None
+    assert store.get_last_result_by_user_id(1, "bot-a") == "result"
+    row = store._conn.execute("SELECT status FROM runs WHERE run_id = ?", (run.run_id,)).fetchone()
+    assert row == ("done",)
@@ -1,4 +1,11 @@
-from src.models import Session
+import asyncio
+import shutil
+import sqlite3
+import threading
+
+import pytest
+
+from src.models import Run, RunStatus, Session, SessionState
 from src.store import Store
 
 
@@ -13,3 +20,147 @@ def test_bot_isolation(tmp_path):
     store.update_session_last_result(s2.session_id, "b")
     assert store.get_last_result_by_user_id(1, "bot-a") == "a"
     assert store.get_last_result_by_user_id(1, "bot-b") == "b"
+
+
+def test_batch_session_writes_commit_once(store):
+    s1 = Session(user_id=1, bot_id="bot-a")
+    s2 = Session(user_id=1, bot_id="bot-b")
+    statements = []
+    store._conn.set_trace_callback(statements.append)
+    store.record_sessions([s1, s2])
+    store.update_sessions_last_result([(s1.session_id, "a"), (s2.session_id, "b")])
+    store._conn.set_trace_callback(None)
+    assert statements.count("BEGIN IMMEDIATE") == 2
+    assert statements.count("COMMIT") == 2
+    assert store.get_last_result_by_user_id(1, "bot-a") == "a"
+    assert store.get_last_result_by_user_id(1, "bot-b") == "b"
+
+
+def test_begin_and_finish_run_in_single_transactions(store):
+    session = Session(user_id=1, bot_id="bot-a")
+    store.record_session(session)
+    run = Run(run_id="run_1", session_id=session.session_id, prompt="hi")
+
+    store.begin_run(run, SessionState.RUNNING)
+    row = store._conn.execute(
+        "SELECT state FROM sessions WHERE session_id = ?", (session.session_id,)
+    ).fetchone()
+    assert row == ("running",)
+
+    run.status = RunStatus.DONE
+    run.finished_at = 1.0
+    store.finish_run(run, SessionState.IDLE, "done")
+    assert store._conn.execute(
+        "SELECT status, finished_at FROM runs WHERE run_id = ?", ("run_1",)
+    ).fetchone() == ("done", 1.0)
+    assert store.get_last_result_by_user_id(1, "bot-a") == "done"
+    assert store._conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+
+@pytest.mark.asyncio
+async def test_store_call_runs_off_event_loop_thread_in_order(store):
+    session = Session(user_id=1, bot_id="bot-a")
+    await store.call(store.record_session, session)
+    await store.call(store.update_session_last_result, session.session_id, "a")
+    assert await store.call(store.get_last_result_by_user_id, 1, "bot-a") == "a"
+    thread_name = await store.call(lambda: threading.current_thread().name)
+    assert thread_name.startswith("store")
+
+
+@pytest.mark.asyncio
+async def test_session_manager_persists_in_memory_activity_time(store):
+    from src.session_manager import SessionManager
+
+    session_manager = SessionManager(store)
+    session = await session_manager.set_last_result(1, "a", "bot-a")
+    row = store._conn.execute(
+        "SELECT last_activity FROM sessions WHERE session_id = ?", (session.session_id,)
+    ).fetchone()
+    assert row == (session.last_activity,)
+
+
+def test_user_session_lookups_use_activity_index(store):
+    plan = store._conn.execute(
+        """
+        EXPLAIN QUERY PLAN
+        SELECT last_result FROM sessions
+        WHERE user_id = ? AND (bot_id = ? OR bot_id IS NULL) AND last_result IS NOT NULL
+        ORDER BY last_activity DESC LIMIT 1
+        """,
+        (1, "bot-a"),
+    ).fetchall()
+    assert any("idx_sessions_user_activity" in row[-1] for row in plan)
+
+
+@pytest.mark.asyncio
+async def test_store_submit_writes_in_order_without_waiting(store, caplog):
+    session = Session(user_id=1, bot_id="bot-a")
+    store.submit(store.record_session, session)
+    store.submit(store.record_message, session.session_id, "user", "hello")
+    store.submit(store.record_message, "missing", "user", None)
+    count = await store.call(
+        lambda: store._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    )
+    assert count == 1
+    assert "后台写入失败" in caplog.text
+
+
+def test_store_reads_do_not_wait_for_writer_lock(store):
+    session = Session(user_id=1, bot_id="bot-a")
+    store.record_session(session)
+    store.update_session_last_result(session.session_id, "a")
+    with store._lock:
+        assert store.get_last_result_by_user_id(1, "bot-a") == "a"
+    result: list[str] = []
+    reader = threading.Thread(target=lambda: result.append(store.get_last_result_by_user_id(1, "bot-a")))
+    reader.start()
+    reader.join()
+    assert result == ["a"]
+
+
+def test_store_connections_use_wal_and_busy_timeout(store):
+    assert store._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert store._conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+    assert store._reader().execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+
+
+@pytest.mark.asyncio
+async def test_store_read_does_not_queue_behind_writes(store):
+    session = Session(user_id=1, bot_id="bot-a")
+    await store.call(store.record_session, session)
+    await store.call(store.update_session_last_result, session.session_id, "a")
+    release = threading.Event()
+    blocked = asyncio.ensure_future(store.call(release.wait, 5))
+    try:
+        result = await asyncio.wait_for(store.read(store.get_last_result_by_user_id, 1, "bot-a"), 1)
+        assert result == "a"
+        assert not blocked.done()
+    finally:
+        release.set()
+        await blocked
+
+
+@pytest.mark.asyncio
+async def test_store_read_sees_awaited_call(store):
+    session = Session(user_id=1, bot_id="bot-a")
+    await store.call(store.record_session, session)
+    # 先在读线程里建立读连接与快照，再确认之后的写入对它可见
+    assert await store.read(store.get_last_result_by_user_id, 1, "bot-a") is None
+    for value in ("a", "b"):
+        await store.call(store.update_session_last_result, session.session_id, value)
+        assert await store.read(store.get_last_result_by_user_id, 1, "bot-a") == value
+
+
+def test_store_close_shuts_down_executors(store_template, tmp_path):
+    path = tmp_path / "closed.db"
+    shutil.copyfile(store_template, path)
+    closed = Store(str(path))
+    closed.get_last_result_by_user_id(1)
+    reader = closed._reader()
+    closed.close()
+
+    with pytest.raises(RuntimeError):
+        closed.submit(closed.get_last_result_by_user_id, 1)
+    for conn in (closed._conn, reader):
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
@@ -0,0 +1,217 @@
+import asyncio
+
+import pytest
+
+from src.stream_broker import StreamBroker
+
+
+@pytest.mark.asyncio
+async def test_stream_broker_coalesces_pushes_within_interval():
+    sent = []
+
+    async def send(text: str, final: bool) -> None:
+        sent.append((text, final))
+
+    broker = StreamBroker(send_func=send, flush_interval=0.05, chunk_limit=1000)
+    await broker.start()
+    await broker.push("a", False)
+    await broker.push("b", True)
+    await asyncio.sleep(0.15)
+    assert sent == [("a\n[stderr] b", False)]
+
+    await broker.push("c", False)
+    await broker.stop()
+    assert sent == [("a\n[stderr] b", False), ("c", True)]
+
+
+@pytest.mark.asyncio
+async def test_stream_broker_splits_on_character_boundaries():
+    sent = []
+
+    async def send(text: str, final: bool) -> None:
+        sent.append(text)
+
+    broker = StreamBroker(send_func=send, flush_interval=0.05, chunk_limit=4)
+    await broker.push("中文输出测试", False)
+    await broker.push("ok", False)
+    await broker.flush(final=True)
+    assert sent == ["中文输出", "测试", "ok"]
+
+
+@pytest.mark.asyncio
+async def test_stream_broker_explicit_flush_clears_pending_wakeup():
+    sent = []
+
+    async def send(text: str, final: bool) -> None:
+        sent.append(text)
+
+    broker = StreamBroker(send_func=send, flush_interval=0.01, chunk_limit=1000)
+    await broker.push("a", False)
+    await broker.flush()
+    assert sent == ["a"]
+    assert not broker._pending.is_set()
+
+
+@pytest.mark.asyncio
+async def test_stream_broker_keeps_output_pushed_while_sending():
+    sent = []
+    broker = None
+
+    async def send(text: str, final: bool) -> None:
+        sent.append(text)
+        if text == "a":
+            await broker.push("b", False)
+
+    broker = StreamBroker(send_func=send, flush_interval=0.01, chunk_limit=1000)
+    await broker.push("a", False)
+    await broker.flush()
+    assert sent == ["a"]
+    await broker.flush(final=True)
+    assert sent == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_stream_broker_packs_entries_up_to_chunk_limit():
+    sent = []
+
+    async def send(text: str, final: bool) -> None:
+        sent.append(text)
+
+    broker = StreamBroker(send_func=send, flush_interval=0.01, chunk_limit=7)
+    for text in ("aa", "bb", "cc", "dd", "eeeeeeeeee"):
+        await broker.push(text, False)
+    await broker.flush(final=True)
+    assert sent == ["aa\nbb", "cc\ndd", "eeeeeee", "eee"]
+
+
+@pytest.mark.asyncio
+async def test_stream_broker_splits_long_entry_on_newlines():
+    sent = []
+
+    async def send(text: str, final: bool) -> None:
+        sent.append(text)
+
+    broker = StreamBroker(send_func=send, flush_interval=0.01, chunk_limit=6)
+    await broker.push("abc\ndef\nghijklmn", False)
+    await broker.push("x", False)
+    await broker.flush(final=True)
+    assert sent == ["abc", "def", "ghijkl", "mn\nx"]
+
+
+@pytest.mark.asyncio
+async def test_stream_broker_marks_only_last_packet_final():
+    sent = []
+
+    async def send(text: str, final: bool) -> None:
+        sent.append((text, final))
+
+    broker = StreamBroker(send_func=send, flush_interval=0.01, chunk_limit=3)
+    await broker.push("aaa", False)
+    await broker.push("bbb", False)
+    await broker.flush(final=True)
+    assert sent == [("aaa", False), ("bbb", True)]
+
+
+@pytest.mark.asyncio
+async def test_stream_broker_prefixes_each_stderr_line():
+    sent = []
+
+    async def send(text: str, final: bool) -> None:
+        sent.append(text)
+
+    broker = StreamBroker(send_func=send, flush_interval=0.01, chunk_limit=1000)
+    await broker.push("warn 1\nwarn 2", True)
+    await broker.flush(final=True)
+    assert sent == ["[stderr] warn 1\n[stderr] warn 2"]
+
+
+@pytest.mark.asyncio
+async def test_stream_broker_push_waits_for_slow_send_when_buffer_is_full():
+    sent = []
+    release = asyncio.Event()
+
+    async def send(text: str, final: bool) -> None:
+        await release.wait()
+        sent.append(text)
+
+    broker = StreamBroker(send_func=send, flush_interval=10.0, chunk_limit=2)
+    for index in range(8):
+        await broker.push(str(index), False)
+    blocked = asyncio.create_task(broker.push("b", False))
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+
+    release.set()
+    await asyncio.wait_for(blocked, 1.0)
+    assert sent == [str(index) for index in range(8)] + ["b"]
+
+
+@pytest.mark.asyncio
+async def test_stream_broker_collapses_repeated_lines():
+    sent = []
+
+    async def send(text: str, final: bool) -> None:
+        sent.append(text)
+
+    broker = StreamBroker(send_func=send, flush_interval=0.01, chunk_limit=1000)
+    for text in ("working", "working", "working", "done", "done"):
+        await broker.push(text, False)
+    await broker.flush()
+    await broker.push("done", False)
+    await broker.flush(final=True)
+    assert sent == ["working (x3)\ndone (x2)", "done"]
+
+
+@pytest.mark.asyncio
+async def test_stream_broker_keeps_repeated_blank_lines():
+    sent = []
+
+    async def send(text: str, final: bool) -> None:
+        sent.append(text)
+
+    broker = StreamBroker(send_func=send, flush_interval=0.01, chunk_limit=1000)
+    for text in ("para one", "", "", "para two", "  ", "  "):
+        await broker.push(text, False)
+    await broker.push("", True)
+    await broker.push("", True)
+    await broker.flush(final=True)
+    assert sent == ["para one\n\n\npara two\n  \n  \n[stderr] \n[stderr] "]
+
+
+@pytest.mark.asyncio
+async def test_stream_broker_flush_cadence_absorbs_send_latency():
+    flushed_at = []
+
+    async def send(text: str, final: bool) -> None:
+        flushed_at.append(asyncio.get_running_loop().time())
+        await asyncio.sleep(0.08)
+
+    broker = StreamBroker(send_func=send, flush_interval=0.1, chunk_limit=1000)
+    await broker.start()
+    await broker.push("a", False)
+    await asyncio.sleep(0.15)
+    await broker.push("b", False)
+    await asyncio.sleep(0.1)
+    await broker.stop()
+    assert len(flushed_at) == 2
+    # 第二次刷新按节拍落在首次刷新后约一个间隔，而不是发送结束后再等一个间隔
+    assert flushed_at[1] - flushed_at[0] < 0.15
+
+
+@pytest.mark.asyncio
+async def test_stream_broker_small_flush_skips_packing(monkeypatch):
+    sent = []
+
+    async def send(text: str, final: bool) -> None:
+        sent.append(text)
+
+    broker = StreamBroker(send_func=send, flush_interval=0.01, chunk_limit=5)
+
+    def fail_packets(buffer):
+        raise AssertionError("small flush should not pack")
+
+    monkeypatch.setattr(broker, "_packets", fail_packets)
+    await broker.push("ab", False)
+    await broker.push("cd", False)
+    await broker.flush(final=True)
+    assert sent == ["ab\ncd"]
@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+import asyncio
+from dataclasses import replace
+from types import SimpleNamespace
+
 import pytest
 
 from src.adapters import telegram_adapter
-from src.config import Config
 from src.orchestrator import ExternalMessage
 
 
@@ -37,40 +40,40 @@ class DummyOrchestrator:
     pass
 
 
-def test_run_polling_disables_signal_handlers(monkeypatch) -> None:
-    dummy_builder = DummyBuilder()
-    monkeypatch.setattr(telegram_adapter, "ApplicationBuilder", lambda: dummy_builder)
+class BatchPollMixin:
+    async def poll_external_results_batch(self, user_ids):
+        return {
+            user_id: await self.poll_external_results(user_id, allow_send=True)
+            for user_id in user_ids
+        }
+
+
+@pytest.fixture
+def telegram_builder(monkeypatch) -> DummyBuilder:
+    builder = DummyBuilder()
+    monkeypatch.setattr(telegram_adapter, "ApplicationBuilder", lambda: builder)
+    return builder
+
 
-    config = Config(
-        telegram_bot_token="token",
-        telegram_allowed_user_ids={1},
-        codex_cli_cmd="codex",
-        codex_cli_args=[],
-        codex_cli_input_mode="stdin",
+def test_run_polling_disables_signal_handlers(base_config, telegram_builder) -> None:
+    config = replace(
+        base_config,
         codex_cli_resume_id="resume",
         codex_cli_approvals_mode=None,
-        codex_cli_skip_git_check=True,
-        codex_cli_use_pty=False,
-        codex_workdir=".",
         stream_flush_interval=1.0,
-        stream_include_stderr=False,
         progress_tick_interval=1.0,
         run_timeout_seconds=1.0,
         context_compaction_idle_timeout_seconds=1.0,
         no_output_idle_timeout_seconds=1.0,
         final_result_idle_timeout_seconds=1.0,
-        jsonl_sync_interval_seconds=0.0,
-        jsonl_stream_events=False,
         jsonl_reasoning_throttle_seconds=1.0,
-        jsonl_reasoning_mode="hidden",
-        message_chunk_limit=1000,
     )
 
     adapter = telegram_adapter.TelegramAdapter(config, DummyOrchestrator())
     adapter.run()
 
-    assert dummy_builder._app.run_polling_kwargs is not None
-    assert dummy_builder._app.run_polling_kwargs.get("stop_signals", "missing") is None
+    assert telegram_builder._app.run_polling_kwargs is not None
+    assert telegram_builder._app.run_polling_kwargs.get("stop_signals", "missing") is None
 
 
 class DummyMessage:
@@ -99,8 +102,8 @@ class DummyContext:
 
 
 @pytest.mark.asyncio
-async def test_jsonl_messages_cached_until_run_finishes() -> None:
-    class CacheOrchestrator:
+async def test_jsonl_messages_cached_until_run_finishes(base_config) -> None:
+    class CacheOrchestrator(BatchPollMixin):
         def __init__(self) -> None:
             self.running_calls = 0
             self.poll_calls = 0
@@ -115,32 +118,21 @@ async def test_jsonl_messages_cached_until_run_finishes() -> None:
                 return [ExternalMessage("final result")]
             return []
 
-        def get_last_chat_id(self, user_id: int):
+        async def get_last_chat_id(self, user_id: int):
             return 123
 
-    config = Config(
-        telegram_bot_token="token",
-        telegram_allowed_user_ids={1},
-        codex_cli_cmd="codex",
-        codex_cli_args=[],
-        codex_cli_input_mode="stdin",
+    config = replace(
+        base_config,
         codex_cli_resume_id="resume",
         codex_cli_approvals_mode=None,
-        codex_cli_skip_git_check=True,
-        codex_cli_use_pty=False,
-        codex_workdir=".",
         stream_flush_interval=1.0,
-        stream_include_stderr=False,
         progress_tick_interval=1.0,
         run_timeout_seconds=1.0,
         context_compaction_idle_timeout_seconds=1.0,
         no_output_idle_timeout_seconds=1.0,
         final_result_idle_timeout_seconds=1.0,
         jsonl_sync_interval_seconds=1.0,
-        jsonl_stream_events=False,
         jsonl_reasoning_throttle_seconds=1.0,
-        jsonl_reasoning_mode="hidden",
-        message_chunk_limit=1000,
     )
 
     orchestrator = CacheOrchestrator()
@@ -156,8 +148,8 @@ async def test_jsonl_messages_cached_until_run_finishes() -> None:
 
 
 @pytest.mark.asyncio
-async def test_jsonl_progress_sent_while_running() -> None:
-    class ProgressOrchestrator:
+async def test_jsonl_progress_sent_while_running(base_config) -> None:
+    class ProgressOrchestrator(BatchPollMixin):
         def __init__(self) -> None:
             self.running_calls = 0
 
@@ -173,32 +165,21 @@ async def test_jsonl_progress_sent_while_running() -> None:
                 ]
             return []
 
-        def get_last_chat_id(self, user_id: int):
+        async def get_last_chat_id(self, user_id: int):
             return 123
 
-    config = Config(
-        telegram_bot_token="token",
-        telegram_allowed_user_ids={1},
-        codex_cli_cmd="codex",
-        codex_cli_args=[],
-        codex_cli_input_mode="stdin",
+    config = replace(
+        base_config,
         codex_cli_resume_id="resume",
         codex_cli_approvals_mode=None,
-        codex_cli_skip_git_check=True,
-        codex_cli_use_pty=False,
-        codex_workdir=".",
         stream_flush_interval=1.0,
-        stream_include_stderr=False,
         progress_tick_interval=1.0,
         run_timeout_seconds=1.0,
         context_compaction_idle_timeout_seconds=1.0,
         no_output_idle_timeout_seconds=1.0,
         final_result_idle_timeout_seconds=1.0,
         jsonl_sync_interval_seconds=1.0,
-        jsonl_stream_events=False,
         jsonl_reasoning_throttle_seconds=1.0,
-        jsonl_reasoning_mode="hidden",
-        message_chunk_limit=1000,
     )
 
     orchestrator = ProgressOrchestrator()
@@ -214,8 +195,8 @@ async def test_jsonl_progress_sent_while_running() -> None:
 
 
 @pytest.mark.asyncio
-async def test_jsonl_progress_skipped_when_running_with_stream_events() -> None:
-    class ProgressOrchestrator:
+async def test_jsonl_progress_skipped_when_running_with_stream_events(base_config) -> None:
+    class ProgressOrchestrator(BatchPollMixin):
         def __init__(self) -> None:
             self.running_calls = 0
 
@@ -231,22 +212,14 @@ async def test_jsonl_progress_skipped_when_running_with_stream_events() -> None:
                 ]
             return []
 
-        def get_last_chat_id(self, user_id: int):
+        async def get_last_chat_id(self, user_id: int):
             return 123
 
-    config = Config(
-        telegram_bot_token="token",
-        telegram_allowed_user_ids={1},
-        codex_cli_cmd="codex",
-        codex_cli_args=[],
-        codex_cli_input_mode="stdin",
+    config = replace(
+        base_config,
         codex_cli_resume_id="resume",
         codex_cli_approvals_mode=None,
-        codex_cli_skip_git_check=True,
-        codex_cli_use_pty=False,
-        codex_workdir=".",
         stream_flush_interval=1.0,
-        stream_include_stderr=False,
         progress_tick_interval=1.0,
         run_timeout_seconds=1.0,
         context_compaction_idle_timeout_seconds=1.0,
@@ -255,8 +228,6 @@ async def test_jsonl_progress_skipped_when_running_with_stream_events() -> None:
         jsonl_sync_interval_seconds=1.0,
         jsonl_stream_events=True,
         jsonl_reasoning_throttle_seconds=1.0,
-        jsonl_reasoning_mode="hidden",
-        message_chunk_limit=1000,
     )
 
     orchestrator = ProgressOrchestrator()
@@ -272,8 +243,8 @@ async def test_jsonl_progress_skipped_when_running_with_stream_events() -> None:
 
 
 @pytest.mark.asyncio
-async def test_jsonl_progress_suppressed_when_not_running() -> None:
-    class ExternalOrchestrator:
+async def test_jsonl_progress_suppressed_when_not_running(base_config) -> None:
+    class ExternalOrchestrator(BatchPollMixin):
         async def is_running(self, user_id: int) -> bool:
             return False
 
@@ -283,32 +254,21 @@ async def test_jsonl_progress_suppressed_when_not_running() -> None:
                 ExternalMessage("final result"),
             ]
 
-        def get_last_chat_id(self, user_id: int):
+        async def get_last_chat_id(self, user_id: int):
             return 123
 
-    config = Config(
-        telegram_bot_token="token",
-        telegram_allowed_user_ids={1},
-        codex_cli_cmd="codex",
-        codex_cli_args=[],
-        codex_cli_input_mode="stdin",
+    config = replace(
+        base_config,
         codex_cli_resume_id="resume",
         codex_cli_approvals_mode=None,
-        codex_cli_skip_git_check=True,
-        codex_cli_use_pty=False,
-        codex_workdir=".",
         stream_flush_interval=1.0,
-        stream_include_stderr=False,
         progress_tick_interval=1.0,
         run_timeout_seconds=1.0,
         context_compaction_idle_timeout_seconds=1.0,
         no_output_idle_timeout_seconds=1.0,
         final_result_idle_timeout_seconds=1.0,
         jsonl_sync_interval_seconds=1.0,
-        jsonl_stream_events=False,
         jsonl_reasoning_throttle_seconds=1.0,
-        jsonl_reasoning_mode="hidden",
-        message_chunk_limit=1000,
     )
 
     orchestrator = ExternalOrchestrator()
@@ -318,3 +278,211 @@ async def test_jsonl_progress_suppressed_when_not_running() -> None:
 
     await adapter._sync_jsonl_tick(context)
     assert bot.sent == [(123, "final result")]
+
+
+def test_stream_digest_matches_full_buffer_hash(base_config) -> None:
+    config = replace(
+        base_config,
+        codex_cli_resume_id="resume",
+        codex_cli_approvals_mode=None,
+        stream_flush_interval=1.0,
+        progress_tick_interval=1.0,
+        run_timeout_seconds=1.0,
+        context_compaction_idle_timeout_seconds=1.0,
+        no_output_idle_timeout_seconds=1.0,
+        final_result_idle_timeout_seconds=1.0,
+        jsonl_sync_interval_seconds=1.0,
+        jsonl_reasoning_throttle_seconds=1.0,
+    )
+    adapter = telegram_adapter.TelegramAdapter(config, DummyOrchestrator())
+    chunks = ["\nfirst  \r\nline\n\n", "   ", "second\t", "third\n\n"]
+    ctx = adapter._reset_dedupe(1)
+    for chunk in chunks:
+        adapter._append_stream_buffer(ctx, chunk)
+    adapter._record_stream_digest(ctx, 0.0)
+
+    assert adapter._hash_text("\n".join(chunks)) in ctx.dedupe_hashes
+    assert not adapter._should_send(ctx, "\n".join(chunks), 0.0)
+
+
+def test_dedupe_evicts_oldest_digest_when_full(base_config) -> None:
+    config = replace(
+        base_config,
+        codex_cli_resume_id="resume",
+        codex_cli_approvals_mode=None,
+        stream_flush_interval=1.0,
+        progress_tick_interval=1.0,
+        run_timeout_seconds=1.0,
+        context_compaction_idle_timeout_seconds=1.0,
+        no_output_idle_timeout_seconds=1.0,
+        final_result_idle_timeout_seconds=1.0,
+        jsonl_sync_interval_seconds=1.0,
+        jsonl_reasoning_throttle_seconds=1.0,
+    )
+    adapter = telegram_adapter.TelegramAdapter(config, DummyOrchestrator())
+    ctx = adapter._reset_dedupe(1)
+    for idx in range(telegram_adapter._DEDUP_MAX_ENTRIES + 1):
+        assert adapter._should_send(ctx, f"message {idx}", 0.0)
+
+    assert len(ctx.dedupe_hashes) == telegram_adapter._DEDUP_MAX_ENTRIES
+    assert not adapter._should_send(ctx, "message 1", 0.0)
+    assert adapter._should_send(ctx, "message 0", 0.0)
+
+
+@pytest.mark.asyncio
+async def test_jsonl_progress_edits_shared_message_across_ticks(base_config) -> None:
+    class RunningOrchestrator(BatchPollMixin):
+        def __init__(self) -> None:
+            self.poll_calls = 0
+
+        async def is_running(self, user_id: int) -> bool:
+            return True
+
+        async def poll_external_results(self, user_id: int, allow_send: bool):
+            self.poll_calls += 1
+            return [ExternalMessage(f"progress {self.poll_calls}", is_progress=True)]
+
+        async def get_last_chat_id(self, user_id: int):
+            return 123
+
+    config = replace(
+        base_config,
+        codex_cli_resume_id="resume",
+        codex_cli_approvals_mode=None,
+        stream_flush_interval=1.0,
+        progress_tick_interval=1.0,
+        run_timeout_seconds=1.0,
+        context_compaction_idle_timeout_seconds=1.0,
+        no_output_idle_timeout_seconds=1.0,
+        final_result_idle_timeout_seconds=1.0,
+        jsonl_sync_interval_seconds=1.0,
+        jsonl_reasoning_throttle_seconds=1.0,
+    )
+
+    adapter = telegram_adapter.TelegramAdapter(config, RunningOrchestrator())
+    bot = DummyBot()
+    context = DummyContext(bot)
+
+    await adapter._sync_jsonl_tick(context)
+    await adapter._sync_jsonl_tick(context)
+
+    assert bot.sent == [(123, "progress 1")]
+    assert bot.edited == [(123, 101, "progress 1\nprogress 2")]
+
+
+@pytest.mark.asyncio
+async def test_queued_prompt_does_not_reset_running_stream(base_config) -> None:
+    class QueueOrchestrator:
+        def __init__(self) -> None:
+            self.streams = []
+
+        async def submit_prompt(self, user_id, prompt, send_status, send_stream) -> None:
+            self.streams.append(send_stream)
+
+    orchestrator = QueueOrchestrator()
+    adapter = telegram_adapter.TelegramAdapter(base_config, orchestrator)
+    bot = DummyBot()
+    context = DummyContext(bot)
+    update = SimpleNamespace(
+        effective_user=SimpleNamespace(id=1), effective_chat=SimpleNamespace(id=123)
+    )
+
+    await adapter._submit_prompt(update, context, "first")
+    first_stream = orchestrator.streams[0]
+    await first_stream("a", True)
+    await adapter._submit_prompt(update, context, "second")
+    await first_stream("b", True)
+    assert bot.sent == [(123, "a")]
+    assert bot.edited == [(123, 101, "a\nb")]
+
+    second_stream = orchestrator.streams[1]
+    await second_stream("c", True)
+    assert bot.sent == [(123, "a"), (123, "c")]
+    assert bot.edited == [(123, 101, "a\nb")]
+
+
+@pytest.mark.asyncio
+async def test_jsonl_progress_uses_its_own_message(base_config) -> None:
+    class RunningOrchestrator(BatchPollMixin):
+        def __init__(self) -> None:
+            self.streams = []
+
+        async def submit_prompt(self, user_id, prompt, send_status, send_stream) -> None:
+            self.streams.append(send_stream)
+
+        async def is_running(self, user_id: int) -> bool:
+            return True
+
+        async def poll_external_results(self, user_id: int, allow_send: bool):
+            return [ExternalMessage("thinking", is_progress=True)]
+
+        async def get_last_chat_id(self, user_id: int):
+            return 123
+
+    orchestrator = RunningOrchestrator()
+    adapter = telegram_adapter.TelegramAdapter(base_config, orchestrator)
+    bot = DummyBot()
+    context = DummyContext(bot)
+    update = SimpleNamespace(
+        effective_user=SimpleNamespace(id=1), effective_chat=SimpleNamespace(id=123)
+    )
+
+    await adapter._submit_prompt(update, context, "first")
+    await orchestrator.streams[0]("output", True)
+    await adapter._sync_jsonl_tick(context)
+    await orchestrator.streams[0]("more", True)
+
+    assert bot.sent == [(123, "output"), (123, "thinking")]
+    assert bot.edited == [(123, 101, "output\nmore")]
+
+
+@pytest.mark.asyncio
+async def test_jsonl_final_messages_batched_into_one_send(base_config) -> None:
+    class ExternalOrchestrator(BatchPollMixin):
+        async def is_running(self, user_id: int) -> bool:
+            return False
+
+        async def poll_external_results(self, user_id: int, allow_send: bool):
+            return [ExternalMessage("one"), ExternalMessage("two"), ExternalMessage("one")]
+
+        async def get_last_chat_id(self, user_id: int):
+            return 123
+
+    config = replace(
+        base_config,
+        codex_cli_resume_id="resume",
+        codex_cli_approvals_mode=None,
+        stream_flush_interval=1.0,
+        progress_tick_interval=1.0,
+        run_timeout_seconds=1.0,
+        context_compaction_idle_timeout_seconds=1.0,
+        no_output_idle_timeout_seconds=1.0,
+        final_result_idle_timeout_seconds=1.0,
+        jsonl_sync_interval_seconds=1.0,
+        jsonl_reasoning_throttle_seconds=1.0,
+    )
+
+    adapter = telegram_adapter.TelegramAdapter(config, ExternalOrchestrator())
+    bot = DummyBot()
+
+    await adapter._sync_jsonl_tick(DummyContext(bot))
+
+    assert bot.sent == [(123, "one\ntwo")]
+    assert bot.edited == []
+
+
+def test_new_event_loop_prefers_uvloop_when_available(monkeypatch) -> None:
+    class FakeUvloop:
+        @staticmethod
+        def new_event_loop():
+            return "uvloop-loop"
+
+    monkeypatch.setattr(telegram_adapter, "uvloop", FakeUvloop)
+    assert telegram_adapter.new_event_loop() == "uvloop-loop"
+
+    monkeypatch.setattr(telegram_adapter, "uvloop", None)
+    loop = telegram_adapter.new_event_loop()
+    try:
+        assert isinstance(loop, asyncio.AbstractEventLoop)
+    finally:
+        loop.close()
@@ -1,3 +1,5 @@
+import asyncio
+
 import pytest
 
 from src.adapters.telegram_adapter import TelegramStreamSender
@@ -10,7 +12,8 @@ class FakeBot:
         self._next_id = 1
 
     async def send_message(self, chat_id: int, text: str):
-        self.sent.append((chat_id, text))
+        # 所有用例都只发往同一个 chat，只记正文即可
+        self.sent.append(text)
         message = type("Msg", (), {"message_id": self._next_id})
         self._next_id += 1
         return message
@@ -26,7 +29,7 @@ async def test_stream_sender_splits_long_text():
 
     await sender.send("abcdefghij", final=False)
 
-    assert [text for _, text in bot.sent] == ["abcd", "efgh", "ij"]
+    assert bot.sent == ["abcd", "efgh", "ij"]
     assert bot.edits == []
 
 
@@ -39,6 +42,34 @@ async def test_stream_sender_appends_then_rolls_over():
     await sender.send("hi", final=False)
     await sender.send("world", final=False)
 
-    assert bot.sent[0][1] == "hello"
-    assert bot.sent[1][1] == "world"
+    assert bot.sent[0] == "hello"
+    assert bot.sent[1] == "world"
     assert bot.edits[-1][2] == "hello\nhi"
+
+
+@pytest.mark.asyncio
+async def test_stream_sender_coalesces_edits_until_final():
+    bot = FakeBot()
+    sender = TelegramStreamSender(bot, chat_id=1, chunk_limit=100, edit_interval=60.0)
+
+    await sender.send("a", final=False)
+    await sender.send("b", final=False)
+    await sender.send("c", final=False)
+    assert bot.edits == []
+
+    await sender.send("d", final=True)
+    assert bot.sent == ["a"]
+    assert bot.edits == [(1, 1, "a\nb\nc\nd")]
+
+
+@pytest.mark.asyncio
+async def test_stream_sender_flushes_pending_edit_after_interval():
+    bot = FakeBot()
+    sender = TelegramStreamSender(bot, chat_id=1, chunk_limit=100, edit_interval=0.05)
+
+    await sender.send("a", final=False)
+    await sender.send("b", final=False)
+    assert bot.edits == []
+
+    await asyncio.sleep(0.1)
+    assert bot.edits == [(1, 1, "a\nb")]